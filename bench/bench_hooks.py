@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""bench/bench_hooks.py — hooks の処理のベンチマーク（結果は JSON で出力）
+
+transcript_gen で生成した 1MB / 10MB / 100MB の transcript に対する get_assistant_messages
+（両方の境界モード × 逆走査 / インデックス初回構築 / インデックス差分読み込み）と、
+convert_tables_in_text・split_message・MultipartBody・resolve_channel（大きな config）を計測する。
+
+    python3 bench/bench_hooks.py [--sizes 1MB,10MB,100MB] [--repeat 5] [--filter transcript]
+                                 [--output results.json] [--baseline previous.json] [--workdir DIR]
+
+結果はベンチマークごとの実行時間（min / median / p95 / max、ミリ秒）。--baseline に以前の結果を渡すと
+median の比を stderr に表示する（リリース間の性能の退行の確認用）。
+--workdir を指定すると生成した transcript を残し、次回以降は再利用する。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+from lib import config as config_lib  # noqa: E402
+from lib import transcript  # noqa: E402
+from lib.chunk import split_message  # noqa: E402
+from lib.multipart import MultipartBody  # noqa: E402
+from lib.table import convert_tables_in_text  # noqa: E402
+from transcript_gen import TranscriptBuilder, generate, parse_size  # noqa: E402
+
+DEFAULT_SIZES = "1MB,10MB,100MB"
+DEFAULT_REPEAT = 5
+CONFIG_PROJECTS = (10, 1_000, 10_000)
+_MODES = {"user": False, "tool_result": True}
+
+
+class Result:
+    def __init__(self, name: str, params: dict, times_ms: list[float]) -> None:
+        self.name = name
+        self.params = params
+        self.times_ms = times_ms
+
+    def to_json(self) -> dict:
+        ordered = sorted(self.times_ms)
+        return {
+            "name": self.name,
+            "params": self.params,
+            "runs": len(ordered),
+            "min_ms": round(ordered[0], 3),
+            "median_ms": round(statistics.median(ordered), 3),
+            "p95_ms": round(ordered[max(math.ceil(0.95 * len(ordered)), 1) - 1], 3),
+            "max_ms": round(ordered[-1], 3),
+        }
+
+
+class Runner:
+    def __init__(self, repeat: int, name_filter: str | None) -> None:
+        self.repeat = repeat
+        self.name_filter = name_filter
+        self.results: list[Result] = []
+
+    def wants(self, name: str) -> bool:
+        return not self.name_filter or self.name_filter in name
+
+    def bench(
+        self,
+        name: str,
+        fn: Callable[[], object],
+        setup: Callable[[], object] | None = None,
+        **params: object,
+    ) -> None:
+        """setup（計測対象外）→ fn を repeat 回実行し、fn の実行時間を記録する。"""
+        if not self.wants(name):
+            return
+        times: list[float] = []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - start) * 1000)
+        self.results.append(Result(name, params, times))
+        print(f"[bench] {name} {json.dumps(params)} median={statistics.median(times):.3f}ms", file=sys.stderr)
+
+
+# --- transcript ---
+
+def _transcript_path(workdir: str, size: int) -> str:
+    path = os.path.join(workdir, f"transcript-{size}.jsonl")
+    if not os.path.exists(path):
+        generate(path, size)
+    return path
+
+
+def _remove(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def bench_transcript(runner: Runner, workdir: str, sizes: list[int]) -> None:
+    transcript.INDEX_PATH_TEMPLATE = os.path.join(workdir, "index-{session_id}.json")
+    for size in sizes:
+        if not runner.wants("transcript."):
+            return
+        path = _transcript_path(workdir, size)
+        actual = os.path.getsize(path)
+        # 追記するベンチマークは、生成した transcript を再利用できるようコピーに対して実行する
+        appended = os.path.join(workdir, f"appended-{size}.jsonl")
+        shutil.copyfile(path, appended)
+        session = TranscriptBuilder(seed=size)
+
+        def append_entry() -> None:
+            with open(appended, "a", encoding="utf-8") as f:
+                f.write(json.dumps(session.assistant_text(), ensure_ascii=False) + "\n")
+
+        for mode, as_boundary in _MODES.items():
+            runner.bench(
+                "transcript.scan",
+                lambda: transcript.get_assistant_messages(path, tool_result_as_boundary=as_boundary),
+                size=actual, mode=mode,
+            )
+            index_sid = f"bench-{size}-{mode}"
+            index_path = transcript.INDEX_PATH_TEMPLATE.format(session_id=index_sid)
+            runner.bench(
+                "transcript.index_cold",
+                lambda: transcript.get_assistant_messages(
+                    appended, tool_result_as_boundary=as_boundary, session_id=index_sid),
+                setup=lambda: _remove(index_path),
+                size=actual, mode=mode,
+            )
+            runner.bench(
+                "transcript.index_append",
+                lambda: transcript.get_assistant_messages(
+                    appended, tool_result_as_boundary=as_boundary, session_id=index_sid),
+                setup=append_entry,
+                size=actual, mode=mode,
+            )
+            _remove(index_path)
+        _remove(appended)
+
+
+# --- テキスト整形・送信ボディ ---
+
+def _tables_text(tables: int, rows: int) -> str:
+    session = TranscriptBuilder(seed=tables * 1000 + rows)
+    return "\n\n".join(f"{session.paragraph(2)}\n\n{session.table(rows)}" for _ in range(tables))
+
+
+def _long_text(size: int) -> str:
+    session = TranscriptBuilder(seed=size)
+    parts: list[str] = []
+    total = 0
+    while total < size:
+        part = session.paragraph(3) if len(parts) % 3 else session.code_block(40)
+        parts.append(part)
+        total += len(part) + 2
+    return "\n\n".join(parts)
+
+
+def bench_format(runner: Runner, workdir: str) -> None:
+    for tables, rows in ((1, 10), (10, 20), (1, 1_000)):
+        text = _tables_text(tables, rows)
+        runner.bench(
+            "table.convert_tables_in_text", lambda: convert_tables_in_text(text),
+            tables=tables, rows=rows, chars=len(text),
+        )
+    for size in (10_000, 100_000, 1_000_000):
+        text = _long_text(size)
+        runner.bench("chunk.split_message", lambda: split_message(text), chars=len(text))
+
+    for size in (1024 ** 2, 10 * 1024 ** 2):
+        if not runner.wants("multipart."):
+            break
+        attachment = os.path.join(workdir, f"attachment-{size}.md")
+        with open(attachment, "wb") as f:
+            f.write(os.urandom(size))
+
+        def build_and_stream() -> int:
+            body = MultipartBody("bench-boundary", "本文", [("response.md", attachment)])
+            return sum(len(block) for block in body)
+
+        runner.bench("multipart.build_and_stream", build_and_stream, size=size)
+        _remove(attachment)
+
+
+# --- resolve_channel ---
+
+def make_config(projects: int, servers: int = 10) -> dict:
+    """servers 個のサーバーに projects 個のプロジェクトを振り分けた config を作る。"""
+    per_server = max(projects // servers, 1)
+    return {
+        "servers": [
+            {
+                "name": f"server-{s}",
+                "discord": {"botToken": f"token-{s}", "ownerUserId": "1"},
+                "permissionTools": ["Bash"],
+                "projects": [
+                    {
+                        "name": f"project-{s}-{p}",
+                        "channelId": f"{s:04d}{p:06d}",
+                        "projectPath": f"/home/user/work/team-{s}/group-{p % 50}/project-{p}",
+                    }
+                    for p in range(per_server)
+                ],
+            }
+            for s in range(servers)
+        ],
+    }
+
+
+def bench_resolve(runner: Runner) -> None:
+    for projects in CONFIG_PROJECTS:
+        config = make_config(projects)
+        servers = config["servers"]
+        last = servers[-1]["projects"][-1]["projectPath"]
+        cwd = f"{last}/src/lib/deeply/nested/dir"
+
+        def linear() -> None:
+            config_lib.resolve_channel(config, cwd)
+
+        def cached() -> None:
+            config_lib.resolve_channel(config, cwd)
+
+        config_lib._compiled = None
+        runner.bench("config.resolve_channel.linear", linear, projects=projects)
+        runner.bench("config.resolve_channel.build", lambda: config_lib._build_trie(config), projects=projects)
+        trie = config_lib._build_trie(config)
+        config_lib._compiled = (config, trie)
+        runner.bench("config.resolve_channel.cached", cached, projects=projects)
+        config_lib._compiled = None
+
+
+# --- 実行・出力 ---
+
+def _git_revision() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_benchmarks(sizes: list[int], repeat: int, workdir: str, name_filter: str | None = None) -> dict:
+    runner = Runner(repeat, name_filter)
+    bench_transcript(runner, workdir, sizes)
+    bench_format(runner, workdir)
+    bench_resolve(runner)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+        },
+        "results": [r.to_json() for r in runner.results],
+    }
+
+
+def _result_key(result: dict) -> str:
+    return f"{result['name']} {json.dumps(result['params'], sort_keys=True)}"
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    """baseline と current で共通のベンチマークの median の比（current / baseline）を返す。"""
+    before = {_result_key(r): r for r in baseline.get("results", [])}
+    lines: list[str] = []
+    for result in current["results"]:
+        old = before.get(_result_key(result))
+        if old is None or not old["median_ms"]:
+            continue
+        ratio = result["median_ms"] / old["median_ms"]
+        lines.append(
+            f"{_result_key(result)}: {old['median_ms']:.3f}ms -> {result['median_ms']:.3f}ms (x{ratio:.2f})"
+        )
+    return lines
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark discord-bridge hook internals")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"transcript sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs per benchmark")
+    parser.add_argument("--filter", help="only benchmarks whose name contains this string")
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--baseline", help="previous JSON results to compare against")
+    parser.add_argument("--workdir", help="keep generated transcripts here and reuse them")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="discord-bridge-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        results = run_benchmarks(sizes, max(args.repeat, 1), workdir, args.filter)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            for line in compare(json.load(f), results):
+                print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""bench/fake_discord.py — 負荷試験用のローカル Discord REST サーバー
+
+hooks が使う Discord API（メッセージの送信・編集）を模したサーバー。DISCORD_BRIDGE_API_BASE に
+このサーバーの URL を設定すると、Discord に接続せずに hooks の処理量やテールレイテンシを計測できる。
+
+- POST  /api/v10/channels/{id}/messages  — JSON（content / components）と multipart（payload_json + files[n]）
+- PATCH /api/v10/channels/{id}/messages/{message_id}
+- チャンネル・ルートごとの固定ウィンドウのレート制限と X-RateLimit-* ヘッダー（超過時は 429）
+- 確率的な 429 の注入（X-RateLimit-Scope: shared）、アーカイブ済みスレッドの 404、応答の遅延
+- content の文字数上限・ボタン（components）の構造を検証し、不正なら 400（code 50035）
+- 受信したリクエストをすべて記録する（--record で JSONL にも追記。GET /_fake/requests・/_fake/stats で取得、
+  POST /_fake/reset で消去）
+
+    python3 bench/fake_discord.py [--port 8787] [--latency-ms 50] [--jitter-ms 20] [--inject-429 0.02]
+                                  [--archived 123,456] [--record requests.jsonl]
+    export DISCORD_BRIDGE_API_BASE=http://127.0.0.1:8787/api/v10
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = "/api/v10"
+MAX_CONTENT = 2000
+MAX_ROWS = 5
+MAX_BUTTONS_PER_ROW = 5
+MAX_CUSTOM_ID = 100
+MAX_LABEL = 80
+_MESSAGES_RE = re.compile(r"^/channels/(\d+)/messages(?:/(\d+))?$")
+# ルートごとのバケットハッシュ（Discord と同様に不透明な文字列）
+_BUCKETS = {"POST": "fake-create-message", "PATCH": "fake-edit-message"}
+
+
+class RateLimiter:
+    """(ルート, チャンネル) ごとの固定ウィンドウのレート制限。"""
+
+    def __init__(self, limit: int, window: float) -> None:
+        self.limit = limit
+        self.window = window
+        self._windows: dict[tuple[str, str], tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def hit(self, bucket: str, channel_id: str, now: float) -> tuple[bool, int, float]:
+        """1リクエスト分を消費し (許可されたか, 残数, リセットまでの秒数) を返す。"""
+        with self._lock:
+            started, used = self._windows.get((bucket, channel_id), (now, 0))
+            if now - started >= self.window:
+                started, used = now, 0
+            allowed = used < self.limit
+            if allowed:
+                used += 1
+            self._windows[(bucket, channel_id)] = (started, used)
+            return allowed, self.limit - used, max(started + self.window - now, 0.0)
+
+
+def parse_multipart(body: bytes, content_type: str) -> tuple[dict, list[dict]]:
+    """multipart/form-data から (payload_json, [{"name", "filename", "size"}]) を取り出す。"""
+    m = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not m:
+        raise ValueError("missing boundary")
+    delimiter = b"--" + m.group(1).encode()
+    payload: dict = {}
+    files: list[dict] = []
+    for part in body.split(delimiter)[1:]:
+        if part.startswith(b"--"):
+            break
+        head, sep, data = part.partition(b"\r\n\r\n")
+        if not sep:
+            raise ValueError("malformed part")
+        data = data[:-2] if data.endswith(b"\r\n") else data
+        disposition = next(
+            (line for line in head.decode(errors="replace").split("\r\n")
+             if line.lower().startswith("content-disposition:")),
+            "",
+        )
+        name = re.search(r'name="([^"]*)"', disposition)
+        filename = re.search(r'filename="([^"]*)"', disposition)
+        if name and name.group(1) == "payload_json":
+            payload = json.loads(data)
+        elif filename:
+            files.append({"name": name.group(1) if name else "", "filename": filename.group(1), "size": len(data)})
+    return payload, files
+
+
+def validate_message(payload: dict) -> str | None:
+    """Discord が 400（Invalid Form Body）を返す内容ならその理由を返す。"""
+    content = payload.get("content", "")
+    if not isinstance(content, str):
+        return "content: must be a string"
+    if len(content) > MAX_CONTENT:
+        return f"content: must be {MAX_CONTENT} or fewer in length"
+    rows = payload.get("components")
+    if rows is None:
+        return None
+    if not isinstance(rows, list) or len(rows) > MAX_ROWS:
+        return f"components: must be a list of {MAX_ROWS} or fewer action rows"
+    for i, row in enumerate(rows):
+        buttons = row.get("components") if isinstance(row, dict) else None
+        if not isinstance(row, dict) or row.get("type") != 1 or not isinstance(buttons, list):
+            return f"components.{i}: must be an action row (type 1)"
+        if not 1 <= len(buttons) <= MAX_BUTTONS_PER_ROW:
+            return f"components.{i}.components: must have 1 to {MAX_BUTTONS_PER_ROW} buttons"
+        for j, button in enumerate(buttons):
+            where = f"components.{i}.components.{j}"
+            if not isinstance(button, dict) or button.get("type") != 2:
+                return f"{where}: must be a button (type 2)"
+            if not 1 <= len(str(button.get("custom_id", ""))) <= MAX_CUSTOM_ID:
+                return f"{where}.custom_id: must be 1 to {MAX_CUSTOM_ID} in length"
+            if len(str(button.get("label", ""))) > MAX_LABEL:
+                return f"{where}.label: must be {MAX_LABEL} or fewer in length"
+    return None
+
+
+class FakeDiscord(ThreadingHTTPServer):
+    """Discord REST のスタンドイン。start() でバックグラウンドスレッドで起動する。"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        *,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        inject_429: float = 0.0,
+        retry_after: float = 1.0,
+        rate_limit: int = 5,
+        rate_window: float = 5.0,
+        archived: set[str] | None = None,
+        record_path: str | None = None,
+        seed: int | None = None,
+    ) -> None:
+        super().__init__((host, port), _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.inject_429 = inject_429
+        self.retry_after = retry_after
+        self.limiter = RateLimiter(rate_limit, rate_window)
+        self.archived = set(archived or ())
+        self.record_path = record_path
+        self.requests: list[dict] = []
+        self.messages: dict[str, dict] = {}
+        self.connections = 0  # 受け付けた TCP 接続の数（keep-alive の再利用の確認用）
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_id = 1_300_000_000_000_000_000
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """DISCORD_BRIDGE_API_BASE に設定する URL。"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self) -> "FakeDiscord":
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def delay(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        return (self.latency_ms + jitter) / 1000
+
+    def roll_429(self) -> bool:
+        if not self.inject_429:
+            return False
+        with self._lock:
+            return self._rng.random() < self.inject_429
+
+    def next_id(self) -> str:
+        with self._lock:
+            self._next_id += 1
+            return str(self._next_id)
+
+    def record(self, entry: dict) -> None:
+        with self._lock:
+            self.requests.append(entry)
+            if self.record_path:
+                with open(self.record_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def process_request(self, request: object, client_address: object) -> None:
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests.clear()
+            self.messages.clear()
+            self.connections = 0
+
+    def stats(self) -> dict:
+        """ステータス・チャンネルごとの件数、受け付けた接続数と、受信バイト数の合計。"""
+        with self._lock:
+            requests = list(self.requests)
+            connections = self.connections
+        by_status: dict[str, int] = {}
+        by_channel: dict[str, int] = {}
+        for r in requests:
+            by_status[str(r["status"])] = by_status.get(str(r["status"]), 0) + 1
+            if r.get("channel_id") and r["status"] < 300:
+                by_channel[r["channel_id"]] = by_channel.get(r["channel_id"], 0) + 1
+        return {
+            "requests": len(requests),
+            "connections": connections,
+            "by_status": by_status,
+            "delivered_by_channel": by_channel,
+            "bytes_in": sum(r["bytes"] for r in requests),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeDiscord
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        pass
+
+    def _send_json(self, status: int, payload: object, headers: dict[str, str] | None = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", "0")))
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path == "/_fake/requests":
+            with self.server._lock:
+                self._send_json(200, list(self.server.requests))
+        elif self.path == "/_fake/stats":
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"message": "404: Not Found", "code": 0})
+
+    def do_POST(self) -> None:  # noqa: N802
+        if self.path == "/_fake/reset":
+            self._read_body()
+            self.server.reset()
+            self._send_json(200, {})
+            return
+        self._handle_message("POST")
+
+    def do_PATCH(self) -> None:  # noqa: N802
+        self._handle_message("PATCH")
+
+    def _handle_message(self, method: str) -> None:
+        started = time.monotonic()
+        body = self._read_body()
+        content_type = self.headers.get("Content-Type", "")
+        entry: dict = {
+            "ts": round(time.time(), 3),
+            "method": method,
+            "path": self.path,
+            "channel_id": None,
+            "content_type": content_type.split(";")[0],
+            "bytes": len(body),
+        }
+        status, payload, headers = self._route(method, body, content_type, entry)
+        time.sleep(self.server.delay())
+        self._send_json(status, payload, headers)
+        entry["status"] = status
+        entry["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        self.server.record(entry)
+
+    def _route(self, method: str, body: bytes, content_type: str, entry: dict) -> tuple[int, object, dict[str, str]]:
+        path = self.path[len(API_PREFIX):] if self.path.startswith(API_PREFIX) else None
+        m = _MESSAGES_RE.match(path or "")
+        if m is None or (method == "POST") == bool(m.group(2)):
+            return 404, {"message": "404: Not Found", "code": 0}, {}
+        channel_id, message_id = m.group(1), m.group(2)
+        entry["channel_id"] = channel_id
+        if not self.headers.get("Authorization", "").startswith("Bot "):
+            return 401, {"message": "401: Unauthorized", "code": 0}, {}
+        if channel_id in self.server.archived:
+            return 404, {"message": "Unknown Channel", "code": 10003}, {}
+
+        bucket = _BUCKETS[method]
+        allowed, remaining, reset_after = self.server.limiter.hit(bucket, channel_id, time.time())
+        headers = {
+            "X-RateLimit-Limit": str(self.server.limiter.limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": f"{time.time() + reset_after:.3f}",
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+            "X-RateLimit-Bucket": bucket,
+        }
+        if not allowed or self.server.roll_429():
+            retry_after = reset_after if not allowed else self.server.retry_after
+            headers.update({
+                "Retry-After": f"{retry_after:.3f}",
+                "X-RateLimit-Scope": "user" if not allowed else "shared",
+            })
+            entry["rate_limited"] = "bucket" if not allowed else "injected"
+            return 429, {"message": "You are being rate limited.", "retry_after": retry_after, "global": False}, headers
+
+        try:
+            if content_type.startswith("multipart/form-data"):
+                payload, files = parse_multipart(body, content_type)
+            else:
+                payload, files = json.loads(body or b"{}"), []
+        except ValueError as e:
+            return 400, {"message": f"400: Bad Request ({e})", "code": 50109}, headers
+        error = validate_message(payload)
+        if error is None and not payload.get("content") and not files and method == "POST":
+            error = "content: cannot send an empty message"
+        if error is not None:
+            entry["error"] = error
+            return 400, {"message": "Invalid Form Body", "code": 50035, "errors": error}, headers
+
+        entry["content_len"] = len(payload.get("content", ""))
+        entry["files"] = files
+        entry["buttons"] = [b.get("custom_id") for row in payload.get("components") or [] for b in row["components"]]
+        if method == "PATCH":
+            message = self.server.messages.get(message_id)
+            if message is None:
+                return 404, {"message": "Unknown Message", "code": 10008}, headers
+            message["content"] = payload.get("content", message["content"])
+            return 200, message, headers
+        message = {
+            "id": self.server.next_id(),
+            "channel_id": channel_id,
+            "content": payload.get("content", ""),
+            "components": payload.get("components") or [],
+            "attachments": [
+                {"id": self.server.next_id(), "filename": f["filename"], "size": f["size"]} for f in files
+            ],
+        }
+        self.server.messages[message["id"]] = message
+        return 200, message, headers
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Local Discord REST stand-in for hook load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="base response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra uniform random latency")
+    parser.add_argument("--inject-429", type=float, default=0.0, help="probability of an injected 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of injected 429s (seconds)")
+    parser.add_argument("--rate-limit", type=int, default=5, help="requests per window per channel and route")
+    parser.add_argument("--rate-window", type=float, default=5.0, help="rate limit window (seconds)")
+    parser.add_argument("--archived", default="", help="comma-separated channel/thread IDs that return 404")
+    parser.add_argument("--record", help="append every request to this JSONL file")
+    args = parser.parse_args(argv)
+
+    server = FakeDiscord(
+        args.host, args.port,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        inject_429=args.inject_429, retry_after=args.retry_after,
+        rate_limit=args.rate_limit, rate_window=args.rate_window,
+        archived={c for c in args.archived.split(",") if c},
+        record_path=args.record,
+    )
+    print(f"[fake_discord] Listening on {server.url}", file=sys.stderr)
+    print(f"[fake_discord] export DISCORD_BRIDGE_API_BASE={server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[fake_discord] {json.dumps(server.stats())}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
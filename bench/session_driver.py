@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""bench/session_driver.py — Claude Code セッションを模擬して hooks を並行実行する負荷試験ドライバー
+
+セッションごとに transcript へエントリを追記しながら、実際の hook スクリプト
+（pre_tool_use.py / pre_tool_progress.py（非同期）/ notify.py / stop.py）に Claude Code と同じ形式の
+入力を渡して起動する。N セッションを並行に実行し、hook ごとのレイテンシ（起動から終了まで）と、
+ローカルの Discord スタンドイン（fake_discord）に届いたメッセージの件数を JSON で出力する。
+
+    python3 bench/session_driver.py --sessions 30 --tool-calls 200 [--layout threads|channels]
+        [--think-ms 300] [--tool-ms 200] [--ask-every 50] [--notify-every 40]
+        [--delivery sync|spool|detached] [--daemon] [--combined-pre-tool] [--latency-ms 80] [--inject-429 0.01]
+        [--archive-threads 2] [--output report.json]
+
+- hooks は一時ディレクトリを HOME にして起動する（~/.discord-bridge/config.json を生成し、実際の設定には触れない）
+- --layout threads: 1つのプロジェクトチャンネルに N 個のスレッドペイン（DISCORD_BRIDGE_THREAD_ID）
+  --layout channels: セッションごとに別のプロジェクト・チャンネル
+- hooks は DISCORD_BRIDGE_TRACE=1 で実行し、区間ごとの集計（trace_stats）もレポートに含める
+- --combined-pre-tool: PreToolUse を2つの hook の代わりに統合版の pre_tool.py で処理する
+- permissionTools の応答待ちは Bot の操作が必要なため対象外（permissionTools は空にする）
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent
+HOOKS_DIR = BENCH_DIR.parent / "hooks"
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(HOOKS_DIR))
+from fake_discord import FakeDiscord  # noqa: E402
+from trace_stats import Samples, summarize, to_json  # noqa: E402
+from transcript_gen import TranscriptBuilder  # noqa: E402
+
+BOT_TOKEN = "fake-bot-token"
+CHANNEL_BASE = 1_100_000_000_000_000_000
+THREAD_BASE = 1_200_000_000_000_000_000
+HOOK_TIMEOUT = 120.0  # 秒
+DAEMON_START_TIMEOUT = 10.0  # 秒
+
+
+class HookCall:
+    __slots__ = ("hook", "session", "elapsed_ms", "exit_code")
+
+    def __init__(self, hook: str, session: int, elapsed_ms: float, exit_code: int) -> None:
+        self.hook = hook
+        self.session = session
+        self.elapsed_ms = elapsed_ms
+        self.exit_code = exit_code
+
+
+class SimSession:
+    """1つの Claude Code セッション（transcript ファイルと hook の環境変数）。"""
+
+    def __init__(self, index: int, workdir: Path, cwd: str, env: dict[str, str], seed: int) -> None:
+        self.index = index
+        self.session_id = str(uuid.UUID(int=random.Random(seed).getrandbits(128)))
+        self.cwd = cwd
+        self.env = env
+        self.transcript_path = str(workdir / f"transcript-{index}.jsonl")
+        self.builder = TranscriptBuilder(seed)
+        self.rng = random.Random(seed + 1)
+        self.stop_marker = f"[done {self.session_id}]"
+
+    def append(self, entry: dict) -> None:
+        with open(self.transcript_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def hook_input(self, event: str, **fields: object) -> dict:
+        return {
+            "session_id": self.session_id,
+            "transcript_path": self.transcript_path,
+            "cwd": self.cwd,
+            "hook_event_name": event,
+            **fields,
+        }
+
+
+class Driver:
+    def __init__(self, args: argparse.Namespace, workdir: Path, server: FakeDiscord) -> None:
+        self.args = args
+        self.workdir = workdir
+        self.server = server
+        self.calls: list[HookCall] = []
+        self._lock = threading.Lock()
+        self._async_threads: list[threading.Thread] = []
+        self.trace_path = workdir / "trace.jsonl"
+        self.home = workdir / "home"
+        self.daemon: subprocess.Popen | None = None
+        self.sessions = self._make_sessions()
+
+    # --- セットアップ ---
+
+    def _project_path(self, index: int) -> str:
+        return str(self.workdir / "projects" / f"project-{index}")
+
+    def _channel_id(self, index: int) -> str:
+        return str(CHANNEL_BASE + index)
+
+    def write_config(self) -> None:
+        projects = 1 if self.args.layout == "threads" else self.args.sessions
+        server: dict = {
+            "name": "bench",
+            "discord": {"botToken": BOT_TOKEN, "ownerUserId": "1"},
+            "permissionTools": [],
+            "delivery": self.args.delivery,
+            "projects": [
+                {"name": f"project-{i}", "channelId": self._channel_id(i), "projectPath": self._project_path(i)}
+                for i in range(projects)
+            ],
+        }
+        config_dir = self.home / ".discord-bridge"
+        config_dir.mkdir(parents=True, exist_ok=True)
+        (config_dir / "config.json").write_text(json.dumps({"servers": [server]}, indent=2))
+        for i in range(projects):
+            os.makedirs(self._project_path(i), exist_ok=True)
+
+    def base_env(self) -> dict[str, str]:
+        env = {k: v for k, v in os.environ.items() if not k.startswith("DISCORD_BRIDGE_")}
+        env.update({
+            "HOME": str(self.home),
+            "DISCORD_BRIDGE_API_BASE": self.server.url,
+            "DISCORD_BRIDGE_TRACE": "1",
+            "DISCORD_BRIDGE_TRACE_FILE": str(self.trace_path),
+            "DISCORD_BRIDGE_HOOK_SOCKET": str(self.workdir / "hooks.sock"),
+        })
+        if not self.args.daemon:
+            env["DISCORD_BRIDGE_NO_DAEMON"] = "1"
+        return env
+
+    def thread_id(self, index: int) -> str:
+        return str(THREAD_BASE + index)
+
+    def _make_sessions(self) -> list[SimSession]:
+        sessions = []
+        base = self.base_env()
+        for i in range(self.args.sessions):
+            env = dict(base)
+            if self.args.layout == "threads":
+                env["DISCORD_BRIDGE_THREAD_ID"] = self.thread_id(i)
+                cwd = self._project_path(0)
+            else:
+                cwd = self._project_path(i)
+            sessions.append(SimSession(i, self.workdir, cwd, env, seed=self.args.seed * 10_000 + i))
+        return sessions
+
+    def start_daemon(self) -> None:
+        sock = self.workdir / "hooks.sock"
+        self.daemon = subprocess.Popen(
+            [sys.executable, str(HOOKS_DIR / "hook_daemon.py"), "--socket", str(sock)],
+            env=self.base_env(), stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + DAEMON_START_TIMEOUT
+        while not sock.exists():
+            if time.monotonic() > deadline or self.daemon.poll() is not None:
+                raise RuntimeError("hook daemon did not start")
+            time.sleep(0.05)
+
+    def stop_daemon(self) -> None:
+        if self.daemon is not None:
+            self.daemon.terminate()
+            self.daemon.wait(10)
+
+    # --- hook の起動 ---
+
+    def run_hook(self, session: SimSession, hook: str, payload: dict) -> HookCall:
+        started = time.monotonic()
+        try:
+            proc = subprocess.run(
+                [sys.executable, str(HOOKS_DIR / f"{hook}.py")],
+                input=json.dumps(payload).encode(), env=session.env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=HOOK_TIMEOUT,
+            )
+            exit_code = proc.returncode
+        except subprocess.TimeoutExpired:
+            exit_code = -1
+        call = HookCall(hook, session.index, (time.monotonic() - started) * 1000, exit_code)
+        with self._lock:
+            self.calls.append(call)
+        return call
+
+    def run_hook_async(self, session: SimSession, hook: str, payload: dict) -> None:
+        """async: true の hook と同様に、終了を待たずに次の処理へ進む。"""
+        thread = threading.Thread(target=self.run_hook, args=(session, hook, payload), daemon=True)
+        thread.start()
+        with self._lock:
+            self._async_threads.append(thread)
+
+    def _sleep(self, session: SimSession, mean_ms: float) -> None:
+        if mean_ms > 0:
+            time.sleep(session.rng.uniform(0.5, 1.5) * mean_ms / 1000)
+
+    # --- セッションの模擬 ---
+
+    def simulate(self, session: SimSession) -> None:
+        args = self.args
+        b = session.builder
+        session.append(b.user_prompt())
+        for call in range(1, args.tool_calls + 1):
+            self._sleep(session, args.think_ms)
+            if session.rng.random() < args.text_ratio:
+                session.append(b.assistant_text())
+            if args.ask_every and call % args.ask_every == 0:
+                tool_name = "AskUserQuestion"
+                tool_input = {"questions": [{
+                    "question": "どちらの方針で進めますか？",
+                    "header": "方針",
+                    "options": [{"label": "A", "description": "案 A"}, {"label": "B", "description": "案 B"}],
+                    "multiSelect": False,
+                }]}
+                use = b.entry("assistant", {"role": "assistant", "content": [
+                    {"type": "tool_use", "id": f"toolu_ask_{call}", "name": tool_name, "input": tool_input},
+                ]})
+                tool_id = f"toolu_ask_{call}"
+            else:
+                use, tool_id = b.tool_use()
+                block = use["message"]["content"][0]
+                tool_name, tool_input = block["name"], block["input"]
+            session.append(use)
+            payload = session.hook_input("PreToolUse", tool_name=tool_name, tool_input=tool_input,
+                                         permission_mode="default")
+            if args.combined_pre_tool:
+                self.run_hook(session, "pre_tool", payload)
+            else:
+                self.run_hook_async(session, "pre_tool_progress", payload)
+                self.run_hook(session, "pre_tool_use", payload)
+            self._sleep(session, args.tool_ms)
+            session.append(b.tool_result(tool_id))
+            if args.notify_every and call % args.notify_every == 0:
+                self.run_hook(session, "notify", session.hook_input(
+                    "Notification", message="Claude needs your attention", notification_type="permission_prompt",
+                ))
+        self._sleep(session, args.think_ms)
+        final = b.assistant_text(rich=True)
+        final["message"]["content"][0]["text"] += f"\n\n{session.stop_marker}"
+        session.append(final)
+        self.run_hook(session, "stop", session.hook_input(
+            "Stop", stop_hook_active=False, last_assistant_message=final["message"]["content"][0]["text"],
+        ))
+
+    def run(self) -> float:
+        started = time.monotonic()
+        threads = [threading.Thread(target=self.simulate, args=(s,)) for s in self.sessions]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for t in list(self._async_threads):
+            t.join()
+        return time.monotonic() - started
+
+    # --- 結果 ---
+
+    def delivered(self) -> dict:
+        """スタンドインに届いたメッセージを種類ごとに数える。"""
+        counts = {"stop": 0, "progress": 0, "buttons": 0, "other": 0}
+        stop_sessions: set[str] = set()
+        markers = {s.stop_marker: s.session_id for s in self.sessions}
+        for message in list(self.server.messages.values()):
+            content = message.get("content", "")
+            session_id = next((sid for marker, sid in markers.items() if marker in content), None)
+            if session_id is not None or any(a["filename"].startswith("reply") for a in message["attachments"]):
+                counts["stop"] += 1
+                if session_id is not None:
+                    stop_sessions.add(session_id)
+            elif content.startswith("🔄"):
+                counts["progress"] += 1
+            elif message.get("components"):
+                counts["buttons"] += 1
+            else:
+                counts["other"] += 1
+        counts["stop_sessions"] = len(stop_sessions)
+        return counts
+
+    def wait_for_stop_delivery(self, timeout: float) -> None:
+        """spool / detached では Stop hook の終了後に送信されるため、全セッションの応答が届くまで待つ。"""
+        deadline = time.monotonic() + timeout
+        while self.delivered()["stop_sessions"] < len(self.sessions) and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+    def report(self, wall_s: float) -> dict:
+        hooks: dict[str, dict] = {}
+        by_hook: dict[str, list[HookCall]] = {}
+        for call in self.calls:
+            by_hook.setdefault(call.hook, []).append(call)
+        for hook, calls in sorted(by_hook.items()):
+            samples = Samples()
+            exit_codes: dict[str, int] = {}
+            for call in calls:
+                samples.add(call.elapsed_ms)
+                exit_codes[str(call.exit_code)] = exit_codes.get(str(call.exit_code), 0) + 1
+            hooks[hook] = {
+                "count": samples.count,
+                "exit_codes": exit_codes,
+                **{f"p{round(q * 100)}_ms": round(v, 1) for q, v in samples.quantiles().items()},
+                "max_ms": round(max(samples.values), 1),
+            }
+        options = {k: v for k, v in vars(self.args).items() if k not in ("output", "keep")}
+        return {
+            "options": options,
+            "wall_s": round(wall_s, 2),
+            "hook_calls_per_s": round(len(self.calls) / wall_s, 1) if wall_s else None,
+            "hooks": hooks,
+            "delivered": {**self.delivered(), "stop_expected": len(self.sessions)},
+            "discord": self.server.stats(),
+            "trace": to_json(summarize([str(self.trace_path)]))["hooks"],
+        }
+
+
+def format_summary(report: dict) -> str:
+    lines = [f"wall {report['wall_s']}s, {report['hook_calls_per_s']} hook calls/s"]
+    for hook, stats in report["hooks"].items():
+        lines.append(
+            f"  {hook:<18} n={stats['count']:<6} p50={stats['p50_ms']:>8.1f}ms p95={stats['p95_ms']:>8.1f}ms "
+            f"p99={stats['p99_ms']:>8.1f}ms exit={stats['exit_codes']}"
+        )
+    d = report["delivered"]
+    lines.append(
+        f"  delivered: stop {d['stop_sessions']}/{d['stop_expected']} sessions, "
+        f"{d['progress']} progress, {d['buttons']} buttons, {d['other']} other"
+    )
+    lines.append(f"  discord: {report['discord']['by_status']}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Drive simulated Claude Code sessions through the hooks")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent sessions")
+    parser.add_argument("--tool-calls", type=int, default=20, help="tool calls per session")
+    parser.add_argument("--layout", choices=("threads", "channels"), default="threads")
+    parser.add_argument("--think-ms", type=float, default=300.0, help="mean time before each tool call")
+    parser.add_argument("--tool-ms", type=float, default=200.0, help="mean tool execution time")
+    parser.add_argument("--text-ratio", type=float, default=0.5, help="share of tool calls preceded by text")
+    parser.add_argument("--ask-every", type=int, default=0, help="every Nth tool call is AskUserQuestion")
+    parser.add_argument("--notify-every", type=int, default=0, help="fire Notification every N tool calls")
+    parser.add_argument("--delivery", choices=("sync", "spool", "detached"), default="sync")
+    parser.add_argument("--daemon", action="store_true", help="run the hooks through hook_daemon.py")
+    parser.add_argument("--combined-pre-tool", action="store_true",
+                        help="run hooks/pre_tool.py instead of pre_tool_use.py + pre_tool_progress.py")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stand-in response latency")
+    parser.add_argument("--jitter-ms", type=float, default=30.0)
+    parser.add_argument("--inject-429", type=float, default=0.0)
+    parser.add_argument("--archive-threads", type=int, default=0,
+                        help="threads layout: the first N sessions' threads return 404")
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="seconds to wait for spool/detached Stop replies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory")
+    args = parser.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="discord-bridge-driver-"))
+    archived = (
+        {str(THREAD_BASE + i) for i in range(args.archive_threads)} if args.layout == "threads" else set()
+    )
+    server = FakeDiscord(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, inject_429=args.inject_429,
+        archived=archived, record_path=str(workdir / "requests.jsonl"), seed=args.seed,
+    ).start()
+    driver = Driver(args, workdir, server)
+    try:
+        driver.write_config()
+        if args.daemon:
+            driver.start_daemon()
+        wall_s = driver.run()
+        if args.delivery != "sync":
+            driver.wait_for_stop_delivery(args.drain_timeout)
+        report = driver.report(wall_s)
+    finally:
+        driver.stop_daemon()
+        server.stop()
+        if args.keep:
+            print(f"[session_driver] Work directory: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    print(format_summary(report), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
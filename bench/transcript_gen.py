@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""bench/transcript_gen.py — ベンチマーク用の Claude Code transcript（JSONL）を生成する
+
+ユーザー発話 → アシスタントのテキストと tool_use → tool_result … を1ターンとして、
+指定サイズに達するまでターンを追記する。一定間隔で compact の summary エントリを挟み、
+最後のターンはユーザー発話の後に tool_use / tool_result とアシスタントのテキスト（表・コードブロック付き）で終える。
+同じ seed とサイズからは同じ内容を生成する。
+
+    python3 bench/transcript_gen.py OUT.jsonl --size 10MB [--seed 0]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+from typing import Iterator
+
+_SIZE_UNITS = {"": 1, "B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+SUMMARY_EVERY = 20  # ターン数（compact の summary エントリを挟む間隔）
+_LAST_TURN_RESERVE = 8 * 1024  # 最後のターンの見込みサイズ（この分を残して通常のターンを打ち切る）
+
+_WORDS = (
+    "config", "hook", "transcript", "thread", "channel", "request", "retry", "ファイル",
+    "設定", "確認", "修正", "テスト", "実行", "結果", "エラー", "追加", "削除", "の", "を", "に",
+    "は", "します", "しました", "and", "the", "update", "parse", "index", "bot", "message",
+)
+_TOOLS = ("Bash", "Read", "Edit", "Write", "Grep", "Glob")
+
+
+def parse_size(text: str) -> int:
+    """'512KB' / '10MB' / '1048576' をバイト数に変換する。"""
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMG]?B?)", text.strip().upper())
+    if not m:
+        raise ValueError(f"invalid size: {text!r} (e.g. 1MB, 512KB)")
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2)])
+
+
+class TranscriptBuilder:
+    """1セッション分の transcript エントリを生成する（uuid の連鎖・タイムスタンプを保持する）。"""
+
+    def __init__(self, seed: int) -> None:
+        self.rng = random.Random(seed)
+        self.session_id = str(uuid.UUID(int=self.rng.getrandbits(128)))
+        self.parent: str | None = None
+        self.clock = 1_767_225_600  # 2026-01-01T00:00:00Z
+
+    def _uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128)))
+
+    def sentence(self, words: int) -> str:
+        return " ".join(self.rng.choice(_WORDS) for _ in range(words))
+
+    def paragraph(self, sentences: int) -> str:
+        return "。".join(self.sentence(self.rng.randint(6, 20)) for _ in range(sentences))
+
+    def code_block(self, lines: int) -> str:
+        body = "\n".join(f"    x_{i} = compute({i}, {self.rng.random():.4f})" for i in range(lines))
+        return f"```python\ndef f():\n{body}\n```"
+
+    def table(self, rows: int) -> str:
+        lines = ["| name | count | ratio |", "|------|------:|------:|"]
+        for i in range(rows):
+            lines.append(f"| item-{i} {self.rng.choice(_WORDS)} | {self.rng.randint(0, 99999)} | {self.rng.random():.3f} |")
+        return "\n".join(lines)
+
+    def entry(self, entry_type: str, message: dict) -> dict:
+        self.clock += self.rng.randint(1, 30)
+        entry_uuid = self._uuid()
+        entry = {
+            "parentUuid": self.parent,
+            "isSidechain": False,
+            "type": entry_type,
+            "message": message,
+            "uuid": entry_uuid,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(self.clock)),
+            "sessionId": self.session_id,
+            "cwd": "/home/user/project",
+        }
+        self.parent = entry_uuid
+        return entry
+
+    def user_prompt(self) -> dict:
+        return self.entry("user", {"role": "user", "content": self.paragraph(self.rng.randint(1, 3))})
+
+    def assistant_text(self, rich: bool = False) -> dict:
+        parts = [self.paragraph(self.rng.randint(1, 4))]
+        if rich or self.rng.random() < 0.2:
+            parts.append(self.table(self.rng.randint(3, 12)))
+        if rich or self.rng.random() < 0.2:
+            parts.append(self.code_block(self.rng.randint(3, 30)))
+        return self.entry("assistant", {
+            "role": "assistant",
+            "content": [{"type": "text", "text": "\n\n".join(parts)}],
+        })
+
+    def tool_use(self) -> tuple[dict, str]:
+        tool_id = f"toolu_{self.rng.getrandbits(64):016x}"
+        tool = self.rng.choice(_TOOLS)
+        entry = self.entry("assistant", {
+            "role": "assistant",
+            "content": [{
+                "type": "tool_use", "id": tool_id, "name": tool,
+                "input": {"command": self.sentence(8), "description": self.sentence(5)},
+            }],
+        })
+        return entry, tool_id
+
+    def tool_result(self, tool_id: str) -> dict:
+        # ファイル内容・コマンド出力を模した大きめの結果（transcript の大半を占める）
+        output = "\n".join(self.sentence(12) for _ in range(self.rng.randint(5, 120)))
+        return self.entry("user", {
+            "role": "user",
+            "content": [{"type": "tool_result", "tool_use_id": tool_id, "content": output}],
+        })
+
+    def summary(self) -> dict:
+        return {"type": "summary", "summary": self.sentence(10), "leafUuid": self.parent}
+
+    def turn(self) -> Iterator[dict]:
+        yield self.user_prompt()
+        for _ in range(self.rng.randint(1, 8)):
+            if self.rng.random() < 0.5:
+                yield self.assistant_text()
+            use, tool_id = self.tool_use()
+            yield use
+            yield self.tool_result(tool_id)
+        yield self.assistant_text()
+
+    def last_turn(self) -> Iterator[dict]:
+        yield self.user_prompt()
+        yield self.assistant_text()
+        use, tool_id = self.tool_use()
+        yield use
+        yield self.tool_result(tool_id)
+        yield self.assistant_text(rich=True)
+        yield self.assistant_text(rich=True)
+
+
+def generate(path: str, size: int, seed: int = 0) -> int:
+    """size バイト程度の transcript を path に書き込み、実際のバイト数を返す。"""
+    session = TranscriptBuilder(seed)
+    written = 0
+    turns = 0
+    with open(path, "w", encoding="utf-8") as f:
+
+        def write(entries: Iterator[dict]) -> None:
+            nonlocal written
+            for entry in entries:
+                line = json.dumps(entry, ensure_ascii=False) + "\n"
+                f.write(line)
+                written += len(line.encode())
+
+        while written < size - _LAST_TURN_RESERVE:
+            if turns and turns % SUMMARY_EVERY == 0:
+                write(iter([session.summary()]))
+            write(session.turn())
+            turns += 1
+        write(session.last_turn())
+    return written
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic Claude Code transcript")
+    parser.add_argument("output", help="output JSONL path")
+    parser.add_argument("--size", type=parse_size, default=parse_size("1MB"), help="target size (e.g. 1MB, 100MB)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    written = generate(args.output, args.size, args.seed)
+    print(f"[transcript_gen] Wrote {written} bytes to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""常駐 hook デーモン: Unix ソケットで hook 入力を受け取り、stop / notify / pre_tool_use /
+pre_tool_progress の処理をインタプリタ起動・import 済みのプロセスで実行する。
+
+リクエストごとに fork した子プロセスで hook の main() を実行するため、
+sys.stdin / sys.stdout の差し替えや os.environ の更新がリクエスト間で干渉しない。
+子プロセスの接続は hook の終了とともに閉じるため、Discord への送信は起動時に fork する
+リレープロセス（lib/http_relay、ソケットは <socket>-http.sock）に任せ、keep-alive 接続を
+hook の呼び出しをまたいで使い回す。リレーが停止していれば子プロセスが直接送信する。
+デーモンが停止している間、hook スクリプトは従来通りプロセス内で処理する。
+
+    python3 hooks/hook_daemon.py [--socket PATH]
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import io
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+from pathlib import Path
+from types import ModuleType
+
+sys.path.insert(0, str(Path(__file__).parent))
+from lib import discord
+from lib.daemon_client import ENV_PREFIX, decode_request, encode_response, socket_path
+from lib.http_relay import RelayServer, relay_path
+
+HOOK_MODULES = ("stop", "notify", "pre_tool_use", "pre_tool_progress", "pre_tool")
+
+
+def load_hooks() -> dict[str, ModuleType]:
+    """hook モジュール（と依存する lib）を事前に import する。"""
+    return {name: importlib.import_module(name) for name in HOOK_MODULES}
+
+
+def _apply_env(env: dict[str, str], hooks: dict[str, ModuleType]) -> None:
+    """クライアント側の DISCORD_BRIDGE_* 環境変数を子プロセスに反映する。"""
+    for key in [k for k in os.environ if k.startswith(ENV_PREFIX)]:
+        del os.environ[key]
+    os.environ.update({k: v for k, v in env.items() if k.startswith(ENV_PREFIX)})
+    # import 時に評価される DEBUG フラグを再評価する
+    debug = os.environ.get("DISCORD_BRIDGE_DEBUG") == "1"
+    for module in hooks.values():
+        if hasattr(module, "DEBUG"):
+            module.DEBUG = debug
+
+
+def run_hook(module: ModuleType, stdin_text: str) -> tuple[int, str, str]:
+    """hook の main() を実行し (exit_code, stdout, stderr) を返す。"""
+    out, err = io.StringIO(), io.StringIO()
+    saved = sys.stdin, sys.stdout, sys.stderr
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(stdin_text), out, err
+    exit_code = 0
+    try:
+        module.main()
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = saved
+    return exit_code, out.getvalue(), err.getvalue()
+
+
+class _HookHandler(socketserver.StreamRequestHandler):
+    server: "HookDaemon"
+
+    def handle(self) -> None:
+        try:
+            hook, env, stdin_data = decode_request(self.rfile.read())
+            module = self.server.hooks[hook]
+        except (ValueError, KeyError) as e:
+            response = encode_response(1, "", f"[hook_daemon] Bad request: {e!r}\n")
+        else:
+            _apply_env(env, self.server.hooks)
+            exit_code, out, err = run_hook(module, stdin_data.decode("utf-8", errors="replace"))
+            response = encode_response(exit_code, out, err)
+        self.wfile.write(response)
+
+
+class HookDaemon(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    def __init__(self, path: str, hooks: dict[str, ModuleType]) -> None:
+        self.hooks = hooks
+        super().__init__(path, _HookHandler)
+        os.chmod(path, 0o600)
+
+
+def _remove_stale_socket(path: str) -> None:
+    """前回のソケットファイルが残っていれば削除する。稼働中のデーモンがあれば終了する。"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        print(f"[hook_daemon] Already running on {path}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        probe.close()
+
+
+def start_relay(path: str) -> int:
+    """接続リレーを fork した子プロセスで起動し、その pid を返す。
+
+    ソケットは fork 前に listen するため、戻った時点で子プロセスから接続できる。
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+    server = RelayServer(path, discord._send_once, parent_pid=os.getpid())
+    pid = os.fork()
+    if pid == 0:
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            server.serve_forever(poll_interval=1.0)
+        finally:
+            os._exit(0)
+    server.socket.close()
+    return pid
+
+
+def stop_relay(pid: int, path: str) -> None:
+    try:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    except (OSError, ChildProcessError):
+        pass
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="discord-bridge resident hook daemon")
+    parser.add_argument("--socket", default=socket_path(), help="Unix socket path")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.socket), exist_ok=True)
+    _remove_stale_socket(args.socket)
+    server = HookDaemon(args.socket, load_hooks())
+    relay = relay_path(args.socket)
+    relay_pid = start_relay(relay)
+    discord.use_relay(relay)
+
+    def _shutdown(signum: int, frame: object) -> None:
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    print(f"[hook_daemon] Listening on {args.socket}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        stop_relay(relay_pid, relay)
+        try:
+            os.unlink(args.socket)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""hooks/lib/chunk.py — Discord の文字数上限に合わせたメッセージ分割・切り詰め
+
+テキストを行単位で1回走査してチャンクを組み立てる（入力長に比例した時間）。
+
+- fenced code block（``` / ~~~）の途中で分割する場合は、チャンク末尾で閉じて次のチャンクで開き直す
+  （言語指定付きの開始行を引き継ぐ）。閉じマーカーのない開始行はコードブロックとして扱わない
+- 行の途中では分割しない（convert_tables_in_text が描画したテーブル行を含む）。
+  1行だけで上限を超える場合のみ行を分割する
+- コードブロック外の長い段落は、チャンクが半分も埋まっていなければ空白位置で分割して詰める
+"""
+from __future__ import annotations
+
+from typing import Iterator
+
+DISCORD_MAX_CONTENT = 2000
+
+_FENCE_MARKERS = ("```", "~~~")
+_MAX_REOPEN_LEN = 64  # 開き直す開始行の最大長（超える場合はマーカーのみ）
+# これより短い上限ではコードブロックを開き直す余地がないため、フェンスを考慮せずに分割する
+_MIN_FENCED_LEN = 2 * (_MAX_REOPEN_LEN + 1 + len("\n```"))
+
+
+class _Chunk:
+    """組み立て中のチャンク（行のリストと "\\n" 連結後の長さ）。"""
+
+    def __init__(self, max_len: int) -> None:
+        self.max_len = max_len
+        self.lines: list[str] = []
+        self.size = 0
+        self.base = 0  # 開き直した開始行の数（これを超える行があれば本文あり）
+
+    def room(self, reserve: int) -> int:
+        """閉じフェンス用に reserve 文字を残したとき、次の行に使える文字数。"""
+        return self.max_len - self.size - (1 if self.lines else 0) - reserve
+
+    def add(self, line: str) -> None:
+        self.size += len(line) + (1 if self.lines else 0)
+        self.lines.append(line)
+
+    @property
+    def has_content(self) -> bool:
+        return len(self.lines) > self.base
+
+    def take(self, reopen: str | None) -> str:
+        """本文を返して空にする。reopen があれば次のチャンクの先頭に開始行を置く。"""
+        lines = self.lines
+        if reopen is None:
+            while lines and not lines[-1].strip():
+                lines.pop()
+        body = "\n".join(lines)
+        self.lines, self.size, self.base = [], 0, 0
+        if reopen is not None:
+            self.add(reopen)
+            self.base = 1
+        return body
+
+
+def _cut(line: str, pos: int, room: int, prefer_space: bool) -> tuple[int, int]:
+    """line[pos:] の先頭 room 文字以内の分割位置を (片の終端, 次の開始位置) で返す。"""
+    end = pos + room
+    if prefer_space:
+        space = line.rfind(" ", pos + room // 2, end + 1)
+        if space > pos:
+            return space, space + 1
+    return end, end
+
+
+def _iter_chunks(text: str, max_len: int) -> Iterator[tuple[str, str]]:
+    """(本文, 閉じフェンス) を順に返す。閉じフェンスはコードブロックの途中で分割した場合のみ "\\n```" など。"""
+    lines = text.split("\n")
+
+    # マーカーごとの閉じ行候補の最終行（これより前の開始行のみコードブロックとして扱う）
+    last_closer = dict.fromkeys(_FENCE_MARKERS, -1)
+    if max_len >= _MIN_FENCED_LEN:
+        for idx, line in enumerate(lines):
+            stripped = line.strip(" \t")
+            if stripped in last_closer:
+                last_closer[stripped] = idx
+
+    chunk = _Chunk(max_len)
+    fence: str | None = None  # 開いているコードブロックのマーカー
+    reopen = ""               # 分割後に開き直す開始行
+
+    for i, line in enumerate(lines):
+        if fence is None:
+            marker = line.lstrip(" \t")[:3]
+            if marker in last_closer and last_closer[marker] > i:
+                stripped = line.strip(" \t")
+                reopen = stripped if len(stripped) <= _MAX_REOPEN_LEN else marker
+                fence_after: str | None = marker
+            else:
+                fence_after = None
+        else:
+            fence_after = None if line.strip(" \t") == fence else fence
+
+        if fence is None and not chunk.lines and not line.strip():
+            continue  # チャンク先頭の空行は送らない
+
+        reserve = len("\n```") if fence or fence_after else 0
+        if len(line) <= chunk.room(reserve if fence_after else 0):
+            chunk.add(line)
+            fence = fence_after
+            continue
+
+        pos = 0
+        if (
+            fence is None and fence_after is None and chunk.has_content
+            and not line.startswith("|") and chunk.size < max_len // 2
+        ):
+            # 長い段落: 行の先頭部分で現在のチャンクの残りを埋める
+            end, pos = _cut(line, 0, chunk.room(0), prefer_space=True)
+            chunk.add(line[:end])
+
+        while True:
+            if chunk.has_content:
+                body = chunk.take(reopen if fence else None)
+                if body.strip():
+                    yield body, f"\n{fence}" if fence else ""
+            room = chunk.room(reserve)
+            if len(line) - pos <= room:
+                chunk.add(line[pos:])
+                break
+            # 1行が上限を超える場合のみ行を分割する
+            end, next_pos = _cut(line, pos, room, prefer_space=fence is None)
+            chunk.add(line[pos:end])
+            pos = next_pos
+        fence = fence_after
+
+    if chunk.has_content:
+        body = chunk.take(None)
+        if body.strip():
+            yield body, ""
+
+
+def split_message(text: str, max_len: int = DISCORD_MAX_CONTENT) -> list[str]:
+    """テキストを max_len 文字以下のチャンクに分割する。
+
+    コードブロックの途中で分割する場合は閉じてから次のチャンクで開き直す。
+    """
+    if max_len < 1:
+        raise ValueError(f"max_len must be positive: {max_len}")
+    if len(text) <= max_len:
+        return [text]
+    return [body + closer for body, closer in _iter_chunks(text, max_len)] or [text[:max_len]]
+
+
+def truncate(text: str, max_len: int, suffix: str = "…") -> str:
+    """テキストを max_len 文字以下に切り詰める（1メッセージに収める用途）。
+
+    split_message の最初のチャンクに suffix を付ける。コードブロックの途中で切る場合は
+    suffix をコードブロック内に置いてから閉じる。
+    """
+    if len(text) <= max_len:
+        return text
+    budget = max_len - len(suffix)
+    if budget <= 0:
+        return text[:max_len]
+    for body, closer in _iter_chunks(text, budget):
+        return body + suffix + closer
+    return text[:budget] + suffix
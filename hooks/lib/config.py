@@ -1,39 +1,151 @@
 from __future__ import annotations
 
 import json
+import marshal
+import os
 from pathlib import Path
 
+# コンパイル済みスナップショット（config 本体 + projectPath のトライ）の形式バージョン
+_SNAPSHOT_VERSION = 1
+_MATCH = "\0"  # トライノード上でマッチ情報を保持するキー（パス要素には現れない）
+
+# load_config() が返した config と、そのトライの組（同一オブジェクトの場合のみ再利用）
+_compiled: tuple[dict, dict] | None = None
+
+
+def _config_path() -> Path:
+    return Path.home() / ".discord-bridge" / "config.json"
+
+
+def _snapshot_path(config_path: Path) -> Path:
+    return config_path.with_name(".config.compiled")
+
 
 def load_config() -> dict:
-    config_path = Path.home() / ".discord-bridge" / "config.json"
+    """config.json を読み込む。
+
+    config の mtime / サイズ / inode が変わっていなければ marshal スナップショットから読み込み、
+    resolve_channel() 用のトライも再構築せずに使う。変更時は JSON を読み直してスナップショットを更新する。
+    """
+    global _compiled
+    config_path = _config_path()
+    st = os.stat(config_path)
+    key = [st.st_mtime_ns, st.st_size, st.st_ino]
+    snapshot_path = _snapshot_path(config_path)
+
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = marshal.load(f)
+        if snapshot.get("version") == _SNAPSHOT_VERSION and snapshot.get("key") == key:
+            _compiled = (snapshot["config"], snapshot["trie"])
+            return snapshot["config"]
+    except (OSError, EOFError, ValueError, TypeError, AttributeError, KeyError):
+        pass
+
     with open(config_path) as f:
-        return json.load(f)
+        config = json.load(f)
+    trie = _build_trie(config)
+    _compiled = (config, trie)
+    _write_snapshot(snapshot_path, {
+        "version": _SNAPSHOT_VERSION, "key": key, "config": config, "trie": trie,
+    })
+    return config
 
 
-def resolve_channel(config: dict, cwd: str) -> tuple[str, str, str | None, list[str]]:
-    """cwd から (channel_id, bot_token, project_name, permission_tools) を解決する。
-    servers[] をループし、projectPath × cwd で最長一致を選択。
-    不一致時は ValueError を raise する。
-    """
-    best_channel_id: str | None = None
-    best_bot_token: str | None = None
-    best_project_name: str | None = None
-    best_permission_tools: list[str] = []
-    best_match_len = 0
+def _write_snapshot(path: Path, snapshot: dict) -> None:
+    """スナップショットをアトミックに書き込む（botToken を含むため 0600）。失敗は無視する。"""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump(snapshot, f)
+        os.replace(tmp, path)
+    except (OSError, ValueError):
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
 
+
+def _build_trie(config: dict) -> dict:
+    """projectPath のパス要素でトライを構築する。
+
+    各ノードの _MATCH キーに [channel_id, bot_token, project_name, permission_tools] を保持する。
+    同じ projectPath が複数ある場合は servers[] / projects[] の順で最初のものを採用する。
+    """
+    root: dict = {}
     for server in config.get("servers", []):
         bot_token = server.get("discord", {}).get("botToken", "")
         permission_tools = server.get("permissionTools", [])
         for project in server.get("projects", []):
             pp = project.get("projectPath", "").rstrip("/")
-            if pp and (cwd == pp or cwd.startswith(pp + "/")) and len(pp) > best_match_len:
-                best_channel_id = project["channelId"]
-                best_bot_token = bot_token
-                best_project_name = project.get("name")
-                best_permission_tools = permission_tools
-                best_match_len = len(pp)
+            if not pp:
+                continue
+            node = root
+            for part in pp.split("/"):
+                node = node.setdefault(part, {})
+            if _MATCH not in node:
+                node[_MATCH] = [project.get("channelId"), bot_token, project.get("name"), permission_tools]
+    return root
+
+
+def _match_linear(config: dict, cwd: str) -> list | None:
+    """servers[] / projects[] を走査し、cwd に一致する最長の projectPath のマッチ情報を返す。
+
+    トライと同じく、同じ長さの projectPath は servers[] / projects[] の順で最初のものを採用する。
+    """
+    best = None
+    best_len = -1
+    for server in config.get("servers", []):
+        for project in server.get("projects", []):
+            pp = project.get("projectPath", "").rstrip("/")
+            if not pp or len(pp) <= best_len:
+                continue
+            if cwd == pp or cwd.startswith(pp + "/"):
+                best_len = len(pp)
+                best = [
+                    project.get("channelId"),
+                    server.get("discord", {}).get("botToken", ""),
+                    project.get("name"),
+                    server.get("permissionTools", []),
+                ]
+    return best
+
+
+def _match_trie(trie: dict, cwd: str) -> list | None:
+    """cwd のパス要素でトライを辿り、最も深いマッチ（= 最長の projectPath）を返す。"""
+    best = None
+    node = trie
+    for part in cwd.split("/"):
+        node = node.get(part)
+        if node is None:
+            break
+        best = node.get(_MATCH, best)
+    return best
 
-    if best_channel_id and best_bot_token:
-        return best_channel_id, best_bot_token, best_project_name, best_permission_tools
+
+def resolve_channel(config: dict, cwd: str) -> tuple[str, str, str | None, list[str]]:
+    """cwd から (channel_id, bot_token, project_name, permission_tools) を解決する。
+    servers[] をループし、projectPath × cwd で最長一致を選択。
+    不一致時は ValueError を raise する。
+
+    load_config() が返した config ならコンパイル済みのトライを使う。それ以外の config
+    （テストや移行処理で組み立てたもの）は1回の検索のためにトライを構築せず、線形に走査する。
+    """
+    if _compiled is not None and _compiled[0] is config:
+        best = _match_trie(_compiled[1], cwd)
+    else:
+        best = _match_linear(config, cwd)
+
+    if best is not None and best[0] and best[1]:
+        return best[0], best[1], best[2], best[3]
 
     raise ValueError(f"No project matches cwd: {cwd!r}")
+
+
+def get_server_option(config: dict, bot_token: str, key: str, default):
+    """bot_token に対応する servers[] エントリの設定値を返す（未設定なら default）。"""
+    for server in config.get("servers", []):
+        if server.get("discord", {}).get("botToken") == bot_token:
+            return server.get(key, default)
+    return default
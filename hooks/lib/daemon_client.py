@@ -0,0 +1,113 @@
+"""hooks/lib/daemon_client.py — 常駐 hook デーモンへの転送クライアント
+
+hook スクリプトはインタプリタ起動直後（重い import の前）にこのモジュールで
+stdin をデーモンへ転送する。デーモンが起動していなければ何もせずに戻り、
+呼び出し元はこれまで通りプロセス内で処理を続ける。
+
+起動コストを抑えるため json / socket（re や enum を連鎖 import する）は使わず、
+_socket と単純な行・長さベースのフレーミングで通信する。
+
+リクエスト: b"<hook>\\n" + b"KEY=VALUE\\n"（DISCORD_BRIDGE_* のみ）... + b"\\n" + <stdin>
+レスポンス: b"<exit> <len(stdout)> <len(stderr)>\\n" + <stdout> + <stderr>
+"""
+from __future__ import annotations
+
+import _socket
+import io
+import os
+import sys
+
+SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".discord-bridge", "hooks.sock")
+CONNECT_TIMEOUT = 0.2  # 秒
+RESPONSE_TIMEOUT = 600  # 秒（permissionTools の応答待ちを含むため長めに取る）
+ENV_PREFIX = "DISCORD_BRIDGE_"
+
+
+def socket_path() -> str:
+    return os.environ.get("DISCORD_BRIDGE_HOOK_SOCKET") or SOCKET_PATH
+
+
+def forwarded_env() -> dict[str, str]:
+    """hook の動作に影響する環境変数（DISCORD_BRIDGE_*）を抽出する。"""
+    return {
+        k: v for k, v in os.environ.items()
+        if k.startswith(ENV_PREFIX) and "\n" not in v
+    }
+
+
+def encode_request(hook: str, env: dict[str, str], stdin_data: bytes) -> bytes:
+    lines = [hook] + [f"{k}={v}" for k, v in env.items()]
+    return ("\n".join(lines) + "\n\n").encode() + stdin_data
+
+
+def decode_request(data: bytes) -> tuple[str, dict[str, str], bytes]:
+    head, sep, body = data.partition(b"\n\n")
+    if not sep:
+        raise ValueError("missing header terminator")
+    hook, *env_lines = head.decode().split("\n")
+    env = dict(line.split("=", 1) for line in env_lines if "=" in line)
+    return hook, env, body
+
+
+def encode_response(exit_code: int, out: str, err: str) -> bytes:
+    out_b, err_b = out.encode(), err.encode()
+    return f"{exit_code} {len(out_b)} {len(err_b)}\n".encode() + out_b + err_b
+
+
+def decode_response(data: bytes) -> tuple[int, str, str]:
+    head, sep, body = data.partition(b"\n")
+    if not sep:
+        raise ValueError("missing response header")
+    exit_code, out_len, err_len = (int(x) for x in head.split())
+    if len(body) != out_len + err_len:
+        raise ValueError("truncated response")
+    return exit_code, body[:out_len].decode(), body[out_len:].decode()
+
+
+def forward(hook: str, stdin_data: bytes, path: str | None = None) -> tuple[int, str, str] | None:
+    """hook 入力をデーモンに転送し (exit_code, stdout, stderr) を返す。
+
+    デーモンに接続できない場合は None を返す（呼び出し元はプロセス内処理にフォールバック）。
+    接続後に失敗した場合は二重送信を避けるため再実行せず、エラー終了として扱う。
+    """
+    if os.environ.get("DISCORD_BRIDGE_NO_DAEMON") == "1":
+        return None
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(path or socket_path())
+    except OSError:
+        sock.close()
+        return None
+
+    try:
+        sock.settimeout(RESPONSE_TIMEOUT)
+        sock.sendall(encode_request(hook, forwarded_env(), stdin_data))
+        sock.shutdown(_socket.SHUT_WR)
+        chunks: list[bytes] = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return decode_response(b"".join(chunks))
+    except (OSError, ValueError) as e:
+        return 1, "", f"[daemon_client] hook daemon request failed: {e}\n"
+    finally:
+        sock.close()
+
+
+def forward_or_continue(hook: str) -> None:
+    """デーモンが稼働していれば転送して結果で終了する。稼働していなければ stdin を戻して返る。"""
+    stdin_data = sys.stdin.buffer.read()
+    result = forward(hook, stdin_data)
+    if result is None:
+        sys.stdin = io.TextIOWrapper(io.BytesIO(stdin_data), encoding="utf-8")
+        return
+    exit_code, out, err = result
+    if out:
+        sys.stdout.write(out)
+    if err:
+        sys.stderr.write(err)
+    sys.stdout.flush()
+    sys.exit(exit_code)
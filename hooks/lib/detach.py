@@ -0,0 +1,78 @@
+"""hooks/lib/detach.py — hook プロセスから切り離したバックグラウンド実行
+
+Claude Code（および hook デーモンのクライアント）は hook の stdout / stderr や接続ソケットが
+閉じられるまで待つため、二重 fork した孫プロセスで標準入出力を /dev/null に付け替え、
+継承したソケット・パイプを閉じてから処理を実行する。
+"""
+from __future__ import annotations
+
+import os
+import stat
+from typing import Callable
+
+from lib import discord
+
+
+def _inherited_fds() -> list[int]:
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return [int(name) for name in os.listdir(fd_dir)]
+        except (OSError, ValueError):
+            continue
+    return []
+
+
+def _detach_io() -> None:
+    """標準入出力を /dev/null にし、3 以上のソケット・パイプを閉じる。"""
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    if devnull > 2:
+        os.close(devnull)
+    # keep-alive 接続はオブジェクトごと閉じる（fd だけ閉じると後で番号を再利用した fd を閉じかねない）
+    discord.close_all()
+    for fd in _inherited_fds():
+        if fd <= 2:
+            continue
+        try:
+            mode = os.fstat(fd).st_mode
+        except OSError:
+            continue
+        if stat.S_ISSOCK(mode) or stat.S_ISFIFO(mode):
+            os.close(fd)
+
+
+def run_detached(target: Callable[[], object]) -> bool:
+    """target をセッションから切り離した孫プロセスで実行する。
+
+    呼び出し元は中間プロセスの終了だけを待って戻る。fork できなかった場合は False を返す
+    （呼び出し元は同期実行にフォールバックする）。target の例外は孫プロセス内で握りつぶす。
+    """
+    try:
+        pid = os.fork()
+    except OSError:
+        return False
+    if pid:
+        try:
+            _, status = os.waitpid(pid, 0)
+        except ChildProcessError:
+            return True
+        return os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+    # 中間プロセス: 新しいセッションを作って孫を fork し、すぐに終了する
+    code = 1
+    try:
+        os.setsid()
+        if os.fork():
+            code = 0
+        else:
+            code = 0
+            try:
+                _detach_io()
+                target()
+            except BaseException:
+                pass
+    except BaseException:
+        pass
+    finally:
+        os._exit(code)
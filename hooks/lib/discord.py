@@ -0,0 +1,265 @@
+"""hooks/lib/discord.py — Discord REST クライアント（keep-alive 接続プール）
+
+hooks からの Discord API 呼び出しはすべてここを経由する。
+接続は (scheme, host, port) ごとにプールされ、分割送信やボタン送信など
+同一プロセス内の連続リクエストで TCP + TLS ハンドシェイクを使い回す。
+
+エラー時は従来の urllib ベースの実装と同じく urllib.error.HTTPError / URLError を送出するため、
+呼び出し側の 404 フォールバック等の例外処理はそのまま使える。
+
+hook デーモンの子プロセスでは use_relay() で指定したリレー（lib/http_relay）経由で送信し、
+デーモンが保持する接続を hook の呼び出しをまたいで使い回す。
+
+環境変数 DISCORD_BRIDGE_API_BASE を設定すると API の送信先を変更できる
+（負荷試験用のローカルサーバー bench/fake_discord.py など）。
+"""
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import sys
+import threading
+import urllib.error
+from collections.abc import Iterator
+from typing import Iterable, Union
+from urllib.parse import urlsplit
+
+from lib import http_relay, ratelimit, trace
+
+API_BASE = "https://discord.com/api/v10"
+ENV_API_BASE = "DISCORD_BRIDGE_API_BASE"
+USER_AGENT = "DiscordBot (discord-bridge, 1.0.0)"
+RATE_LIMIT_MAX_RETRIES = 3
+_MAX_IDLE_PER_HOST = 4
+
+Body = Union[bytes, Iterable[bytes], None]
+
+# 再利用した接続がサーバー側で閉じられていた場合に発生する例外（新しい接続で1回だけ再送する）
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+class ConnectionPool:
+    """同一ホストへの keep-alive 接続を保持するスレッドセーフなプール。"""
+
+    def __init__(self, scheme: str, host: str, port: int | None) -> None:
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self._idle: list[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float, reuse: bool = True) -> tuple[http.client.HTTPConnection, bool]:
+        """接続を取得し (connection, 再利用かどうか) を返す。reuse=False なら常に新しい接続を開く。"""
+        conn = None
+        if reuse:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=timeout), False
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout), False
+
+    def release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < _MAX_IDLE_PER_HOST:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools: dict[tuple[str, str, int | None], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(scheme: str, host: str, port: int | None) -> ConnectionPool:
+    key = (scheme, host, port)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(scheme, host, port)
+        return pool
+
+
+def close_all() -> None:
+    """プール中の接続をすべて閉じる（主にテスト用）。"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+_relay_path: str | None = None
+
+
+def use_relay(path: str | None) -> None:
+    """以降の送信をリレー経由にする（None で直接送信に戻す）。hook デーモンが子プロセスの fork 前に呼ぶ。"""
+    global _relay_path
+    _relay_path = path
+
+
+def api_base() -> str:
+    """送信先の API ベース URL（hook デーモン経由でも転送された環境変数を参照するため呼び出しごとに読む）。"""
+    return (os.environ.get(ENV_API_BASE) or API_BASE).rstrip("/")
+
+
+def _send_once(
+    method: str, url: str, headers: dict[str, str], body: Body, timeout: float
+) -> tuple[int, str, http.client.HTTPMessage, bytes]:
+    """1回分のリクエストを送信し (status, reason, headers, body) を返す。"""
+    if _relay_path is not None:
+        try:
+            return http_relay.forward(_relay_path, method, url, headers, body, timeout)
+        except http_relay.RelayUnavailable:
+            pass  # リレーが停止していれば直接送信する
+    parts = urlsplit(url)
+    pool = _get_pool(parts.scheme, parts.hostname or "", parts.port)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+
+    # 一度しか読めない本文（リレーが中継する添付など）は古い接続で失敗しても再送できないため、新しい接続で送る
+    one_shot = isinstance(body, Iterator)
+    for attempt in range(2):
+        conn, reused = pool.acquire(timeout, reuse=not one_shot)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except _STALE_CONNECTION_ERRORS:
+            conn.close()
+            if reused and attempt == 0:
+                continue
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            pool.release(conn)
+        return resp.status, resp.reason, resp.msg, data
+    raise AssertionError("unreachable")
+
+
+def request(
+    method: str,
+    path: str,
+    bot_token: str,
+    body: Body = None,
+    content_type: str = "application/json",
+    timeout: float = 10,
+    max_retries: int = RATE_LIMIT_MAX_RETRIES,
+    content_length: int | None = None,
+) -> dict | None:
+    """Discord API にリクエストを送信し、JSON レスポンスを返す（ボディが空なら None）。
+
+    送信前に共有レート制限状態（lib/ratelimit）で枠を予約し、受信後にヘッダーを反映する。
+    429 の場合は共有状態に記録された Retry-After だけ待機し、最大 max_retries 回まで送信を試みる。
+    body にイテラブルを渡す場合は content_length を指定し、リトライのため再イテレート可能にすること。
+    """
+    url = f"{api_base()}{path}"
+    headers = {
+        "Authorization": f"Bot {bot_token}",
+        "User-Agent": USER_AGENT,
+    }
+    if body is not None:
+        headers["Content-Type"] = content_type
+        if content_length is not None:
+            headers["Content-Length"] = str(content_length)
+    body_size = len(body) if isinstance(body, bytes) else (content_length or 0)
+
+    for attempt in range(max_retries):
+        ratelimit.acquire(method, path, bot_token)
+        trace.add("requests")
+        trace.add("bytes_out", body_size)
+        try:
+            status, reason, resp_headers, data = _send_once(method, url, headers, body, timeout)
+        except (OSError, http.client.HTTPException) as e:
+            raise urllib.error.URLError(e) from e
+        ratelimit.update(method, path, bot_token, status, resp_headers)
+
+        if status == 429:
+            trace.add("http_429")
+            # 待機は次の試行の acquire() が共有状態に基づいて行う
+            print(
+                f"[discord] Rate limited (429). Retry-After {resp_headers.get('Retry-After', '?')}s "
+                f"(attempt {attempt + 1}/{max_retries})",
+                file=sys.stderr,
+            )
+            continue
+        if status >= 400:
+            print(f"[discord] API error: {status} {reason}", file=sys.stderr)
+            raise urllib.error.HTTPError(url, status, reason, resp_headers, None)
+        if not data:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+    raise urllib.error.URLError(f"Rate limit retries exhausted after {max_retries} attempts")
+
+
+def post_message(
+    bot_token: str,
+    channel_id: str,
+    content: str,
+    components: list | None = None,
+    timeout: float = 10,
+    max_retries: int = RATE_LIMIT_MAX_RETRIES,
+) -> dict | None:
+    """テキスト（＋任意のボタン components）メッセージを送信する。"""
+    payload: dict = {"content": content}
+    if components is not None:
+        payload["components"] = components
+    return request(
+        "POST", f"/channels/{channel_id}/messages", bot_token,
+        body=json.dumps(payload).encode(), timeout=timeout, max_retries=max_retries,
+    )
+
+
+def edit_message(
+    bot_token: str,
+    channel_id: str,
+    message_id: str,
+    content: str,
+    timeout: float = 10,
+    max_retries: int = RATE_LIMIT_MAX_RETRIES,
+) -> dict | None:
+    """送信済みメッセージの本文を編集する。"""
+    return request(
+        "PATCH", f"/channels/{channel_id}/messages/{message_id}", bot_token,
+        body=json.dumps({"content": content}).encode(), timeout=timeout, max_retries=max_retries,
+    )
+
+
+def post_multipart(
+    bot_token: str,
+    channel_id: str,
+    boundary: str,
+    body: Body,
+    content_length: int | None = None,
+    timeout: float = 30,
+) -> dict | None:
+    """multipart/form-data（ファイル添付）メッセージを送信する。"""
+    return request(
+        "POST", f"/channels/{channel_id}/messages", bot_token,
+        body=body,
+        content_type=f"multipart/form-data; boundary={boundary}",
+        timeout=timeout,
+        content_length=content_length,
+    )
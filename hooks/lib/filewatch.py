@@ -0,0 +1,146 @@
+"""hooks/lib/filewatch.py — ファイルの追記を待つ（transcript の書き込み待ち）
+
+hook の発火時点で Claude Code が transcript をまだ書き終えていないことがあるため、
+内容が揃うまで読み直す。固定間隔で sleep する代わりにファイルの変更を待ち、
+変更があればすぐに読み直す。
+
+- Linux では inotify（ctypes 経由、追加の依存なし）で変更を待つ
+- inotify が使えない環境（macOS、ファイルが未作成、watch 数の上限など）では
+  サイズと mtime を POLL_MIN 秒から POLL_MAX 秒まで倍々に間隔を広げながらポーリングする
+
+timeout は上限であり、内容が揃った時点で戻る。
+ctypes の import は hook の起動を遅らせるため、最初に待つときまで遅らせる。
+"""
+from __future__ import annotations
+
+import os
+import select
+import sys
+import time
+from typing import TYPE_CHECKING, Callable, TypeVar
+
+if TYPE_CHECKING:
+    import ctypes
+
+POLL_MIN = 0.005  # 秒
+POLL_MAX = 0.05   # 秒
+
+# inotify のイベント（sys/inotify.h）
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_DELETE_SELF | _IN_MOVE_SELF
+
+T = TypeVar("T")
+
+_libc: ctypes.CDLL | None = None
+_libc_loaded = False
+
+
+def _inotify_libc() -> ctypes.CDLL | None:
+    """inotify_init1 / inotify_add_watch を持つ libc を返す（使えなければ None）。"""
+    global _libc, _libc_loaded
+    if not _libc_loaded:
+        _libc_loaded = True
+        if sys.platform.startswith("linux"):
+            import ctypes
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                _libc = libc
+            except (OSError, AttributeError):
+                _libc = None
+    return _libc
+
+
+class _InotifyWatch:
+    """inotify でファイルの変更を待つ。"""
+
+    def __init__(self, libc: ctypes.CDLL, path: str) -> None:
+        import ctypes
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(fd, os.fsencode(path), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"inotify_add_watch failed: {path}")
+        self.fd = fd
+
+    def wait(self, timeout: float) -> None:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        # 溜まったイベントは読み捨てる（変更があったことだけが分かればよい）
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _PollWatch:
+    """サイズと mtime の変化をポーリングで待つ。"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.signature = self._stat()
+
+    def _stat(self) -> tuple[int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def wait(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        interval = POLL_MIN
+        while True:
+            signature = self._stat()
+            if signature != self.signature:
+                self.signature = signature
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, POLL_MAX)
+
+    def close(self) -> None:
+        pass
+
+
+def _watch(path: str) -> _InotifyWatch | _PollWatch:
+    libc = _inotify_libc()
+    if libc is not None:
+        try:
+            return _InotifyWatch(libc, path)
+        except OSError:
+            pass
+    return _PollWatch(path)
+
+
+def wait_until(path: str, check: Callable[[], T], timeout: float) -> T:
+    """check() が真になるまで、path が変更されるたびに呼び直す。
+
+    最初の check() の前に監視を始めるため、その間の追記も取りこぼさない。
+    timeout 秒経っても真にならなければ最後の check() の結果を返す。
+    """
+    watch = _watch(path)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            result = check()
+            remaining = deadline - time.monotonic()
+            if result or remaining <= 0:
+                return result
+            watch.wait(remaining)
+    finally:
+        watch.close()
@@ -0,0 +1,143 @@
+"""hooks/lib/http_relay.py — hook デーモン用の Discord 接続リレー
+
+hook デーモンはリクエストごとに fork した子プロセスで hook を実行するため、子プロセスが
+開いた keep-alive 接続は hook の終了とともに失われる。リレーはデーモンの起動時に fork する
+常駐プロセスで lib/discord の接続プールを持ち、子プロセスの HTTP リクエストを代わりに送信する。
+TCP + TLS ハンドシェイクは hook の呼び出しをまたいで使い回される。
+
+レート制限の予約・429 の再試行・trace の集計は従来通り子プロセス側（lib/discord.request）で行い、
+リレーは1回分の送受信だけを受け持つ。
+
+リクエスト: <JSON 1行 {"method", "url", "headers", "timeout", "length"}> + b"\\n" + <body（length バイト）>
+STREAM_THRESHOLD バイトを超える本文（添付ファイルの multipart）はメモリに溜めず、
+CHUNK_SIZE 単位で読みながら Discord への接続へ流す（lib/multipart と同じくメモリ使用量を一定に保つ）。
+レスポンス: <JSON 1行 {"status", "reason", "headers", "length"} または {"error"}> + b"\\n" + <body>
+
+リレーに接続できない場合は RelayUnavailable を送出し、呼び出し側は直接送信する。
+接続後の失敗は送信済みの可能性があるため OSError（ConnectionError）として扱い、再送しない。
+"""
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import socket
+import socketserver
+from typing import BinaryIO, Callable, Iterable, Iterator, Union
+
+from lib.multipart import CHUNK_SIZE
+
+CONNECT_TIMEOUT = 0.2  # 秒
+RESPONSE_MARGIN = 5.0  # 秒（リレー側の送信タイムアウトに上乗せする待ち時間）
+STREAM_THRESHOLD = CHUNK_SIZE  # バイト（これを超える本文は読み切らずに中継する）
+
+Body = Union[bytes, Iterable[bytes], None]
+Response = tuple[int, str, http.client.HTTPMessage, bytes]
+
+
+class RelayUnavailable(Exception):
+    """リレーに接続できない（リクエストは送信していない）。"""
+
+
+def relay_path(daemon_socket: str) -> str:
+    """hook デーモンのソケットパスに対応するリレーのソケットパス。"""
+    base, _ = os.path.splitext(daemon_socket)
+    return f"{base}-http.sock"
+
+
+def forward(path: str, method: str, url: str, headers: dict[str, str], body: Body, timeout: float) -> Response:
+    """1回分のリクエストをリレー経由で送信し (status, reason, headers, body) を返す。"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        sock.close()
+        raise RelayUnavailable(e) from e
+    try:
+        sock.settimeout(timeout + RESPONSE_MARGIN)
+        if body is None:
+            length, chunks = None, []
+        elif isinstance(body, bytes):
+            length, chunks = len(body), [body]
+        else:
+            length, chunks = int(headers["Content-Length"]), body
+        meta = {"method": method, "url": url, "headers": headers, "timeout": timeout, "length": length}
+        sock.sendall(json.dumps(meta).encode() + b"\n")
+        for chunk in chunks:
+            sock.sendall(chunk)
+        with sock.makefile("rb") as f:
+            line = f.readline()
+            if not line:
+                raise ConnectionError("relay closed the connection")
+            reply = json.loads(line)
+            if "error" in reply:
+                raise ConnectionError(f"relay: {reply['error']}")
+            data = f.read(reply["length"])
+        msg = http.client.HTTPMessage()
+        for key, value in reply["headers"]:
+            msg[key] = value
+        return reply["status"], reply["reason"], msg, data
+    finally:
+        sock.close()
+
+
+def _stream_body(rfile: BinaryIO, length: int) -> Iterator[bytes]:
+    """rfile から length バイトを CHUNK_SIZE 単位で読み出す（一度しかイテレートできない）。"""
+    remaining = length
+    while remaining > 0:
+        chunk = rfile.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            # 送信元が本文の途中で切断した（添付の読み込み失敗など）。Content-Length に満たないため中断する
+            raise ConnectionError("relay client closed mid-body")
+        remaining -= len(chunk)
+        yield chunk
+
+
+class _RelayHandler(socketserver.StreamRequestHandler):
+    server: "RelayServer"
+
+    def handle(self) -> None:
+        try:
+            meta = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        headers = dict(meta["headers"])
+        length = meta["length"]
+        body: Body = None
+        if length is not None:
+            headers["Content-Length"] = str(length)
+            if length > STREAM_THRESHOLD:
+                body = _stream_body(self.rfile, length)
+            else:
+                # 小さな本文は読み切っておき、古い接続での再送に使えるようにする
+                body = self.rfile.read(length)
+                if len(body) < length:
+                    return  # 送信元が本文の途中で切断した
+        try:
+            status, reason, resp_headers, data = self.server.send_once(
+                meta["method"], meta["url"], headers, body, meta["timeout"],
+            )
+        except Exception as e:
+            self.wfile.write(json.dumps({"error": repr(e)}).encode() + b"\n")
+            return
+        reply = {"status": status, "reason": reason, "headers": list(resp_headers.items()), "length": len(data)}
+        self.wfile.write(json.dumps(reply).encode() + b"\n" + data)
+
+
+class RelayServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """send_once（lib/discord._send_once）を共有の接続プールで実行するリレー。"""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, send_once: Callable[..., Response], parent_pid: int | None = None) -> None:
+        self.send_once = send_once
+        self.parent_pid = parent_pid
+        super().__init__(path, _RelayHandler)
+        os.chmod(path, 0o600)
+
+    def service_actions(self) -> None:
+        super().service_actions()
+        # デーモンが終了していればリレーも終了する
+        if self.parent_pid is not None and os.getppid() != self.parent_pid:
+            raise SystemExit(0)
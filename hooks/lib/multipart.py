@@ -0,0 +1,67 @@
+"""hooks/lib/multipart.py — ファイルをディスクから逐次送信する multipart/form-data ボディ
+
+添付ファイルをメモリに読み込まず、送信時に CHUNK_SIZE 単位で読み出してソケットへ流す。
+Content-Length は構築時にファイルサイズから算出する。
+429 リトライや keep-alive 接続の再送で再イテレートできるよう、__iter__ のたびにファイルを開き直す。
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Iterator, Union
+
+CHUNK_SIZE = 64 * 1024
+
+# ボディの構成要素: そのまま送るバイト列、または (ファイルパス, サイズ)
+_Segment = Union[bytes, tuple[str, int]]
+
+
+class MultipartBody:
+    """payload_json（content）と添付ファイルからなる multipart/form-data ボディ。"""
+
+    def __init__(self, boundary: str, content: str, files: list[tuple[str, str]]) -> None:
+        """files は (添付ファイル名, ディスク上のパス) のリスト。サイズはここで確定する。"""
+        self.boundary = boundary
+        sep = f"--{boundary}\r\n".encode()
+        segments: list[_Segment] = [
+            sep
+            + b'Content-Disposition: form-data; name="payload_json"\r\n'
+            + b"Content-Type: application/json\r\n"
+            + b"\r\n"
+            + json.dumps({"content": content} if content else {}).encode()
+            + b"\r\n"
+        ]
+        for i, (filename, path) in enumerate(files):
+            segments.append(
+                sep
+                + f'Content-Disposition: form-data; name="files[{i}]"; filename="{filename}"\r\n'.encode()
+                + b"Content-Type: application/octet-stream\r\n"
+                + b"\r\n"
+            )
+            segments.append((path, os.path.getsize(path)))
+            segments.append(b"\r\n")
+        segments.append(f"--{boundary}--\r\n".encode())
+        self._segments = segments
+        self.content_length = sum(
+            len(seg) if isinstance(seg, bytes) else seg[1] for seg in segments
+        )
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __iter__(self) -> Iterator[bytes]:
+        for seg in self._segments:
+            if isinstance(seg, bytes):
+                yield seg
+                continue
+            path, size = seg
+            remaining = size
+            with open(path, "rb") as f:
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        # Content-Length と食い違うため送信を中断する
+                        raise OSError(f"attachment shrank during upload: {path}")
+                    remaining -= len(chunk)
+                    yield chunk
@@ -0,0 +1,118 @@
+"""hooks/lib/ordering.py — チャンネル単位の送信順序（整理券方式）
+
+delivery: "detached" の Stop hook は送信を切り離したワーカーに任せて即座に終了するため、
+連続した応答のワーカーが並行して動いても Discord 上の順序が入れ替わらないよう、
+hook 本体が整理券を取り、ワーカーは自分の番になるまで待ってから送信する。
+
+状態は /tmp/discord-bridge-order-{channelId}.json に flock で排他して保存する。
+
+    {
+      "next": <次に発行する整理券>,
+      "serving": <送信中（または次に送信する）整理券>,
+      "holders": {"<整理券>": [<ワーカーの pid または null>, <発行時刻>]}
+    }
+
+ワーカーが異常終了した整理券（pid が存在しない、または発行から START_GRACE 秒経っても
+ワーカーが開始していない）は飛ばすため、後続の送信が止まり続けることはない。
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+STATE_PATH_TEMPLATE = "/tmp/discord-bridge-order-{channel_id}.json"
+POLL_INTERVAL = 0.05  # 秒
+START_GRACE = 10.0    # 秒（整理券の発行からワーカー開始までの猶予）
+
+T = TypeVar("T")
+
+
+def state_path(channel_id: str) -> str:
+    return STATE_PATH_TEMPLATE.format(channel_id=channel_id)
+
+
+def _update(channel_id: str, mutate: Callable[[dict], T]) -> T:
+    fd = os.open(state_path(channel_id), os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "r+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        raw = f.read()
+        try:
+            state = json.loads(raw) if raw else {}
+        except ValueError:
+            state = {}
+        if not isinstance(state, dict):
+            state = {}
+        state.setdefault("next", 0)
+        state.setdefault("serving", 0)
+        state.setdefault("holders", {})
+        result = mutate(state)
+        f.seek(0)
+        f.truncate()
+        json.dump(state, f)
+        return result
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _skip_abandoned(state: dict, now: float) -> None:
+    """serving の整理券のワーカーが終了済み・未開始のまま猶予切れなら次へ進める。"""
+    holders = state["holders"]
+    while state["serving"] < state["next"]:
+        holder = holders.get(str(state["serving"]))
+        if holder is not None:
+            pid, issued_at = holder
+            if pid is None and now - issued_at < START_GRACE:
+                return
+            if pid is not None and _alive(pid):
+                return
+            del holders[str(state["serving"])]
+        state["serving"] += 1
+
+
+def take_ticket(channel_id: str) -> int:
+    """整理券を発行する（hook 本体で、ワーカーを切り離す前に呼ぶ）。"""
+    def mutate(state: dict) -> int:
+        ticket = state["next"]
+        state["next"] = ticket + 1
+        state["holders"][str(ticket)] = [None, time.time()]
+        return ticket
+    return _update(channel_id, mutate)
+
+
+@contextmanager
+def turn(channel_id: str, ticket: int, sleep: Callable[[float], None] | None = None) -> Iterator[None]:
+    """自分の整理券の番まで待ち、with ブロックの終了時に次の整理券へ進める。"""
+    sleep = sleep or time.sleep
+    pid = os.getpid()
+
+    def register(state: dict) -> None:
+        holder = state["holders"].get(str(ticket))
+        if holder is not None:
+            holder[0] = pid
+
+    def is_my_turn(state: dict) -> bool:
+        _skip_abandoned(state, time.time())
+        return state["serving"] >= ticket
+
+    _update(channel_id, register)
+    while not _update(channel_id, is_my_turn):
+        sleep(POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        def release(state: dict) -> None:
+            state["holders"].pop(str(ticket), None)
+            state["serving"] = max(state["serving"], ticket + 1)
+        _update(channel_id, release)
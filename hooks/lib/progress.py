@@ -0,0 +1,62 @@
+"""hooks/lib/progress.py — 途中経過通知のセッション単位の状態
+
+pre_tool_progress.py と stop.py が共有する状態を状態ストア（hooks/lib/state.py）の
+scope "progress"・キー session_id に保存する。
+
+    {
+      "hash": "<最後に処理した送信コンテンツの MD5>",
+      "channel_id": "<ライブメッセージの送信先>",
+      "message_id": "<ライブメッセージの ID（progressMode: edit のみ）>",
+      "edited_at": <最後に送信・編集した epoch 秒>,
+      "pending": "<デバウンスで保留中のコンテンツ>"
+    }
+
+非同期 hook が並行して動くため、送信を含む更新はセッション単位の lease で排他する。
+"""
+from __future__ import annotations
+
+import urllib.error
+from contextlib import contextmanager
+from typing import Iterator
+
+from lib import state as store
+from lib.discord import edit_message
+
+SCOPE = "progress"
+
+
+def read_state(session_id: str) -> dict:
+    """排他せずに状態を読む（重複判定の早期スキップ用）。"""
+    value, _ = store.get(SCOPE, session_id)
+    return value if isinstance(value, dict) else {}
+
+
+@contextmanager
+def locked_state(session_id: str) -> Iterator[dict]:
+    """状態を排他して読み込み、with ブロック終了時に書き戻す。
+
+    占有を失っていた場合（延長できずに期限切れとなり他の hook が取得した）は書き戻さない。
+    """
+    with store.lease(SCOPE, session_id) as held:
+        state = read_state(session_id)
+        yield state
+        held.write(state or None)
+
+
+def finalize(session_id: str, bot_token: str) -> None:
+    """ターン終了時（Stop hook）に保留中の内容をライブメッセージへ反映し、ライブメッセージを閉じる。
+
+    次のターンの途中経過は新しいメッセージとして送信される。
+    """
+    if not read_state(session_id).keys() - {"hash"}:
+        return  # ライブメッセージなし（重複判定用のハッシュのみ）
+    with locked_state(session_id) as state:
+        message_id = state.pop("message_id", None)
+        channel_id = state.pop("channel_id", None)
+        pending = state.pop("pending", None)
+        state.pop("edited_at", None)
+        if message_id and channel_id and pending:
+            try:
+                edit_message(bot_token, channel_id, message_id, pending)
+            except urllib.error.URLError:
+                pass
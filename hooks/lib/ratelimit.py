@@ -0,0 +1,183 @@
+"""hooks/lib/ratelimit.py — プロセス間で共有する Discord レート制限バケットの追跡
+
+並行して動く hook プロセス（スレッドペインごとの Stop / PreToolUse など）が
+同じレート制限状態を参照できるよう、状態を flock したファイルに保存する。
+各リクエストの前に acquire() で残数を予約し（残数 0 ならリセットまで待機）、
+レスポンス受信後に update() で X-RateLimit-* ヘッダーを反映する。
+
+Discord のグローバル制限とバケットは Bot ごとに独立するため、状態は Bot トークンの
+ハッシュ単位に分けて持つ（ある Bot の 429 で他の servers[] の Bot の送信を待たせない）。
+
+状態ファイルの形式:
+    {
+      "bots": {
+        "<Bot トークンの SHA-1 先頭 12 桁>": {
+          "global_reset_at": <epoch 秒>,
+          "routes": {"POST /channels/{id}/messages": "<bucket hash>"},
+          "buckets": {"<bucket hash>:<major param>": {"remaining": 4, "reset_at": <epoch 秒>}}
+        }
+      }
+    }
+
+状態ファイルの読み書きに失敗した場合はレート制限の事前待機を行わない（送信は妨げない）。
+API の送信先を DISCORD_BRIDGE_API_BASE で変更している場合は、送信先ごとに別の状態ファイルを使う
+（ローカルの負荷試験用サーバーのバケットが Discord への送信を待たせないようにする）。
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+from email.message import Message
+from typing import Callable
+
+STATE_PATH = "/tmp/discord-bridge-ratelimit.json"
+_STATE_PATH_FOR_BASE = "/tmp/discord-bridge-ratelimit-{digest}.json"
+MAX_WAIT = 60.0  # 1回の acquire で待機する最大秒数
+_STALE_AFTER = 60.0  # リセット済みバケットを状態から削除するまでの猶予（秒）
+
+_MAJOR_RE = re.compile(r"^/(?:channels|guilds|webhooks)/(\d+)")
+_ID_RE = re.compile(r"\d{5,}")
+
+
+def route_key(method: str, path: str) -> tuple[str, str]:
+    """(ルートテンプレート, major パラメータ) を返す。バケットは major パラメータ単位で独立する。"""
+    m = _MAJOR_RE.match(path)
+    major = m.group(1) if m else ""
+    return f"{method} {_ID_RE.sub('{id}', path.split('?', 1)[0])}", major
+
+
+def state_path() -> str:
+    api_base = os.environ.get("DISCORD_BRIDGE_API_BASE")  # lib/discord.ENV_API_BASE（循環 import を避けて直接参照）
+    if not api_base:
+        return STATE_PATH
+    digest = hashlib.sha1(api_base.rstrip("/").encode()).hexdigest()[:12]
+    return _STATE_PATH_FOR_BASE.format(digest=digest)
+
+
+def _bot_key(bot_token: str) -> str:
+    return hashlib.sha1(bot_token.encode()).hexdigest()[:12]
+
+
+def _update_state(bot_token: str, mutate: Callable[[dict, float], float]) -> float:
+    """状態ファイルを排他ロックして読み込み、bot_token の状態に mutate(state, now) を適用して書き戻す。"""
+    try:
+        fd = os.open(state_path(), os.O_RDWR | os.O_CREAT, 0o600)
+    except OSError:
+        return 0.0
+    with os.fdopen(fd, "r+") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            raw = f.read()
+            try:
+                state = json.loads(raw) if raw else {}
+            except ValueError:
+                state = {}
+            bots = state.get("bots") if isinstance(state, dict) else None
+            if not isinstance(bots, dict):
+                bots = {}
+            state = {"bots": bots}  # 旧形式（Bot 共通）の状態は捨てる
+            key = _bot_key(bot_token)
+            bot = bots.get(key)
+            if not isinstance(bot, dict):
+                bot = bots[key] = {}
+            now = time.time()
+            result = mutate(bot, now)
+            for key in list(bots):
+                _prune(bots[key], now)
+                if not bots[key]:
+                    del bots[key]  # 送信記録のない Bot
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+            return result
+        except OSError:
+            return 0.0
+
+
+def _prune(state: dict, now: float) -> None:
+    buckets = state.get("buckets", {})
+    for key in [k for k, v in buckets.items() if v.get("reset_at", 0) < now - _STALE_AFTER]:
+        del buckets[key]
+    if state.get("global_reset_at", 0) < now:
+        state.pop("global_reset_at", None)
+
+
+def _reserve(method: str, path: str, bot_token: str) -> float:
+    """送信枠を予約する。待機が必要な場合は予約せずに待機秒数を返す。"""
+    route, major = route_key(method, path)
+
+    def mutate(state: dict, now: float) -> float:
+        wait = state.get("global_reset_at", 0) - now
+        bucket = state.get("routes", {}).get(route)
+        entry = state.get("buckets", {}).get(f"{bucket}:{major}") if bucket else None
+        if entry is not None and entry.get("reset_at", 0) > now:
+            if entry.get("remaining", 1) <= 0:
+                wait = max(wait, entry["reset_at"] - now)
+            elif wait <= 0:
+                # 並行プロセスが同じ残数を使い切らないよう予約分を差し引く
+                entry["remaining"] -= 1
+        return max(wait, 0.0)
+
+    return _update_state(bot_token, mutate)
+
+
+def acquire(method: str, path: str, bot_token: str, sleep: Callable[[float], None] | None = None) -> float:
+    """bot_token で送信可能になるまで待機し、待機した合計秒数を返す。"""
+    sleep = sleep or time.sleep
+    waited = 0.0
+    while waited < MAX_WAIT:
+        wait = _reserve(method, path, bot_token)
+        if wait <= 0:
+            break
+        wait = min(wait, MAX_WAIT - waited)
+        sleep(wait)
+        waited += wait
+    return waited
+
+
+def _header_float(headers: Message, name: str) -> float | None:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def update(method: str, path: str, bot_token: str, status: int, headers: Message) -> None:
+    """レスポンスヘッダー（X-RateLimit-* / Retry-After）を bot_token の共有状態に反映する。"""
+    route, major = route_key(method, path)
+    bucket = headers.get("X-RateLimit-Bucket")
+    remaining = _header_float(headers, "X-RateLimit-Remaining")
+    reset_after = _header_float(headers, "X-RateLimit-Reset-After")
+    retry_after = _header_float(headers, "Retry-After")
+    is_global = (
+        (headers.get("X-RateLimit-Global") or "").lower() == "true"
+        or headers.get("X-RateLimit-Scope") == "global"
+    )
+    if not bucket and status != 429:
+        return
+
+    def mutate(state: dict, now: float) -> float:
+        if status == 429 and is_global:
+            state["global_reset_at"] = now + (retry_after if retry_after is not None else 1.0)
+            return 0.0
+        # バケットヘッダーのない 429 はルート自体をバケットとして扱う
+        key_bucket = bucket or route
+        state.setdefault("routes", {})[route] = key_bucket
+        entry: dict = {}
+        if status == 429:
+            entry["remaining"] = 0
+            entry["reset_at"] = now + (retry_after if retry_after is not None else reset_after or 1.0)
+        else:
+            entry["remaining"] = int(remaining) if remaining is not None else 1
+            entry["reset_at"] = now + (reset_after or 0.0)
+        state.setdefault("buckets", {})[f"{key_bucket}:{major}"] = entry
+        return 0.0
+
+    _update_state(bot_token, mutate)
@@ -0,0 +1,267 @@
+"""hooks/lib/spool.py — Discord 送信の永続キュー（SQLite WAL）
+
+servers[].delivery: "spool" の場合、stop.py は送信内容を ~/.discord-bridge/spool.db に
+書き込むだけで終了し、ネットワーク送信はバックグラウンドのドレイナーが行う。
+
+- 1行 = Discord への1リクエスト（テキスト、または添付付きの multipart メッセージ）
+- ドレイナーは flock で常に1つだけ動き、チャンネルごとに id 順で送信する
+  （先頭のメッセージが再試行待ちの間は、同じチャンネルの後続メッセージを送らない。
+   待機中も WAIT_STEP 秒ごとに他チャンネルの新しい行を送信する）
+- 5xx・通信エラー・429 のリトライ超過は指数バックオフで再試行し、MAX_ATTEMPTS 回で dead にする
+- スレッドが 404 の場合は、そのスレッド宛ての未送信メッセージをまとめて親チャンネルに付け替える
+- それ以外の 4xx と添付ファイルの読み込み失敗（送信前・送信中の消失を含む）は再試行しても成功しないため dead にする
+  （dead の行は調査用に DEAD_RETENTION 秒残す）
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+import urllib.error
+import uuid
+from pathlib import Path
+
+from lib.detach import run_detached
+from lib.discord import post_message, post_multipart
+from lib.multipart import MultipartBody
+from lib.thread import clear_thread_tracking
+
+DB_NAME = "spool.db"
+LOCK_NAME = "spool.lock"
+FILES_DIR_NAME = "spool-files"  # 送信後に削除する添付（offload した応答全文など）の置き場
+BUSY_TIMEOUT = 5.0      # 秒（他プロセスの書き込み中に待つ上限）
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 1.0      # 秒（1, 2, 4, ... と倍増）
+BACKOFF_MAX = 60.0
+DRAIN_MAX_WAIT = 120.0  # 秒（再試行待ちの行しかない場合にドレイナーが待機する上限）
+WAIT_STEP = 0.25        # 秒（再試行待ちの間、新しく追加された行を確認する間隔）
+DEAD_RETENTION = 7 * 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id TEXT NOT NULL,
+    parent_channel_id TEXT,
+    bot_token TEXT NOT NULL,
+    content TEXT NOT NULL,
+    files TEXT NOT NULL DEFAULT '[]',
+    cleanup TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (state, channel_id, id);
+"""
+
+# チャンネルごとの先頭（最も古い未送信）メッセージ
+_HEADS = "SELECT MIN(id) FROM outbox WHERE state = 'pending' GROUP BY channel_id"
+
+
+def _spool_dir() -> Path:
+    return Path.home() / ".discord-bridge"
+
+
+def files_dir() -> str:
+    """送信後に削除する添付ファイルの置き場（cleanup に渡すディレクトリの親）。"""
+    path = _spool_dir() / FILES_DIR_NAME
+    path.mkdir(parents=True, exist_ok=True, mode=0o700)
+    return str(path)
+
+
+def _connect() -> sqlite3.Connection:
+    spool_dir = _spool_dir()
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    path = spool_dir / DB_NAME
+    if not path.exists():
+        # botToken を含むため 0600 で作成する（WAL / SHM ファイルも同じ権限になる）
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+    conn = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def enqueue(
+    bot_token: str,
+    channel_id: str,
+    messages: list[tuple[str, list[tuple[str, str]]]],
+    parent_channel_id: str | None = None,
+    cleanup: str | None = None,
+) -> None:
+    """送信するメッセージ（content, [(添付ファイル名, パス)]）を順にキューへ追加する。
+
+    parent_channel_id はスレッドが 404 の場合の送信先。cleanup はすべての行の送信後
+    （または dead 化後）に削除するディレクトリ。
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO outbox (channel_id, parent_channel_id, bot_token, content, files, cleanup, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (channel_id, parent_channel_id, bot_token, content, json.dumps(files), cleanup, now)
+                    for content, files in messages
+                ],
+            )
+    finally:
+        conn.close()
+
+
+def _unreadable_attachment(row: sqlite3.Row) -> str | None:
+    """読み込めない添付ファイルがあればエラー内容を返す（再試行しても成功しないため dead にする）。"""
+    for _, path in json.loads(row["files"]):
+        try:
+            os.close(os.open(path, os.O_RDONLY))
+        except OSError as e:
+            return str(e)
+    return None
+
+
+def _send(row: sqlite3.Row) -> None:
+    files = [tuple(f) for f in json.loads(row["files"])]
+    if not files:
+        post_message(row["bot_token"], row["channel_id"], row["content"])
+        return
+    body = MultipartBody(uuid.uuid4().hex, row["content"], files)
+    post_multipart(row["bot_token"], row["channel_id"], body.boundary, body, content_length=body.content_length)
+
+
+def _cleanup(conn: sqlite3.Connection, cleanup: str | None) -> None:
+    """cleanup ディレクトリを参照する未送信の行がなくなっていれば削除する。"""
+    if not cleanup:
+        return
+    remaining = conn.execute(
+        "SELECT COUNT(*) FROM outbox WHERE cleanup = ? AND state = 'pending'", (cleanup,)
+    ).fetchone()[0]
+    if not remaining:
+        shutil.rmtree(cleanup, ignore_errors=True)
+
+
+def _mark_dead(conn: sqlite3.Connection, row: sqlite3.Row, error: str) -> None:
+    print(f"[spool] Giving up on message {row['id']} to {row['channel_id']}: {error}", file=sys.stderr)
+    conn.execute("UPDATE outbox SET state = 'dead', last_error = ? WHERE id = ?", (error, row["id"]))
+    _cleanup(conn, row["cleanup"])
+
+
+def _retry_later(conn: sqlite3.Connection, row: sqlite3.Row, error: str) -> None:
+    attempts = row["attempts"] + 1
+    if attempts >= MAX_ATTEMPTS:
+        _mark_dead(conn, row, error)
+        return
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    conn.execute(
+        "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+        (attempts, time.time() + delay, error, row["id"]),
+    )
+
+
+def _deliver(conn: sqlite3.Connection, row: sqlite3.Row) -> bool:
+    """1行を送信し、成功したら削除して True を返す。失敗時は再試行・付け替え・dead のいずれかにする。"""
+    error = _unreadable_attachment(row)
+    if error:
+        _mark_dead(conn, row, error)
+        return False
+    try:
+        _send(row)
+    except urllib.error.HTTPError as e:
+        parent = row["parent_channel_id"]
+        if e.code == 404 and parent and parent != row["channel_id"]:
+            # 同じスレッド宛ての後続メッセージも親チャンネルへ（順序は id のまま）
+            conn.execute(
+                "UPDATE outbox SET channel_id = ? WHERE state = 'pending' AND channel_id = ?",
+                (parent, row["channel_id"]),
+            )
+            clear_thread_tracking(parent, row["channel_id"])
+        elif 400 <= e.code < 500:
+            _mark_dead(conn, row, f"HTTP {e.code}")
+        else:
+            _retry_later(conn, row, f"HTTP {e.code}")
+        return False
+    except urllib.error.URLError as e:
+        # 送信中の添付ファイルの消失も lib/discord では URLError になるため、ファイルを確認し直す
+        error = _unreadable_attachment(row)
+        if error:
+            _mark_dead(conn, row, error)
+        else:
+            _retry_later(conn, row, str(e.reason))
+        return False
+    except OSError as e:
+        _mark_dead(conn, row, str(e))  # 添付ファイルのサイズ取得の失敗など
+        return False
+    conn.execute("DELETE FROM outbox WHERE id = ?", (row["id"],))
+    _cleanup(conn, row["cleanup"])
+    return True
+
+
+def _drain_locked(conn: sqlite3.Connection, max_wait: float) -> int:
+    delivered = 0
+    conn.execute(
+        "DELETE FROM outbox WHERE state = 'dead' AND created_at < ?", (time.time() - DEAD_RETENTION,)
+    )
+    while True:
+        now = time.time()
+        row = conn.execute(
+            f"SELECT * FROM outbox WHERE id IN ({_HEADS}) AND next_attempt_at <= ? ORDER BY id LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is not None:
+            delivered += _deliver(conn, row)
+            continue
+        wake = conn.execute(f"SELECT MIN(next_attempt_at) FROM outbox WHERE id IN ({_HEADS})").fetchone()[0]
+        if wake is None or wake - now > max_wait:
+            return delivered
+        # ロックを持ったまま待つため、他チャンネルに追加された行を WAIT_STEP 秒ごとに確認する
+        # （後から起動したドレイナーはロックを取れずに終了し、このドレイナーが送信する）
+        time.sleep(min(max(wake - now, 0.0), WAIT_STEP))
+
+
+def _has_ready() -> bool:
+    conn = _connect()
+    try:
+        row = conn.execute(
+            f"SELECT 1 FROM outbox WHERE id IN ({_HEADS}) AND next_attempt_at <= ? LIMIT 1", (time.time(),)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def drain(max_wait: float = DRAIN_MAX_WAIT) -> int:
+    """キューのメッセージを送信し、送信できた件数を返す。
+
+    他のドレイナーが動作中なら何もせずに 0 を返す（追加された行はそのドレイナーが拾う）。
+    再試行待ちの行しか残っていない場合は次の再試行時刻まで待つが、max_wait 秒より先なら終了して
+    次回の drain に任せる。
+    """
+    _spool_dir().mkdir(parents=True, exist_ok=True)
+    delivered = 0
+    while True:
+        with open(_spool_dir() / LOCK_NAME, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return delivered
+            conn = _connect()
+            try:
+                delivered += _drain_locked(conn, max_wait)
+            finally:
+                conn.close()
+        # ロック解放の直前に追加された行を取りこぼさないよう、送信可能な行が残っていれば再取得する
+        if not _has_ready():
+            return delivered
+
+
+def spawn_drainer() -> bool:
+    """hook から切り離したプロセスでドレイナーを起動する（起動できなければ False）。"""
+    return run_detached(drain)
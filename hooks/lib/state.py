@@ -0,0 +1,233 @@
+"""hooks/lib/state.py — hooks が共有するセッション単位の状態ストア（SQLite WAL）
+
+Stop hook の重複送信判定や途中経過通知の状態など、hook 同士が共有する小さな状態を
+/tmp/discord-bridge-state.db の1テーブルに (scope, key) 単位で保存する。
+
+- 値は JSON。行ごとに version を持ち、compare_and_set で楽観的に更新できる
+- update は短いトランザクション内で読み書きするため、並行する hook と競合しない
+- ネットワーク I/O をまたぐ排他は lease（期限付きの占有行）で行う。
+  DB の書き込みロックは保持しないため、他のセッションの hook を待たせない。
+  占有中はバックグラウンドのスレッドが期限を延長し続けるため、送信がレート制限の待機で
+  LEASE_TTL を超えても他のプロセスに奪われない。期限は占有したプロセスが異常終了した
+  場合の解放までの時間としてだけ働く
+
+Bot や statusline が書き込むファイル（スレッド追跡・許可応答・Plan 承認フラグ・
+コンテキストキャッシュ）は別プロセスとの受け渡しのため対象外。
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+DB_PATH = "/tmp/discord-bridge-state.db"
+BUSY_TIMEOUT = 5.0      # 秒
+LEASE_TTL = 30.0        # 秒（占有したプロセスが異常終了した場合に解放されるまでの時間）
+LEASE_POLL = 0.05       # 秒
+RETENTION = 7 * 24 * 3600  # prune で削除するまでの未更新期間
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (scope, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS state_updated_at ON state (updated_at);
+"""
+
+T = TypeVar("T")
+
+# fork した子プロセス（hook デーモン・切り離したワーカー）で接続を共有しないよう pid ごとに持つ
+_conn: sqlite3.Connection | None = None
+_conn_pid = 0
+
+
+def _open() -> sqlite3.Connection:
+    if not os.path.exists(DB_PATH):
+        os.close(os.open(DB_PATH, os.O_WRONLY | os.O_CREAT, 0o600))
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn, _conn_pid
+    if _conn is not None and _conn_pid == os.getpid():
+        return _conn
+    conn = _open()
+    _conn, _conn_pid = conn, os.getpid()
+    return conn
+
+
+def close() -> None:
+    """このプロセスの接続を閉じる（テスト・DB パスの切り替え用）。"""
+    global _conn
+    if _conn is not None and _conn_pid == os.getpid():
+        _conn.close()
+    _conn = None
+
+
+def _read(conn: sqlite3.Connection, scope: str, key: str) -> tuple[object, int]:
+    row = conn.execute("SELECT value, version FROM state WHERE scope = ? AND key = ?", (scope, key)).fetchone()
+    if row is None:
+        return None, 0
+    try:
+        return json.loads(row[0]), row[1]
+    except ValueError:
+        return None, row[1]
+
+
+def _write(conn: sqlite3.Connection, scope: str, key: str, value: object, version: int) -> None:
+    if value is None:
+        conn.execute("DELETE FROM state WHERE scope = ? AND key = ?", (scope, key))
+        return
+    conn.execute(
+        "INSERT OR REPLACE INTO state (scope, key, value, version, updated_at) VALUES (?, ?, ?, ?, ?)",
+        (scope, key, json.dumps(value, ensure_ascii=False), version + 1, time.time()),
+    )
+
+
+def get(scope: str, key: str) -> tuple[object, int]:
+    """(値, version) を返す。行がなければ (None, 0)。"""
+    return _read(_connect(), scope, key)
+
+
+def compare_and_set(scope: str, key: str, expected_version: int, value: object) -> bool:
+    """version が expected_version のままなら value を書き込んで True を返す（None は削除）。"""
+    conn = _connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _, version = _read(conn, scope, key)
+        if version != expected_version:
+            return False
+        _write(conn, scope, key, value, version)
+    return True
+
+
+def update(scope: str, key: str, mutate: Callable[[object], tuple[object, T]]) -> T:
+    """mutate(現在の値) -> (新しい値, 戻り値) を1トランザクションで適用する（新しい値が None なら削除）。"""
+    conn = _connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        value, version = _read(conn, scope, key)
+        before = json.dumps(value, ensure_ascii=False)
+        new_value, result = mutate(value)  # mutate は value をその場で書き換えてもよい
+        if json.dumps(new_value, ensure_ascii=False) != before:
+            _write(conn, scope, key, new_value, version)
+    return result
+
+
+def claim(scope: str, key: str, value: object) -> bool:
+    """値を value に置き換える。既に value だった場合は何もせず False を返す（重複処理の判定用）。"""
+    return update(scope, key, lambda current: (value, current != value))
+
+
+class Lease:
+    """lease() が占有中の (scope, key)。"""
+
+    def __init__(self, scope: str, key: str, owner: str, ttl: float) -> None:
+        self.scope = scope
+        self.key = key
+        self.owner = owner
+        self.ttl = ttl
+
+    def _held(self, conn: sqlite3.Connection) -> tuple[dict | None, int]:
+        current, version = _read(conn, f"lease:{self.scope}", self.key)
+        if isinstance(current, dict) and current.get("owner") == self.owner:
+            return current, version
+        return None, version
+
+    def renew(self, conn: sqlite3.Connection | None = None) -> bool:
+        """期限を ttl 秒後まで延長する。既に占有を失っていれば False を返す。"""
+        conn = conn or _connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            current, version = self._held(conn)
+            if current is None:
+                return False
+            current["expires_at"] = time.time() + self.ttl
+            _write(conn, f"lease:{self.scope}", self.key, current, version)
+        return True
+
+    def write(self, value: object) -> bool:
+        """占有を保持している場合に限り (scope, key) の値を value にする（None は削除）。
+
+        占有を失っていれば（期限切れで他のプロセスが取得した）書き込まずに False を返す。
+        """
+        conn = _connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if self._held(conn)[0] is None:
+                return False
+            current, version = _read(conn, self.scope, self.key)
+            if json.dumps(value, ensure_ascii=False) != json.dumps(current, ensure_ascii=False):
+                _write(conn, self.scope, self.key, value, version)
+        return True
+
+
+def _keep_alive(held: Lease, stop: threading.Event, interval: float) -> None:
+    """stop が設定されるまで interval 秒ごとに占有の期限を延長する（スレッドごとに接続を開く）。"""
+    conn = None
+    try:
+        conn = _open()
+        while not stop.wait(interval):
+            if not held.renew(conn):
+                return
+    except sqlite3.Error:
+        pass  # 延長できなければ期限切れまでの占有になる
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@contextmanager
+def lease(
+    scope: str, key: str, ttl: float = LEASE_TTL, sleep: Callable[[float], None] | None = None,
+    renew_interval: float | None = None,
+) -> Iterator[Lease]:
+    """(scope, key) を占有する。他のプロセスが占有中なら解放（または期限切れ）まで待つ。
+
+    占有中は renew_interval 秒（既定は ttl / 3）ごとに期限を延長する。
+    """
+    sleep = sleep or time.sleep
+    lease_scope = f"lease:{scope}"
+    held = Lease(scope, key, uuid.uuid4().hex, ttl)
+
+    def acquire(current: object) -> tuple[object, bool]:
+        now = time.time()
+        if isinstance(current, dict) and current.get("expires_at", 0) > now:
+            return current, False
+        return {"owner": held.owner, "pid": os.getpid(), "expires_at": now + ttl}, True
+
+    while not update(lease_scope, key, acquire):
+        sleep(LEASE_POLL)
+    stop = threading.Event()
+    keeper = threading.Thread(
+        target=_keep_alive, args=(held, stop, renew_interval or ttl / 3), daemon=True,
+    )
+    keeper.start()
+    try:
+        yield held
+    finally:
+        stop.set()
+        keeper.join()
+        update(lease_scope, key, lambda current: (
+            None if isinstance(current, dict) and current.get("owner") == held.owner else current, None,
+        ))
+
+
+def prune(retention: float = RETENTION) -> int:
+    """retention 秒以上更新されていない行を削除し、削除した件数を返す。"""
+    conn = _connect()
+    with conn:
+        return conn.execute("DELETE FROM state WHERE updated_at < ?", (time.time() - retention,)).rowcount
@@ -1,20 +1,19 @@
-"""Markdown テーブル → ASCII テーブル変換（tabulate ベース）"""
+"""Markdown テーブル → ASCII テーブル変換
+
+出力は tabulate(rows, headers=headers, tablefmt="simple") と同じ形式
+（数値列の判定・小数点揃え・wcwidth 相当の東アジア文字幅を含む）だが、外部依存なしで描画する。
+"|" を含まないテキストは走査せずにそのまま返す。
+"""
 from __future__ import annotations
 
+import math
 import re
 
-from tabulate import tabulate
-
-# Markdown テーブル: ヘッダー行 + セパレータ行 + データ行（1行以上）
-_TABLE_RE = re.compile(
-    r"(?m)"
-    r"^(\|.+\|)[ \t]*\n"                     # ヘッダー行
-    r"^(\|[ \t]*:?-{3,}:?[ \t]*(?:\|[ \t]*:?-{3,}:?[ \t]*)*\|)[ \t]*\n"  # セパレータ行
-    r"((?:^\|.+\|[ \t]*\n?)+)",              # データ行
-)
+# Markdown テーブルのセパレータ行（行全体にマッチさせる）
+_SEP_LINE_RE = re.compile(r"\|[ \t]*:?-{3,}:?[ \t]*(?:\|[ \t]*:?-{3,}:?[ \t]*)*\|[ \t]*")
 
-# fenced code block: ``` or ~~~（言語指定付き含む）
-_FENCE_RE = re.compile(r"(?m)^[ \t]*(```|~~~)[^\n]*\n[\s\S]*?^[ \t]*\1[ \t]*$")
+# fenced code block のマーカー（言語指定付きの開始行を含む）
+_FENCE_MARKERS = ("```", "~~~")
 
 
 def _parse_row(line: str) -> list[str]:
@@ -73,30 +72,276 @@ def parse_markdown_table(block: str) -> tuple[list[str], list[list[str]]] | None
     return headers, rows
 
 
+# ---------------------------------------------------------------------------
+# tabulate "simple" 互換レンダラー
+# ---------------------------------------------------------------------------
+
+_MIN_PADDING = 2  # ヘッダー幅に足す最小余白（tabulate の MIN_PADDING）
+_COLUMN_SEP = "  "
+
+# tabulate の _float_with_thousands_separators と同じパターン（"1,234.5" など）
+_THOUSANDS_RE = re.compile(r"^(([+-]?[0-9]{1,3})(?:,([0-9]{3}))*)?(?(1)\.[0-9]*|\.[0-9]+)?$")
+
+# 型の汎用度（tabulate の _more_generic と同じ順序）
+_NONE, _BOOL, _INT, _FLOAT, _STR = range(5)
+
+# VS16（U+FE0F）が付くと全角幅で表示される文字の判定に使う記号カテゴリ
+_VS16_WIDE_CATEGORIES = ("So", "Sm")
+_VS16_WIDE_ASCII = frozenset("#*0123456789")
+
+_char_widths: dict[str, int] = {}
+
+
+def _char_width(c: str) -> int:
+    """1文字の表示幅（wcwidth.wcwidth 相当、制御文字は 0）。"""
+    w = _char_widths.get(c)
+    if w is not None:
+        return w
+    import unicodedata
+
+    cp = ord(c)
+    cat = unicodedata.category(c)
+    if cp == 0x00AD:
+        w = 1  # soft hyphen
+    elif (
+        cat in ("Mn", "Me", "Mc", "Cf", "Cc", "Zl", "Zp")
+        or 0x1160 <= cp <= 0x11FF      # ハングル字母（中声・終声）
+        or 0xD7B0 <= cp <= 0xD7FF      # ハングル字母拡張-B
+        or 0x1F3FB <= cp <= 0x1F3FF    # 肌色修飾子
+    ):
+        w = 0
+    elif unicodedata.east_asian_width(c) in ("W", "F"):
+        w = 2
+    else:
+        w = 1
+    _char_widths[c] = w
+    return w
+
+
+def _display_width(s: str) -> int:
+    """文字列の表示幅（wcwidth.wcswidth 相当）。ZWJ の次の文字と VS16 を考慮する。"""
+    if s.isascii():
+        return len(s)
+    width = 0
+    last = ""
+    i, n = 0, len(s)
+    while i < n:
+        c = s[i]
+        if c == "\u200d":
+            i += 2  # ZWJ と次の文字は幅に数えない
+            continue
+        if c == "\ufe0f" and last:
+            if _char_width(last) == 1 and _vs16_widens(last):
+                width += 1
+            last = ""
+            i += 1
+            continue
+        w = _char_width(c)
+        if w > 0:
+            last = c
+        width += w
+        i += 1
+    return width
+
+
+def _vs16_widens(c: str) -> bool:
+    import unicodedata
+
+    return c in _VS16_WIDE_ASCII or unicodedata.category(c) in _VS16_WIDE_CATEGORIES
+
+
+def _is_int(s: str) -> bool:
+    try:
+        int(s)
+    except ValueError:
+        return False
+    return True
+
+
+def _is_number(s: str) -> bool:
+    """float に変換できる数値か（オーバーフローで inf/nan になるものは除く）。"""
+    try:
+        f = float(s)
+    except ValueError:
+        return False
+    return not (math.isinf(f) or math.isnan(f)) or s.lower() in ("inf", "-inf", "nan")
+
+
+def _cell_type(s: str) -> int:
+    if not s:
+        return _NONE
+    if s in ("True", "False"):
+        return _BOOL
+    if _is_int(s) or ("." not in s and _THOUSANDS_RE.match(s)):
+        return _INT
+    if _is_number(s) or _THOUSANDS_RE.match(s):
+        return _FLOAT
+    return _STR
+
+
+def _format_float(s: str) -> str:
+    if not s:
+        return s
+    try:
+        return format(float(s.replace(",", "")), "g")
+    except ValueError:
+        return s
+
+
+def _after_point(s: str) -> int:
+    """小数点以下の桁数（整数・非数値は -1）。"""
+    if not (_is_number(s) or _THOUSANDS_RE.match(s)) or _is_int(s):
+        return -1
+    pos = s.rfind(".")
+    if pos < 0:
+        pos = s.lower().rfind("e")
+    return len(s) - pos - 1 if pos >= 0 else -1
+
+
+def render_simple_table(headers: list[str], rows: list[list[str]]) -> str:
+    """tabulate(rows, headers=headers, tablefmt="simple") と同じ文字列を返す。
+
+    各行は headers と同じ列数であること（parse_markdown_table の出力を想定）。
+    """
+    columns: list[list[str]] = []
+    numeric: list[bool] = []
+    for col_idx in range(len(headers)):
+        cells = [row[col_idx] for row in rows]
+        col_type = max((_cell_type(c) for c in cells), default=_BOOL)
+        col_type = max(col_type, _BOOL)
+        if col_type == _FLOAT:
+            cells = [_format_float(c) for c in cells]
+        is_numeric = col_type in (_INT, _FLOAT)
+        if is_numeric:
+            # 小数点揃え: 小数部の桁数を右側の空白で揃えてから右寄せする
+            decimals = [_after_point(c) for c in cells]
+            max_decimals = max(decimals)
+            cells = [c + " " * (max_decimals - d) for c, d in zip(cells, decimals)]
+        columns.append(cells)
+        numeric.append(is_numeric)
+
+    widths: list[int] = []
+    aligned_columns: list[list[str]] = []
+    aligned_headers: list[str] = []
+    for header, cells, is_numeric in zip(headers, columns, numeric):
+        cell_widths = [_display_width(c) for c in cells]
+        header_width = _display_width(header)
+        width = max(max(cell_widths, default=0), header_width + _MIN_PADDING)
+        widths.append(width)
+        if is_numeric:
+            aligned_columns.append([
+                " " * (width - w) + c for c, w in zip(cells, cell_widths)
+            ])
+            aligned_headers.append(" " * (width - header_width) + header)
+        else:
+            aligned_columns.append([
+                c + " " * (width - w) for c, w in zip(cells, cell_widths)
+            ])
+            aligned_headers.append(header + " " * (width - header_width))
+
+    lines = [
+        _COLUMN_SEP.join(aligned_headers).rstrip(),
+        _COLUMN_SEP.join("-" * w for w in widths).rstrip(),
+    ]
+    for row in zip(*aligned_columns):
+        lines.append(_COLUMN_SEP.join(row).rstrip())
+    return "\n".join(lines)
+
+
+def _row_end(line: str, require_full: bool) -> int:
+    """テーブル行として扱える範囲の終端位置を返す（該当しなければ -1）。
+
+    行は "|" で始まり、2文字目以降に "|" を含む必要がある。最後の "|" の後ろが空白以外なら
+    require_full では不一致、それ以外は最後の "|" と直後の空白までを行の範囲とする。
+    """
+    if not line.startswith("|"):
+        return -1
+    last = line.rfind("|")
+    if last < 2:
+        return -1
+    end = last + 1
+    while end < len(line) and line[end] in " \t":
+        end += 1
+    if end < len(line) and require_full:
+        return -1
+    return end
+
+
 def convert_tables_in_text(text: str) -> str:
     """テキスト中の Markdown テーブルを ASCII テーブル（コードブロック）に変換する。
 
-    fenced code block（``` / ~~~）内のテーブルは変換しない。
+    fenced code block（``` / ~~~）内のテーブルは変換しない。閉じマーカーのない開始行はコードブロックとして扱わない。
+    行を1回走査してコードブロックの状態とテーブル候補を同時に判定するため、
+    コードブロックの多い数 MB のログでも入力長に比例した時間で処理できる。
     """
-    # fenced code block の範囲を記録
-    fenced_ranges: list[tuple[int, int]] = []
-    for m in _FENCE_RE.finditer(text):
-        fenced_ranges.append((m.start(), m.end()))
+    if "|" not in text:
+        return text
 
-    def _in_fence(start: int, end: int) -> bool:
-        return any(fs <= start and end <= fe for fs, fe in fenced_ranges)
+    lines = text.split("\n")
+    n = len(lines)
 
-    def _replace(m: re.Match) -> str:
-        if _in_fence(m.start(), m.end()):
-            return m.group(0)
+    # マーカーごとの閉じ行候補の最終行。開始行より後ろに閉じ行がなければコードブロックにならない
+    # （未閉じの開始行ごとに末尾まで探索しないためのガード）
+    last_closer = {marker: -1 for marker in _FENCE_MARKERS}
+    for idx, line in enumerate(lines):
+        if line[:1] in (" ", "\t", "`", "~"):
+            stripped = line.strip(" \t")
+            if stripped in last_closer:
+                last_closer[stripped] = idx
+
+    out: list[str] = []
+    copied = 0      # out に書き出し済みの text の位置
+    offset = 0      # lines[i] の先頭位置
+    fence = None    # コードブロック内ならその閉じマーカー
+    i = 0
+    while i < n:
+        line = lines[i]
+        if fence is not None:
+            if line.strip(" \t") == fence:
+                fence = None
+            offset += len(line) + 1
+            i += 1
+            continue
 
-        block = m.group(0)
-        parsed = parse_markdown_table(block)
-        if parsed is None:
-            return block
+        first = line[:1]
+        if first in (" ", "\t", "`", "~"):
+            marker = line.lstrip(" \t")[:3]
+            if marker in last_closer and i < n - 1 and last_closer[marker] > i:
+                fence = marker
+        elif first == "|" and i + 2 < n:
+            # ヘッダー行・セパレータ行（いずれも改行で終わる）+ データ行1行以上
+            table_end = -1
+            if _row_end(line, require_full=True) >= 0 and _SEP_LINE_RE.fullmatch(lines[i + 1]):
+                j = i + 2
+                row_offset = offset + len(line) + len(lines[i + 1]) + 2
+                while j < n:
+                    row = lines[j]
+                    end = _row_end(row, require_full=False)
+                    if end < 0:
+                        break
+                    if end < len(row):
+                        # 行末が "|" で終わらない行はその手前までを最終行とする
+                        table_end = row_offset + end
+                        j += 1
+                        break
+                    table_end = row_offset + len(row) + (1 if j < n - 1 else 0)
+                    row_offset += len(row) + 1
+                    j += 1
+            if table_end >= 0:
+                parsed = parse_markdown_table(text[offset:table_end])
+                if parsed is not None:
+                    out.append(text[copied:offset])
+                    out.append(f"```\n{render_simple_table(*parsed)}\n```")
+                    copied = table_end
+                for skipped in lines[i:j]:
+                    offset += len(skipped) + 1
+                i = j
+                continue
 
-        headers, rows = parsed
-        ascii_table = tabulate(rows, headers=headers, tablefmt="simple")
-        return f"```\n{ascii_table}\n```"
+        offset += len(line) + 1
+        i += 1
 
-    return _TABLE_RE.sub(_replace, text)
+    if not out:
+        return text
+    out.append(text[copied:])
+    return "".join(out)
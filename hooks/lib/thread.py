@@ -31,8 +31,14 @@ def resolve_target_channel(channel_id: str) -> str:
     return thread_id if thread_id else channel_id
 
 
-def clear_thread_tracking(channel_id: str) -> None:
-    """トラッキングファイルを削除する。"""
+def clear_thread_tracking(channel_id: str, thread_id: str | None = None) -> None:
+    """トラッキングファイルを削除する。
+
+    thread_id を指定した場合は、追跡中のスレッドがそれと同じときだけ削除する
+    （404 になったスレッドの後始末で、Bot が書き込んだ新しいスレッドを消さないため）。
+    """
+    if thread_id is not None and get_thread_id(channel_id) != thread_id:
+        return
     path = _tracking_path(channel_id)
     try:
         os.unlink(path)
@@ -0,0 +1,161 @@
+"""hooks/lib/trace.py — hook 実行の区間ごとの所要時間を JSONL に記録する
+
+環境変数 DISCORD_BRIDGE_TRACE=1 のとき、@traced を付けた hook の main() 1回につき1行を
+~/.discord-bridge/trace.jsonl（DISCORD_BRIDGE_TRACE_FILE で変更可）に追記する。
+
+    {"ts": 1767225600.123, "hook": "stop", "pid": 4242, "exit": 0,
+     "startup_ms": 48.0, "total_ms": 812.4,
+     "phases": {"input": 0.2, "config": 1.1, "format": 3.4, "send": 790.2},
+     "counters": {"requests": 2, "bytes_out": 3120, "http_429": 0},
+     "channel_id": "...", "session_id": "..."}
+
+- phases: mark(name) を呼んだ時点までの、直前の mark（または開始）からの経過ミリ秒。
+  同じ名前の区間は合算する
+- startup_ms: main() 開始時点のプロセスの経過時間（インタプリタ起動と import。Linux のみ、
+  分解能はクロック tick）。hook デーモン経由の場合は fork 直後のため 0 に近い
+- counters: add() で加算した値（lib/discord の送信リクエスト数・送信バイト数・429 の回数など）
+
+無効時は mark / add / tag が None 判定だけで戻るため、計測用の呼び出しを残したままでよい。
+"""
+from __future__ import annotations
+
+import functools
+import json
+import os
+import time
+from typing import Callable, TypeVar
+
+ENV_TRACE = "DISCORD_BRIDGE_TRACE"
+ENV_TRACE_FILE = "DISCORD_BRIDGE_TRACE_FILE"
+DEFAULT_TRACE_PATH = os.path.join("~", ".discord-bridge", "trace.jsonl")
+
+F = TypeVar("F", bound=Callable[..., object])
+
+
+class _Invocation:
+    __slots__ = ("hook", "wall", "started", "last", "startup_ms", "phases", "counters", "fields")
+
+    def __init__(self, hook: str) -> None:
+        self.hook = hook
+        self.wall = time.time()
+        self.started = self.last = time.monotonic()
+        self.startup_ms = _process_age_ms()
+        self.phases: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self.fields: dict[str, object] = {}
+
+
+_current: _Invocation | None = None
+
+
+def trace_path() -> str:
+    return os.path.expanduser(os.environ.get(ENV_TRACE_FILE) or DEFAULT_TRACE_PATH)
+
+
+def is_enabled() -> bool:
+    return os.environ.get(ENV_TRACE) == "1"
+
+
+def _process_age_ms() -> float | None:
+    """このプロセスの起動からの経過ミリ秒（/proc が読めなければ None）。"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(max(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 0.0) * 1000, 1)
+
+
+def mark(name: str) -> None:
+    """直前の mark（または開始）から現在までを区間 name として記録する。"""
+    inv = _current
+    if inv is None:
+        return
+    now = time.monotonic()
+    inv.phases[name] = inv.phases.get(name, 0.0) + (now - inv.last) * 1000
+    inv.last = now
+
+
+def add(counter: str, value: int = 1) -> None:
+    inv = _current
+    if inv is None:
+        return
+    inv.counters[counter] = inv.counters.get(counter, 0) + value
+
+
+def tag(**fields: object) -> None:
+    """レコードに付加するフィールド（channel_id など）を設定する。"""
+    inv = _current
+    if inv is None:
+        return
+    inv.fields.update(fields)
+
+
+def begin(hook: str) -> None:
+    global _current
+    _current = _Invocation(hook)
+
+
+def end(exit_code: object = 0) -> None:
+    """計測中のレコードを JSONL に追記する（書き込めなくても hook の処理は妨げない）。"""
+    global _current
+    inv, _current = _current, None
+    if inv is None:
+        return
+    record: dict[str, object] = {
+        "ts": round(inv.wall, 3),
+        "hook": inv.hook,
+        "pid": os.getpid(),
+        "exit": exit_code,
+        "startup_ms": inv.startup_ms,
+        "total_ms": round((time.monotonic() - inv.started) * 1000, 1),
+        "phases": {name: round(ms, 1) for name, ms in inv.phases.items()},
+        "counters": inv.counters,
+    }
+    record.update(inv.fields)
+    path = trace_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 1行を1回の write で追記する（O_APPEND のため並行する hook の行は混ざらない）
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, (json.dumps(record, ensure_ascii=False) + "\n").encode())
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def _exit_code(e: SystemExit) -> object:
+    if e.code is None:
+        return 0
+    return e.code if isinstance(e.code, int) else 1
+
+
+def traced(hook: str) -> Callable[[F], F]:
+    """hook の main() を計測対象にするデコレータ（DISCORD_BRIDGE_TRACE=1 のときのみ記録）。"""
+    def decorator(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: object, **kwargs: object) -> object:
+            global _current
+            if not is_enabled():
+                return fn(*args, **kwargs)
+            outer = _current  # 計測中の hook から呼ばれた場合は終了後に戻す
+            begin(hook)
+            exit_code: object = 0
+            try:
+                return fn(*args, **kwargs)
+            except SystemExit as e:
+                exit_code = _exit_code(e)
+                raise
+            except BaseException as e:
+                exit_code = type(e).__name__
+                raise
+            finally:
+                mark("rest")
+                end(exit_code)
+                _current = outer
+        return wrapper  # type: ignore[return-value]
+    return decorator
@@ -2,8 +2,19 @@
 from __future__ import annotations
 
 import json
-import time
-from pathlib import Path
+import os
+from typing import BinaryIO, Iterable, Iterator
+
+from lib.filewatch import wait_until
+
+_REVERSE_BLOCK_SIZE = 64 * 1024
+WAIT_FOR_CONTENT_TIMEOUT = 1.0  # 秒（wait_for_content の待ち時間の上限）
+
+INDEX_PATH_TEMPLATE = "/tmp/discord-bridge-transcript-{session_id}.json"
+_INDEX_VERSION = 1
+# 境界モード名（tool_result_as_boundary の False / True に対応）
+_MODE_USER = "user"
+_MODE_TOOL_RESULT = "tool_result"
 
 
 def get_assistant_messages(
@@ -11,26 +22,30 @@ def get_assistant_messages(
     max_chars: int = 1500,
     wait_for_content: bool = False,
     tool_result_as_boundary: bool = False,
+    session_id: str = "",
 ) -> list[str]:
     """最後のユーザーメッセージより後にある、テキストを含む全アシスタントメッセージを取得する。
 
     Args:
         transcript_path: transcript ファイルのパス
         max_chars: 各メッセージの最大文字数
-        wait_for_content: True の場合、内容が見つかるまで最大1秒リトライする
-                          （PreToolUse hook 等、transcript 書き込みタイミングが不定な場合に使用）
+        wait_for_content: True の場合、内容が見つかるまで transcript への追記を待って読み直す
+                          （最大 WAIT_FOR_CONTENT_TIMEOUT 秒。PreToolUse hook 等、
+                           transcript 書き込みタイミングが不定な場合に使用）
         tool_result_as_boundary: True の場合、tool_result のみの user エントリも境界として扱う
                                   （同一ターン内で AskUserQuestion が複数回呼ばれる場合に
                                    直前の AQ の回答を境界にして古いテキストの混入を防ぐ）
+        session_id: 指定した場合、セッション単位のオフセットインデックスを使い
+                    前回以降に追記されたバイトのみをパースする
     """
-    attempts = 3 if wait_for_content else 1
-    for attempt in range(attempts):
-        messages = _read_messages(transcript_path, max_chars, tool_result_as_boundary)
-        if messages:
-            return messages
-        if attempt < attempts - 1:
-            time.sleep(0.5)
-    return []
+    def read() -> list[str]:
+        if session_id:
+            return _read_messages_indexed(transcript_path, max_chars, tool_result_as_boundary, session_id)
+        return _read_messages(transcript_path, max_chars, tool_result_as_boundary)
+
+    if not wait_for_content:
+        return read()
+    return wait_until(transcript_path, read, WAIT_FOR_CONTENT_TIMEOUT)
 
 
 def _is_tool_result_only(content: object) -> bool:
@@ -42,57 +57,253 @@ def _is_tool_result_only(content: object) -> bool:
     )
 
 
+def _iter_lines_reverse(f: BinaryIO, end: int | None = None) -> Iterator[tuple[int, bytes]]:
+    """ファイル末尾（または end）からブロック単位で読み、(行頭オフセット, 行) を後ろから順に返す。"""
+    if end is None:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+    pos = end
+    remainder = b""
+    while pos > 0:
+        read_size = min(_REVERSE_BLOCK_SIZE, pos)
+        pos -= read_size
+        f.seek(pos)
+        lines = (f.read(read_size) + remainder).split(b"\n")
+        # 先頭要素は前のブロックに続く可能性があるため次の読み込みまで保留
+        remainder = lines[0]
+        line_end = pos + len(remainder)
+        starts = []
+        for line in lines[1:]:
+            starts.append(line_end + 1)
+            line_end += 1 + len(line)
+        for start, line in zip(reversed(starts), reversed(lines[1:])):
+            yield start, line
+    yield 0, remainder
+
+
+def _decode_entry(raw: bytes) -> dict | None:
+    raw = raw.strip()
+    if not raw:
+        return None
+    try:
+        entry = json.loads(raw)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def _extract_text(entry: dict) -> str:
+    content = entry.get("message", {}).get("content", "")
+    if isinstance(content, list):
+        text = "".join(
+            c.get("text", "")
+            for c in content
+            if isinstance(c, dict) and c.get("type") == "text"
+        )
+    else:
+        text = str(content)
+    return text.strip()
+
+
+def _is_boundary(entry: dict, tool_result_as_boundary: bool) -> bool:
+    entry_type = entry.get("type")
+    # compact 後の summary エントリは境界として扱い、古いメッセージを除外する
+    if entry_type == "summary":
+        return True
+    if entry_type != "user":
+        return False
+    content = entry.get("message", {}).get("content", "")
+    # tool_result_as_boundary=False（Stop hook）: tool_result はスキップして実ユーザー位置を保持
+    # tool_result_as_boundary=True（PreToolUse hook）: tool_result も境界として扱い古いテキストを除外
+    return tool_result_as_boundary or not _is_tool_result_only(content)
+
+
 def _read_messages(
     transcript_path: str, max_chars: int, tool_result_as_boundary: bool
 ) -> list[str]:
-    entries = []
+    """transcript を末尾から走査し、最後の境界より後のアシスタントテキストを返す。
+
+    境界（user / summary）に到達した時点で読み込みを打ち切るため、
+    コストはセッション全体ではなく現在のターンの長さに比例する。
+    """
+    texts: list[str] = []
     try:
-        with open(transcript_path) as f:
-            for line in f:
-                line = line.strip()
-                if not line:
+        with open(transcript_path, "rb") as f:
+            for _, raw in _iter_lines_reverse(f):
+                entry = _decode_entry(raw)
+                if entry is None:
                     continue
-                try:
-                    entries.append(json.loads(line))
-                except json.JSONDecodeError:
+                if _is_boundary(entry, tool_result_as_boundary):
+                    break
+                if entry.get("type") != "assistant":
                     continue
+                text = _extract_text(entry)
+                if text:
+                    texts.append(text)
     except OSError:
         return []
 
-    last_user_pos = -1
-    for i, entry in enumerate(entries):
-        entry_type = entry.get("type")
-        # compact 後の summary エントリは境界として扱い、古いメッセージを除外する
-        if entry_type == "summary":
-            last_user_pos = i
-            continue
-        if entry_type != "user":
-            continue
-        content = entry.get("message", {}).get("content", "")
-        is_tool_result = _is_tool_result_only(content)
-        # tool_result_as_boundary=False（Stop hook）: tool_result はスキップして実ユーザー位置を保持
-        # tool_result_as_boundary=True（PreToolUse hook）: tool_result も境界として扱い古いテキストを除外
-        if is_tool_result and not tool_result_as_boundary:
-            continue
-        last_user_pos = i
+    return _truncate_all(reversed(texts), max_chars)
+
 
+def _truncate_all(texts: Iterable[str], max_chars: int) -> list[str]:
     messages: list[str] = []
-    for entry in entries[last_user_pos + 1:]:
-        if entry.get("type") != "assistant":
+    for text in texts:
+        if len(text) > max_chars:
+            text = text[:max_chars] + "…"
+        messages.append(text)
+    return messages
+
+
+# ---------------------------------------------------------------------------
+# セッション単位のオフセットインデックス
+# ---------------------------------------------------------------------------
+#
+# インデックスには最後にパースした位置（改行で終わる完全な行の末尾）と、
+# 各境界モードについて最後の境界の直後のオフセット・それ以降のアシスタントテキストを保存する。
+# 次回は offset から末尾までの追記分だけをパースすればよい。
+# ファイルの置き換え（inode 変化）・切り詰め・書き換えを検出した場合はフルスキャンで再構築する。
+
+
+def _index_path(session_id: str) -> str:
+    return INDEX_PATH_TEMPLATE.format(session_id=session_id)
+
+
+def _load_index(session_id: str) -> dict | None:
+    try:
+        with open(_index_path(session_id)) as f:
+            index = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not isinstance(index, dict) or index.get("version") != _INDEX_VERSION:
+        return None
+    return index
+
+
+def _save_index(session_id: str, index: dict) -> None:
+    path = _index_path(session_id)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def _index_is_valid(index: dict, st: os.stat_result, f: BinaryIO) -> bool:
+    """インデックスが現在のファイルに対して有効か（置き換え・切り詰め・書き換えがないか）判定する。"""
+    offset = index.get("offset")
+    if index.get("ino") != st.st_ino or index.get("dev") != st.st_dev:
+        return False
+    if not isinstance(offset, int) or offset < 0 or st.st_size < offset:
+        return False
+    if offset == 0:
+        return True
+    # 前回パースした最終行の改行がそのまま残っているか確認する
+    f.seek(offset - 1)
+    return f.read(1) == b"\n"
+
+
+def _empty_turns() -> dict:
+    return {
+        _MODE_USER: {"boundary": 0, "texts": []},
+        _MODE_TOOL_RESULT: {"boundary": 0, "texts": []},
+    }
+
+
+def _apply_entry(turns: dict, entry: dict, line_end: int) -> None:
+    """1エントリを両モードの状態に反映する。line_end は行末（改行の直後）のオフセット。"""
+    if _is_boundary(entry, tool_result_as_boundary=True):
+        turns[_MODE_TOOL_RESULT] = {"boundary": line_end, "texts": []}
+        if _is_boundary(entry, tool_result_as_boundary=False):
+            turns[_MODE_USER] = {"boundary": line_end, "texts": []}
+        return
+    if entry.get("type") != "assistant":
+        return
+    text = _extract_text(entry)
+    if text:
+        turns[_MODE_USER]["texts"].append(text)
+        turns[_MODE_TOOL_RESULT]["texts"].append(text)
+
+
+def _rebuild_turns(f: BinaryIO, end: int) -> dict:
+    """[0, end) を末尾から走査し、実ユーザー境界までのエントリから両モードの状態を構築する。"""
+    collected: list[tuple[dict, int]] = []
+    for start, raw in _iter_lines_reverse(f, end):
+        entry = _decode_entry(raw)
+        if entry is None:
             continue
-        content = entry.get("message", {}).get("content", "")
-        if isinstance(content, list):
-            text = "".join(
-                c.get("text", "")
-                for c in content
-                if isinstance(c, dict) and c.get("type") == "text"
-            )
-        else:
-            text = str(content)
-        text = text.strip()
-        if text:
-            if len(text) > max_chars:
-                text = text[:max_chars] + "…"
-            messages.append(text)
+        collected.append((entry, start + len(raw) + 1))
+        # 実ユーザー境界（summary 含む）は tool_result 境界より常に手前にあるため、ここで打ち切れる
+        if _is_boundary(entry, tool_result_as_boundary=False):
+            break
+    turns = _empty_turns()
+    for entry, line_end in reversed(collected):
+        _apply_entry(turns, entry, line_end)
+    return turns
 
-    return messages
+
+def _read_messages_indexed(
+    transcript_path: str, max_chars: int, tool_result_as_boundary: bool, session_id: str
+) -> list[str]:
+    try:
+        f = open(transcript_path, "rb")
+    except OSError:
+        return []
+    with f:
+        try:
+            st = os.fstat(f.fileno())
+            index = _load_index(session_id)
+            if index is not None and _index_is_valid(index, st, f):
+                offset = index["offset"]
+                turns = index["turns"]
+                rebuilt = False
+            else:
+                offset = 0
+                turns = None
+                rebuilt = True
+
+            f.seek(offset)
+            data = f.read(st.st_size - offset)
+            complete, sep, tail = data.rpartition(b"\n")
+            new_offset = offset + len(complete) + len(sep)
+
+            if turns is None:
+                # 初回・無効化時は追記分ではなく末尾からの逆走査で構築する
+                turns = _rebuild_turns(f, new_offset)
+            elif complete or sep:
+                line_end = offset
+                for raw in complete.split(b"\n"):
+                    line_end += len(raw) + 1
+                    entry = _decode_entry(raw)
+                    if entry is not None:
+                        _apply_entry(turns, entry, line_end)
+        except OSError:
+            return []
+
+    if rebuilt or new_offset != offset:
+        _save_index(session_id, {
+            "version": _INDEX_VERSION,
+            "ino": st.st_ino,
+            "dev": st.st_dev,
+            "size": st.st_size,
+            "offset": new_offset,
+            "turns": turns,
+        })
+
+    mode = _MODE_TOOL_RESULT if tool_result_as_boundary else _MODE_USER
+    texts = list(turns[mode]["texts"])
+    # 改行で終わっていない末尾行は書き込み途中の可能性があるためインデックスには含めず、結果にのみ反映する
+    entry = _decode_entry(tail)
+    if entry is not None:
+        if _is_boundary(entry, tool_result_as_boundary):
+            texts = []
+        elif entry.get("type") == "assistant":
+            text = _extract_text(entry)
+            if text:
+                texts.append(text)
+    return _truncate_all(texts, max_chars)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""PreToolUse hook（統合版）: pre_tool_use.py と pre_tool_progress.py を1プロセスで処理する。
+
+ツール呼び出しごとに2つの hook を起動する代わりに、この hook だけを登録する。
+設定の読み込みとチャンネル解決は1回だけ行い、途中経過の通知は hook から切り離した
+ワーカーで送信する（ボタン送信・応答待ちを遅らせない）。
+ExitPlanMode では transcript を1回だけ読み、プラン概要と途中経過の通知で共有する
+（事前承認済みの場合は transcript を待たずに許可する）。
+"""
+from __future__ import annotations
+
+if __name__ == "__main__":
+    # 常駐 hook デーモンが稼働していれば、重い import の前に入力を転送して終了する
+    import os.path
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from lib.daemon_client import forward_or_continue
+    forward_or_continue("pre_tool")
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from lib.config import load_config, resolve_channel
+from lib.detach import run_detached
+from lib import trace
+import pre_tool_progress
+import pre_tool_use
+
+
+def start_progress(
+    hook_input: dict, config: dict, channel_id: str, bot_token: str, messages: list[str] | None,
+) -> None:
+    """途中経過の通知を切り離したワーカーで送信する。fork できない場合はこのプロセスで送信する。"""
+
+    @trace.traced("pre_tool.progress")
+    def worker() -> None:
+        pre_tool_progress.send_progress(hook_input, config, channel_id, bot_token, messages)
+
+    if run_detached(worker):
+        trace.mark("detach")
+        return
+    worker()
+
+
+@trace.traced("pre_tool")
+def main() -> None:
+    try:
+        hook_input = json.load(sys.stdin)
+    except json.JSONDecodeError as e:
+        print(f"[pre_tool.py] Failed to parse stdin: {e}", file=sys.stderr)
+        sys.exit(1)
+    trace.mark("input")
+
+    tool_name = hook_input.get("tool_name", "")
+
+    try:
+        config = load_config()
+    except (OSError, KeyError, ValueError) as e:
+        print(f"[pre_tool.py] Config error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        channel_id, bot_token, _, permission_tools = resolve_channel(config, hook_input.get("cwd", ""))
+    except ValueError:
+        sys.exit(0)
+    trace.mark("config")
+    trace.tag(channel_id=channel_id, session_id=hook_input.get("session_id", ""), tool=tool_name)
+
+    # AskUserQuestion は質問ボタンに直前テキストを含めるため、途中経過は送らない
+    want_progress = tool_name != "AskUserQuestion" and bool(hook_input.get("transcript_path"))
+    blocking = pre_tool_use.is_blocking_tool(tool_name, permission_tools)
+
+    # Discord 経由で事前承認済みの ExitPlanMode はプラン概要が不要なため、transcript を待たずに許可する
+    # （フラグは確認時に消費されるため handle() より前にここで1回だけ確認する）
+    if tool_name == "ExitPlanMode" and pre_tool_use.check_plan_pre_approved(channel_id):
+        if want_progress:
+            start_progress(hook_input, config, channel_id, bot_token, None)
+        print(pre_tool_use.build_hook_output("allow"))
+        sys.exit(0)
+
+    # ExitPlanMode はプラン概要と途中経過の両方で同じテキストを使うため、先に1回だけ読む
+    messages = None
+    if want_progress and tool_name == "ExitPlanMode":
+        messages = pre_tool_use.read_preceding_messages(hook_input)
+
+    # handle() は sys.exit() で終わることがあるため、途中経過のワーカーを先に起動する
+    if want_progress:
+        start_progress(hook_input, config, channel_id, bot_token, messages)
+
+    if blocking:
+        pre_tool_use.handle(hook_input, channel_id, bot_token, permission_tools, messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,26 +3,40 @@
 
 ツール実行前に発火し、transcript から最新のアシスタントテキストを読み取って
 Discord に進捗通知として送信する。重複送信はハッシュで防止する。
+
+servers[].progressMode が "edit" の場合はターンごとに1件のライブメッセージを
+編集して更新する（編集は progressEditInterval 秒に1回まで、保留分は Stop hook が反映）。
 """
 from __future__ import annotations
 
+if __name__ == "__main__":
+    # 常駐 hook デーモンが稼働していれば、重い import の前に入力を転送して終了する
+    import os.path
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from lib.daemon_client import forward_or_continue
+    forward_or_continue("pre_tool_progress")
+
 import hashlib
 import json
 import os
+import sqlite3
 import sys
 import time
 import urllib.error
-import urllib.request
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
-from lib.config import load_config, resolve_channel
+from lib.config import load_config, resolve_channel, get_server_option
 from lib.thread import resolve_target_channel, clear_thread_tracking
 from lib.transcript import get_assistant_messages
+from lib.discord import post_message, edit_message
+from lib.chunk import truncate
+from lib import progress, trace
 
 DEBUG = os.environ.get("DISCORD_BRIDGE_DEBUG") == "1"
 MAX_CONTENT = 1900
-SENT_HASH_DIR = "/tmp"
+DEFAULT_EDIT_INTERVAL = 5.0  # 秒（progressMode: edit の編集間隔）
 _RATE_LIMIT_MAX_RETRIES = 2
 
 
@@ -32,112 +46,154 @@ def _dbg(msg: str) -> None:
             f.write(f"[progress] {msg}\n")
 
 
-def _sent_hash_path(session_id: str) -> Path:
-    return Path(f"{SENT_HASH_DIR}/discord-bridge-progress-{session_id}.txt")
+def _send_message(bot_token: str, channel_id: str, content: str) -> dict | None:
+    return post_message(bot_token, channel_id, content, max_retries=_RATE_LIMIT_MAX_RETRIES)
 
 
-def _get_sent_hash(session_id: str) -> str:
-    try:
-        return _sent_hash_path(session_id).read_text().strip()
-    except OSError:
-        return ""
-
-
-def _save_sent_hash(session_id: str, text_hash: str) -> None:
-    _sent_hash_path(session_id).write_text(text_hash)
-
-
-def _send_message(bot_token: str, channel_id: str, content: str) -> None:
-    payload = json.dumps({"content": content}).encode()
-    url = f"https://discord.com/api/v10/channels/{channel_id}/messages"
-    req = urllib.request.Request(
-        url,
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bot {bot_token}",
-            "User-Agent": "DiscordBot (discord-bridge, 1.0.0)",
-        },
-        method="POST",
-    )
-    for attempt in range(_RATE_LIMIT_MAX_RETRIES):
-        try:
-            urllib.request.urlopen(req, timeout=10).close()
-            return
-        except urllib.error.HTTPError as e:
-            if e.code == 429:
-                retry_after = float(e.headers.get("Retry-After", "1"))
-                _dbg(f"rate limited, waiting {retry_after}s (attempt {attempt + 1})")
-                time.sleep(retry_after)
-                continue
-            raise
-    raise urllib.error.URLError("Rate limit retries exhausted")
+def _edit_message(bot_token: str, channel_id: str, message_id: str, content: str) -> None:
+    edit_message(bot_token, channel_id, message_id, content, max_retries=_RATE_LIMIT_MAX_RETRIES)
+
 
+def _deliver(
+    state: dict, bot_token: str, channel_id: str, content: str, mode: str, interval: float,
+) -> str:
+    """progressMode に応じて送信・編集・保留のいずれかを行い、行った処理名を返す。"""
+    if mode != "edit":
+        _send_message(bot_token, channel_id, content)
+        return "posted"
 
+    now = time.time()
+    live = bool(state.get("message_id")) and state.get("channel_id") == channel_id
+    if live and now - state.get("edited_at", 0) < interval:
+        state["pending"] = content
+        return "deferred"
+    if live:
+        try:
+            _edit_message(bot_token, channel_id, state["message_id"], content)
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                raise
+            live = False  # ライブメッセージが削除されていれば新規送信
+    if not live:
+        resp = _send_message(bot_token, channel_id, content)
+        state["message_id"] = (resp or {}).get("id")
+        state["channel_id"] = channel_id
+    state["edited_at"] = now
+    state.pop("pending", None)
+    return "edited" if live else "posted"
+
+
+@trace.traced("pre_tool_progress")
 def main() -> None:
     try:
         hook_input = json.load(sys.stdin)
     except json.JSONDecodeError:
         sys.exit(0)
-
-    tool_name = hook_input.get("tool_name", "")
+    trace.mark("input")
 
     # AskUserQuestion / permissionTools は既存 pre_tool_use.py が処理
-    if tool_name == "AskUserQuestion":
+    if hook_input.get("tool_name", "") == "AskUserQuestion":
         _dbg("skip: AskUserQuestion")
         sys.exit(0)
 
-    transcript_path = hook_input.get("transcript_path", "")
-    session_id = hook_input.get("session_id", "unknown")
-    cwd = hook_input.get("cwd", "")
+    if not hook_input.get("transcript_path", ""):
+        sys.exit(0)
 
-    if not transcript_path:
+    # 設定読み込み
+    try:
+        config = load_config()
+        channel_id, bot_token, _, _ = resolve_channel(config, hook_input.get("cwd", ""))
+    except (OSError, KeyError, ValueError) as e:
+        _dbg(f"config error: {e}")
         sys.exit(0)
+    trace.mark("config")
+
+    send_progress(hook_input, config, channel_id, bot_token)
+
+
+def send_progress(
+    hook_input: dict,
+    config: dict,
+    channel_id: str,
+    bot_token: str,
+    messages: list[str] | None = None,
+) -> None:
+    """最新のアシスタントテキストを進捗通知として送信する（重複・保留の判定を含む）。
+
+    messages を渡した場合は transcript を読まずにそれを使う
+    （統合 hook の pre_tool.py が pre_tool_use.py と共有する）。
+    """
+    tool_name = hook_input.get("tool_name", "")
+    session_id = hook_input.get("session_id", "unknown")
 
     # transcript から最新アシスタントテキストを取得
-    messages = get_assistant_messages(
-        transcript_path, wait_for_content=True, tool_result_as_boundary=True
-    )
+    if messages is None:
+        messages = get_assistant_messages(
+            hook_input.get("transcript_path", ""), wait_for_content=True, tool_result_as_boundary=True,
+            session_id=hook_input.get("session_id", ""),
+        )
+        trace.mark("transcript")
     if not messages:
         _dbg("skip: no assistant text in transcript")
-        sys.exit(0)
+        return
 
     text = "\n\n".join(messages)
 
     # Discord へ送信するコンテンツを先に組み立てる
-    content = text[:MAX_CONTENT]
-    if len(text) > MAX_CONTENT:
-        content += "…"
-    content = f"🔄 {content}"
+    content = f"🔄 {truncate(text, MAX_CONTENT)}"
 
     # 重複送信防止（送信コンテンツのハッシュで判定）
     content_hash = hashlib.md5(content.encode()).hexdigest()
-    if content_hash == _get_sent_hash(session_id):
-        _dbg(f"skip: duplicate hash {content_hash[:8]}")
-        sys.exit(0)
-
-    # 設定読み込み
     try:
-        config = load_config()
-        channel_id, bot_token, _, _ = resolve_channel(config, cwd)
-    except (OSError, KeyError, ValueError) as e:
-        _dbg(f"config error: {e}")
-        sys.exit(0)
+        sent_hash = progress.read_state(session_id).get("hash")
+    except (sqlite3.Error, OSError) as e:
+        _dbg(f"state read failed: {e}")
+        sent_hash = None
+    if content_hash == sent_hash:
+        _dbg(f"skip: duplicate hash {content_hash[:8]}")
+        return
+    trace.mark("dedup")
 
+    mode = get_server_option(config, bot_token, "progressMode", "post")
+    interval = float(get_server_option(config, bot_token, "progressEditInterval", DEFAULT_EDIT_INTERVAL))
     target_channel = resolve_target_channel(channel_id)
+    trace.tag(channel_id=channel_id, session_id=session_id, tool=tool_name)
 
-    _dbg(f"sending: {content[:60]!r} -> {target_channel}")
+    _dbg(f"sending: {content[:60]!r} -> {target_channel} (mode={mode})")
+    sent = False
     try:
-        _send_message(bot_token, target_channel, content)
-        _save_sent_hash(session_id, content_hash)
-        _dbg("sent OK")
+        with progress.locked_state(session_id) as state:
+            trace.mark("lock")
+            if content_hash == state.get("hash"):
+                _dbg(f"skip: duplicate hash {content_hash[:8]}")
+                return
+            sent = True
+            _send_with_fallback(state, bot_token, channel_id, target_channel, content, content_hash, mode, interval)
+    except (sqlite3.Error, OSError) as e:
+        # 状態ストアが使えない（DB を開けない・ロック待ちのタイムアウト）場合は重複判定なしで送信する
+        _dbg(f"state store error: {e}")
+        if not sent:
+            _send_with_fallback({}, bot_token, channel_id, target_channel, content, content_hash, mode, interval)
+    trace.mark("send")
+
+
+def _send_with_fallback(
+    state: dict, bot_token: str, channel_id: str, target_channel: str,
+    content: str, content_hash: str, mode: str, interval: float,
+) -> None:
+    """target_channel へ送信し、スレッドが削除されていれば（404）親チャンネルへ送信する。失敗は記録のみ。"""
+    try:
+        action = _deliver(state, bot_token, target_channel, content, mode, interval)
+        state["hash"] = content_hash
+        trace.tag(action=action)
+        _dbg(f"{action} OK")
     except urllib.error.HTTPError as e:
         if e.code == 404 and target_channel != channel_id:
             _dbg(f"thread 404, fallback to {channel_id}")
-            clear_thread_tracking(channel_id)
+            clear_thread_tracking(channel_id, target_channel)
             try:
-                _send_message(bot_token, channel_id, content)
-                _save_sent_hash(session_id, content_hash)
+                _deliver(state, bot_token, channel_id, content, mode, interval)
+                state["hash"] = content_hash
             except Exception as e2:
                 _dbg(f"fallback failed: {e2}")
         else:
@@ -145,6 +201,5 @@ def main() -> None:
     except Exception as e:
         _dbg(f"send failed: {e}")
 
-
 if __name__ == "__main__":
     main()
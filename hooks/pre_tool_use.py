@@ -2,10 +2,20 @@
 """PreToolUse hook: AskUserQuestion / ExitPlanMode / permissionTools を Discord ボタンに変換する"""
 from __future__ import annotations
 
+if __name__ == "__main__":
+    # 常駐 hook デーモンが稼働していれば、重い import の前に入力を転送して終了する
+    import os.path
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from lib.daemon_client import forward_or_continue
+    forward_or_continue("pre_tool_use")
+
 import json
+import os
+import select
+import socket
 import sys
 import time
-import urllib.request
 import urllib.error
 from pathlib import Path
 
@@ -13,15 +23,21 @@ sys.path.insert(0, str(Path(__file__).parent))
 from lib.config import load_config, resolve_channel
 from lib.thread import resolve_target_channel, clear_thread_tracking
 from lib.transcript import get_assistant_messages
+from lib.discord import post_message
+from lib.chunk import truncate
+from lib import trace
 
 DISCORD_MAX_CONTENT = 1900  # Discord の 2000 文字制限に余裕をもたせた上限
 
 PERM_RESPONSE_DIR = "/tmp"
-PERM_POLL_INTERVAL = 1.0  # 秒
+PERM_POLL_INTERVAL = 1.0  # 秒（通知ソケットが使えない場合のフォールバック間隔）
 PERM_TIMEOUT = 120  # 秒
 
 PLAN_APPROVED_DIR = "/tmp"  # Discord経由の事前承認フラグ置き場
 
+# ボタンを送信してツール実行を止める（または応答を待つ）ツール。それ以外は素通り
+QUESTION_TOOLS = ("AskUserQuestion", "ExitPlanMode")
+
 
 def format_tool_info(tool_name: str, tool_input: dict) -> str:
     """ツール名と入力を人間が読めるサマリーにする。"""
@@ -47,39 +63,97 @@ def post_permission_buttons(bot_token: str, channel_id: str, content: str) -> No
             {"type": 2, "style": 2, "label": "Other", "custom_id": "perm:other"},
         ],
     }]
-    payload = json.dumps({"content": content, "components": components}).encode()
-    url = f"https://discord.com/api/v10/channels/{channel_id}/messages"
-    req = urllib.request.Request(
-        url,
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bot {bot_token}",
-            "User-Agent": "DiscordBot (discord-bridge, 1.0.0)",
-        },
-        method="POST",
-    )
+    post_buttons(bot_token, channel_id, content, components)
+
+
+def _open_wake_socket(path: str) -> socket.socket | None:
+    """bot からの応答通知を受ける Unix ソケットを開く。失敗時は None（ポーリングのみで待機）。"""
     try:
-        urllib.request.urlopen(req, timeout=10).close()
-    except urllib.error.HTTPError as e:
-        print(f"[pre_tool_use.py] API error: {e.code} {e.reason}", file=sys.stderr)
-        raise
-
-
-def wait_for_permission(channel_id: str) -> dict | None:
-    """応答ファイルをポーリングし、結果を返す。タイムアウトで None。"""
-    resp_file = Path(f"{PERM_RESPONSE_DIR}/discord-bridge-perm-{channel_id}.json")
-    resp_file.unlink(missing_ok=True)  # 古い応答をクリア
-    for _ in range(int(PERM_TIMEOUT / PERM_POLL_INTERVAL)):
-        time.sleep(PERM_POLL_INTERVAL)
-        if resp_file.exists():
-            try:
-                data = json.loads(resp_file.read_text())
-            except (json.JSONDecodeError, OSError):
-                continue
-            resp_file.unlink(missing_ok=True)
-            return data
-    return None
+        os.unlink(path)
+    except OSError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        sock.listen(4)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def _drain_wake_socket(sock: socket.socket) -> None:
+    """通知の接続を受け付けて閉じる（内容は読まない）。"""
+    while True:
+        try:
+            conn, _ = sock.accept()
+        except OSError:
+            return
+        conn.close()
+
+
+def _read_response(resp_file: Path) -> dict | None:
+    try:
+        data = json.loads(resp_file.read_text())
+    except (json.JSONDecodeError, OSError):
+        return None
+    resp_file.unlink(missing_ok=True)
+    return data
+
+
+class PermissionWait:
+    """許可応答の待ち受け（応答ファイルと通知ソケット）。
+
+    ボタンを送信する前に作成する。送信直後にクリックされても、応答ファイルを
+    古い応答として消したり、通知ソケットへの接続を取りこぼしたりしない。
+    """
+
+    def __init__(self, channel_id: str) -> None:
+        self.resp_file = Path(f"{PERM_RESPONSE_DIR}/discord-bridge-perm-{channel_id}.json")
+        self.sock_path = f"{PERM_RESPONSE_DIR}/discord-bridge-perm-{channel_id}.sock"
+        self.resp_file.unlink(missing_ok=True)  # 古い応答をクリア
+        self.wake = _open_wake_socket(self.sock_path)
+
+    def close(self) -> None:
+        if self.wake is None:
+            return
+        self.wake.close()
+        self.wake = None
+        try:
+            os.unlink(self.sock_path)
+        except OSError:
+            pass
+
+
+def wait_for_permission(channel_id: str, waiter: PermissionWait | None = None) -> dict | None:
+    """応答ファイルを待ち、結果を返す。タイムアウトで None。
+
+    bot は応答ファイルを書き込んだ直後に通知ソケット（.sock）へ接続するため、
+    通常はクリック直後に起床する。通知が届かない場合も PERM_POLL_INTERVAL ごとにファイルを確認する。
+    waiter にはボタン送信前に作成した PermissionWait を渡す（省略時はここで作成する）。
+    """
+    if waiter is None:
+        waiter = PermissionWait(channel_id)
+    deadline = time.monotonic() + PERM_TIMEOUT
+    try:
+        while True:
+            # 送信中にクリックされていればすでに応答ファイルがあるため、待つ前に確認する
+            data = _read_response(waiter.resp_file)
+            if data is not None:
+                return data
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            timeout = min(PERM_POLL_INTERVAL, remaining)
+            if waiter.wake is not None:
+                ready, _, _ = select.select([waiter.wake], [], [], timeout)
+                if ready:
+                    _drain_wake_socket(waiter.wake)
+            else:
+                time.sleep(timeout)
+    finally:
+        waiter.close()
 
 
 def post_plan_buttons(bot_token: str, channel_id: str, content: str) -> None:
@@ -95,32 +169,19 @@ def post_plan_buttons(bot_token: str, channel_id: str, content: str) -> None:
 
 
 def check_plan_pre_approved(channel_id: str) -> bool:
-    """Discord経由の事前承認フラグが存在するかチェックし、あれば削除して True を返す。"""
-    flag = Path(f"{PLAN_APPROVED_DIR}/discord-bridge-plan-approved-{channel_id}")
-    if flag.exists():
-        flag.unlink(missing_ok=True)
-        return True
-    return False
+    """Discord経由の事前承認フラグが存在するかチェックし、あれば削除して True を返す。
+
+    削除に成功したプロセスだけが True を返すため、同時に呼ばれてもフラグは1回しか使われない。
+    """
+    try:
+        Path(f"{PLAN_APPROVED_DIR}/discord-bridge-plan-approved-{channel_id}").unlink()
+    except FileNotFoundError:
+        return False
+    return True
 
 
 def post_buttons(bot_token: str, channel_id: str, content: str, components: list) -> None:
-    payload = json.dumps({"content": content, "components": components}).encode()
-    url = f"https://discord.com/api/v10/channels/{channel_id}/messages"
-    req = urllib.request.Request(
-        url,
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bot {bot_token}",
-            "User-Agent": "DiscordBot (discord-bridge, 1.0.0)",
-        },
-        method="POST",
-    )
-    try:
-        urllib.request.urlopen(req, timeout=10).close()
-    except urllib.error.HTTPError as e:
-        print(f"[pre_tool_use.py] API error: {e.code} {e.reason}", file=sys.stderr)
-        raise
+    post_message(bot_token, channel_id, content, components=components)
 
 
 def build_components(questions: list) -> list:
@@ -165,8 +226,7 @@ def build_content(preceding_text: str, question_text: str, options: list | None
         if option_lines:
             question_part += "\n" + "\n".join(option_lines)
     # question_part 自体が上限を超える場合は切り詰め
-    if len(question_part) > DISCORD_MAX_CONTENT:
-        question_part = question_part[:DISCORD_MAX_CONTENT - 1] + "…"
+    question_part = truncate(question_part, DISCORD_MAX_CONTENT)
     if not preceding_text:
         return question_part
     # 合計が上限を超える場合は直前テキストを切り詰める
@@ -174,8 +234,7 @@ def build_content(preceding_text: str, question_text: str, options: list | None
     if max_preceding <= 0:
         # question 自体が長すぎる場合は preceding_text を省略
         return question_part
-    if len(preceding_text) > max_preceding:
-        preceding_text = preceding_text[:max_preceding] + "…"
+    preceding_text = truncate(preceding_text, max_preceding)
     return f"{preceding_text}\n\n{question_part}"
 
 
@@ -198,17 +257,32 @@ def build_hook_output(
     return json.dumps(output)
 
 
+def is_blocking_tool(tool_name: str, permission_tools: list[str]) -> bool:
+    """この hook がボタンを送信するツールかどうか。"""
+    return tool_name in QUESTION_TOOLS or tool_name in permission_tools
+
+
+def read_preceding_messages(hook_input: dict) -> list[str]:
+    """transcript から直前のアシスタントテキストを取得する（transcript がなければ空）。"""
+    transcript_path = hook_input.get("transcript_path", "")
+    if not transcript_path:
+        return []
+    messages = get_assistant_messages(
+        transcript_path, wait_for_content=True, tool_result_as_boundary=True,
+        session_id=hook_input.get("session_id", ""),
+    )
+    trace.mark("transcript")
+    return messages
+
+
+@trace.traced("pre_tool_use")
 def main() -> None:
     try:
         hook_input = json.load(sys.stdin)
     except json.JSONDecodeError as e:
         print(f"[pre_tool_use.py] Failed to parse stdin: {e}", file=sys.stderr)
         sys.exit(1)
-
-    tool_name = hook_input.get("tool_name", "")
-    tool_input = hook_input.get("tool_input", {})
-    cwd = hook_input.get("cwd", "")
-    transcript_path = hook_input.get("transcript_path", "")
+    trace.mark("input")
 
     try:
         config = load_config()
@@ -217,11 +291,32 @@ def main() -> None:
         sys.exit(1)
 
     try:
-        channel_id, bot_token, _, permission_tools = resolve_channel(config, cwd)
+        channel_id, bot_token, _, permission_tools = resolve_channel(config, hook_input.get("cwd", ""))
     except ValueError:
         sys.exit(0)
 
+    handle(hook_input, channel_id, bot_token, permission_tools)
+
+
+def handle(
+    hook_input: dict,
+    channel_id: str,
+    bot_token: str,
+    permission_tools: list[str],
+    messages: list[str] | None = None,
+) -> None:
+    """ツールに応じてボタンを送信し、hook の出力（許可・拒否）を stdout に書く。
+
+    messages を渡した場合は transcript を読まずに直前のテキストとして使う
+    （統合 hook の pre_tool.py が途中経過通知と共有する）。
+    """
+    tool_name = hook_input.get("tool_name", "")
+    tool_input = hook_input.get("tool_input", {})
+    session_id = hook_input.get("session_id", "")
+
     target_channel = resolve_target_channel(channel_id)
+    trace.mark("config")
+    trace.tag(channel_id=channel_id, session_id=session_id, tool=tool_name)
 
     # AskUserQuestion 処理
     if tool_name == "AskUserQuestion":
@@ -233,11 +328,9 @@ def main() -> None:
             print(f"[pre_tool_use.py] Warning: {len(questions) - 1} question(s) ignored (only first is supported)", file=sys.stderr)
 
         # transcript から直前のアシスタントテキストを取得（AskUserQuestion 呼び出し前の説明文など）
-        preceding_text = ""
-        if transcript_path:
-            messages = get_assistant_messages(transcript_path, wait_for_content=True, tool_result_as_boundary=True)
-            if messages:
-                preceding_text = "\n\n".join(messages)
+        if messages is None:
+            messages = read_preceding_messages(hook_input)
+        preceding_text = "\n\n".join(messages)
 
         question_text = questions[0].get("question", "(no question)")
         options = questions[0].get("options", [])[:5]
@@ -251,7 +344,7 @@ def main() -> None:
             post_buttons(bot_token, target_channel, content, components)
         except urllib.error.HTTPError as e:
             if e.code == 404 and target_channel != channel_id:
-                clear_thread_tracking(channel_id)
+                clear_thread_tracking(channel_id, target_channel)
                 try:
                     post_buttons(bot_token, channel_id, content, components)
                 except urllib.error.URLError as e2:
@@ -264,6 +357,8 @@ def main() -> None:
             print(f"[pre_tool_use.py] API request failed: {e}", file=sys.stderr)
             sys.exit(1)
 
+        trace.mark("send")
+
         # ツールをブロックして Claude に Discord 待機を伝える
         print(build_hook_output(
             "deny",
@@ -278,23 +373,14 @@ def main() -> None:
             print(build_hook_output("allow"))
             sys.exit(0)
 
-        # 古いフラグが残存していた場合に備えてクリア
-        Path(f"{PLAN_APPROVED_DIR}/discord-bridge-plan-approved-{channel_id}").unlink(missing_ok=True)
-
         # transcript から直前テキスト（プラン概要）を取得
-        preceding_text = ""
-        if transcript_path:
-            messages = get_assistant_messages(
-                transcript_path, wait_for_content=True, tool_result_as_boundary=True,
-            )
-            if messages:
-                preceding_text = "\n\n".join(messages)
+        if messages is None:
+            messages = read_preceding_messages(hook_input)
+        preceding_text = "\n\n".join(messages)
 
         header = "📋 **Plan approval requested**"
         if preceding_text:
-            max_plan = DISCORD_MAX_CONTENT - len(header) - 2
-            if len(preceding_text) > max_plan:
-                preceding_text = preceding_text[:max_plan] + "…"
+            preceding_text = truncate(preceding_text, DISCORD_MAX_CONTENT - len(header) - 2)
             content = f"{preceding_text}\n\n{header}"
         else:
             content = header
@@ -303,7 +389,7 @@ def main() -> None:
             post_plan_buttons(bot_token, target_channel, content)
         except urllib.error.HTTPError as e:
             if e.code == 404 and target_channel != channel_id:
-                clear_thread_tracking(channel_id)
+                clear_thread_tracking(channel_id, target_channel)
                 try:
                     post_plan_buttons(bot_token, channel_id, content)
                 except urllib.error.URLError:
@@ -313,6 +399,8 @@ def main() -> None:
         except urllib.error.URLError:
             sys.exit(0)
 
+        trace.mark("send")
+
         # AskUserQuestion と同じ方式: deny して Discord からの tmux 応答を待つ
         print(build_hook_output(
             "deny",
@@ -325,24 +413,32 @@ def main() -> None:
         info = format_tool_info(tool_name, tool_input)
         content = f"\U0001f510 Tool permission\n{info}"
 
+        # IPC ファイルは親チャンネルIDベース（bot.ts が threadParentMap で親IDに解決するため）
+        # 送信直後のクリックを取りこぼさないよう、ボタン送信の前に待ち受けを開始する
+        waiter = PermissionWait(channel_id)
         try:
-            post_permission_buttons(bot_token, target_channel, content)
-        except urllib.error.HTTPError as e:
-            if e.code == 404 and target_channel != channel_id:
-                clear_thread_tracking(channel_id)
-                try:
-                    post_permission_buttons(bot_token, channel_id, content)
-                except urllib.error.URLError:
+            try:
+                post_permission_buttons(bot_token, target_channel, content)
+            except urllib.error.HTTPError as e:
+                if e.code == 404 and target_channel != channel_id:
+                    clear_thread_tracking(channel_id, target_channel)
+                    try:
+                        post_permission_buttons(bot_token, channel_id, content)
+                    except urllib.error.URLError:
+                        sys.exit(0)
+                else:
+                    print(f"[pre_tool_use.py] API request failed: {e}", file=sys.stderr)
                     sys.exit(0)
-            else:
+            except urllib.error.URLError as e:
                 print(f"[pre_tool_use.py] API request failed: {e}", file=sys.stderr)
-                sys.exit(0)
-        except urllib.error.URLError as e:
-            print(f"[pre_tool_use.py] API request failed: {e}", file=sys.stderr)
-            sys.exit(0)  # 送信失敗時は Claude Code デフォルトに委ねる
+                sys.exit(0)  # 送信失敗時は Claude Code デフォルトに委ねる
 
-        # IPC ファイルは親チャンネルIDベース（bot.ts が threadParentMap で親IDに解決するため）
-        result = wait_for_permission(channel_id)
+            trace.mark("send")
+
+            result = wait_for_permission(channel_id, waiter)
+            trace.mark("wait_permission")
+        finally:
+            waiter.close()
         if result is None:
             sys.exit(0)  # タイムアウト → Claude Code デフォルト
 
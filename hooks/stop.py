@@ -2,22 +2,41 @@
 """Stop hook: last_assistant_messageをDiscordに送信する"""
 from __future__ import annotations
 
+if __name__ == "__main__":
+    # 常駐 hook デーモンが稼働していれば、重い import の前に入力を転送して終了する
+    import os.path
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from lib.daemon_client import forward_or_continue
+    forward_or_continue("stop")
+
+import gzip
 import json
 import os
 import re
+import shutil
+import sqlite3
 import sys
-import time
+import tempfile
 import uuid
-import urllib.request
 import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
+from typing import Iterator
 
 sys.path.insert(0, str(Path(__file__).parent))
-from lib.config import load_config, resolve_channel
+from lib.config import load_config, resolve_channel, get_server_option
 from lib.thread import resolve_target_channel, clear_thread_tracking
 from lib.transcript import get_assistant_messages
+from lib.filewatch import wait_until
 from lib.context import format_footer, read_full_cache, CACHE_PATH_TEMPLATE
 from lib.table import convert_tables_in_text
+from lib.chunk import split_message, truncate
+from lib.discord import post_message, post_multipart
+from lib.multipart import MultipartBody
+from lib import ordering, progress, spool, state, trace
+from lib.detach import run_detached
 
 DEBUG = os.environ.get("DISCORD_BRIDGE_DEBUG") == "1"
 _DEBUG_FILE = "/tmp/discord-bridge-debug.txt"
@@ -35,6 +54,13 @@ def _dbg(msg: str) -> None:
 ATTACH_PATTERN = re.compile(r'\[DISCORD_ATTACH:\s*([^\]]+)\]')
 ATTACH_ALLOWED_DIR = "/tmp/discord-bridge-outputs"
 DISCORD_MAX_FILE_BYTES = 25 * 1024 * 1024  # 25 MB
+DISCORD_MAX_FILES_PER_MESSAGE = 10
+DISCORD_MAX_MESSAGE_BYTES = 25 * 1024 * 1024  # 1メッセージあたりの添付合計
+UPLOAD_MAX_WORKERS = 4  # 2通目以降の添付メッセージを並列送信する数
+OFFLOAD_EXCERPT_CHARS = 1500  # 応答を添付に切り替えた場合に本文へ残す先頭部分の文字数
+OFFLOAD_FILENAME = "reply.md"
+LAST_SENT_SCOPE = "last-sent"  # 状態ストアの重複送信判定（キーは session_id）
+TRANSCRIPT_FALLBACK_TIMEOUT = 5.0  # 秒（last_assistant_message が空の場合に transcript の書き込みを待つ上限）
 
 
 
@@ -50,33 +76,6 @@ def extract_attachments(message: str) -> tuple[str, list[str]]:
     return clean, paths
 
 
-def build_multipart(boundary: str, content: str, files: list[tuple[str, bytes]]) -> bytes:
-    """multipart/form-data ボディを構築する。"""
-    sep = f'--{boundary}\r\n'.encode()
-    parts: list[bytes] = []
-
-    parts.append(
-        sep
-        + b'Content-Disposition: form-data; name="payload_json"\r\n'
-        + b'Content-Type: application/json\r\n'
-        + b'\r\n'
-        + json.dumps({"content": content} if content else {}).encode()
-        + b'\r\n'
-    )
-
-    for i, (filename, data) in enumerate(files):
-        parts.append(
-            sep
-            + f'Content-Disposition: form-data; name="files[{i}]"; filename="{filename}"\r\n'.encode()
-            + b'Content-Type: application/octet-stream\r\n'
-            + b'\r\n'
-            + data
-            + b'\r\n'
-        )
-
-    return b''.join(parts) + f'--{boundary}--\r\n'.encode()
-
-
 def _sanitize_attach_path(path: str) -> str | None:
     """パスを正規化し、許可ディレクトリ配下であることを検証する。"""
     raw = path.strip()
@@ -94,31 +93,39 @@ def _sanitize_attach_path(path: str) -> str | None:
     return resolved
 
 
-_RATE_LIMIT_MAX_RETRIES = 3
+def pack_attachments(
+    files: list[tuple[str, str, int]],
+    max_files: int = DISCORD_MAX_FILES_PER_MESSAGE,
+    max_bytes: int = DISCORD_MAX_MESSAGE_BYTES,
+) -> list[list[tuple[str, str, int]]]:
+    """(name, path, size) のリストを、1メッセージの件数・合計サイズ上限に収まるグループに詰める。
+
+    サイズの大きい順に first-fit で詰めてメッセージ数を最小化し、各グループ内は元の順序に戻す。
+    """
+    order = sorted(range(len(files)), key=lambda i: files[i][2], reverse=True)
+    groups: list[list[int]] = []
+    group_bytes: list[int] = []
+    for i in order:
+        size = files[i][2]
+        for g, members in enumerate(groups):
+            if len(members) < max_files and group_bytes[g] + size <= max_bytes:
+                members.append(i)
+                group_bytes[g] += size
+                break
+        else:
+            groups.append([i])
+            group_bytes.append(size)
+    return [[files[i] for i in sorted(members)] for members in groups]
 
 
-def _send_request(req: urllib.request.Request, timeout: int) -> None:
-    """リクエストを送信する。429 の場合は Retry-After に従ってリトライする。"""
-    for attempt in range(_RATE_LIMIT_MAX_RETRIES):
-        try:
-            urllib.request.urlopen(req, timeout=timeout).close()
-            return
-        except urllib.error.HTTPError as e:
-            if e.code == 429:
-                retry_after = float(e.headers.get("Retry-After", "1"))
-                print(f"[stop.py] Rate limited (429). Waiting {retry_after}s (attempt {attempt + 1}/{_RATE_LIMIT_MAX_RETRIES})", file=sys.stderr)
-                time.sleep(retry_after)
-                continue
-            print(f"[stop.py] API error: {e.code} {e.reason}", file=sys.stderr)
-            raise
-    raise urllib.error.URLError(f"Rate limit retries exhausted after {_RATE_LIMIT_MAX_RETRIES} attempts")
+def _post_files(bot_token: str, channel_id: str, content: str, group: list[tuple[str, str, int]]) -> None:
+    body = MultipartBody(uuid.uuid4().hex, content, [(name, path) for name, path, _ in group])
+    post_multipart(bot_token, channel_id, body.boundary, body, content_length=body.content_length)
 
 
-def post_message_with_files(
-    bot_token: str, channel_id: str, content: str, file_paths: list[str]
-) -> None:
-    """テキスト + ファイル添付でメッセージを送信する。"""
-    files: list[tuple[str, bytes]] = []
+def _collect_attachments(file_paths: list[str]) -> list[tuple[str, str, int]]:
+    """添付パスを検証し、送信可能なものを (name, path, size) のリストで返す。"""
+    files: list[tuple[str, str, int]] = []
     for path in file_paths:
         safe_path = _sanitize_attach_path(path)
         if safe_path is None:
@@ -132,80 +139,240 @@ def post_message_with_files(
                     file=sys.stderr,
                 )
                 continue
-            with open(safe_path, 'rb') as f:
-                files.append((Path(safe_path).name, f.read()))
+            if not os.access(safe_path, os.R_OK):
+                raise PermissionError(f"Permission denied: {safe_path!r}")
+            files.append((Path(safe_path).name, safe_path, file_size))
         except OSError as e:
             print(f"[stop.py] Cannot read attachment {safe_path}: {e}", file=sys.stderr)
+    return files
+
+
+def post_message_with_files(
+    bot_token: str, channel_id: str, content: str, file_paths: list[str]
+) -> None:
+    """テキスト + ファイル添付でメッセージを送信する。
 
+    添付は Discord の件数・サイズ上限に収まるよう複数メッセージに分けて送る。
+    テキストは先頭メッセージに付けて最初に送信し、残りのメッセージは並列送信する。
+    添付ファイルはメモリに読み込まず、送信時にディスクから逐次読み出す。
+    """
+    files = _collect_attachments(file_paths)
     if not files:
         post_message(bot_token, channel_id, content)
         return
 
-    boundary = uuid.uuid4().hex
-    body = build_multipart(boundary, content, files)
-    url = f"https://discord.com/api/v10/channels/{channel_id}/messages"
-    req = urllib.request.Request(
-        url,
-        data=body,
-        headers={
-            "Content-Type": f"multipart/form-data; boundary={boundary}",
-            "Authorization": f"Bot {bot_token}",
-            "User-Agent": "DiscordBot (discord-bridge, 1.0.0)",
-        },
-        method="POST",
-    )
-    _send_request(req, timeout=30)
-
-
-DISCORD_MAX_CONTENT = 2000
-
-
-def post_message(bot_token: str, channel_id: str, content: str) -> None:
-    payload = json.dumps({"content": content}).encode()
-    url = f"https://discord.com/api/v10/channels/{channel_id}/messages"
-    req = urllib.request.Request(
-        url,
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bot {bot_token}",
-            "User-Agent": "DiscordBot (discord-bridge, 1.0.0)",
-        },
-        method="POST",
-    )
-    _send_request(req, timeout=10)
-
-
-def _split_message(text: str, max_len: int = DISCORD_MAX_CONTENT) -> list[str]:
-    """テキストを max_len 以下のチャンクに分割する。改行位置で分割を試みる。"""
-    if len(text) <= max_len:
-        return [text]
-    chunks: list[str] = []
-    while text:
-        if len(text) <= max_len:
-            chunks.append(text)
-            break
-        # 改行で分割を試みる
-        split_at = text.rfind("\n", 0, max_len)
-        if split_at <= 0:
-            split_at = max_len
-        chunks.append(text[:split_at])
-        text = text[split_at:].lstrip("\n")
-    return chunks
+    groups = pack_attachments(files)
+    _dbg(f"attachments: {len(files)} files in {len(groups)} message(s)")
+    # 先頭メッセージの失敗（スレッド 404 など）は呼び出し元のフォールバックに委ねる
+    _post_files(bot_token, channel_id, content, groups[0])
+    if len(groups) == 1:
+        return
+
+    errors: list[Exception] = []
+    with ThreadPoolExecutor(max_workers=min(UPLOAD_MAX_WORKERS, len(groups) - 1)) as pool:
+        futures = [pool.submit(_post_files, bot_token, channel_id, "", g) for g in groups[1:]]
+        for future in futures:
+            try:
+                future.result()
+            except urllib.error.URLError as e:
+                errors.append(e)
+    if errors:
+        # 先頭メッセージは送信済みのため、親チャンネルへの再送フォールバックは行わない
+        raise urllib.error.URLError(
+            f"{len(errors)} of {len(groups) - 1} additional attachment message(s) failed: {errors[0]}"
+        )
+
+
+def _write_offload_file(text: str, compress: bool, directory: str) -> str:
+    """応答全文を directory 配下の reply.md（compress なら reply.md.gz）に書き出してパスを返す。"""
+    if compress:
+        path = os.path.join(directory, f"{OFFLOAD_FILENAME}.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        path = os.path.join(directory, OFFLOAD_FILENAME)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return path
+
+
+@contextmanager
+def offload_reply(text: str, compress: bool = False) -> Iterator[str]:
+    """応答全文を添付用の一時ファイルに書き出してパスを返す。
+
+    post_message_with_files の許可ディレクトリ配下に作成し、with ブロック終了時に削除する。
+    """
+    os.makedirs(ATTACH_ALLOWED_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix="reply-", dir=ATTACH_ALLOWED_DIR)
+    try:
+        yield _write_offload_file(text, compress, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def enqueue_reply(
+    bot_token: str,
+    target_channel: str,
+    channel_id: str,
+    content: str,
+    attach_paths: list[str],
+    offload_text: str | None = None,
+    compress: bool = False,
+) -> None:
+    """送信内容を Discord へのリクエスト単位に分けて送信キュー（lib/spool）に追加する。
+
+    分割・添付のまとめ方は同期送信と同じ。offload する全文はキュー専用の一時ディレクトリに置き、
+    ドレイナーが送信後に削除する。
+    """
+    files = _collect_attachments(attach_paths)
+    cleanup = None
+    if offload_text is not None:
+        cleanup = tempfile.mkdtemp(prefix="reply-", dir=spool.files_dir())
+        path = _write_offload_file(offload_text, compress, cleanup)
+        files.append((Path(path).name, path, os.path.getsize(path)))
+    if files:
+        groups = pack_attachments(files)
+        messages = [
+            (content if i == 0 else "", [(name, path) for name, path, _ in group])
+            for i, group in enumerate(groups)
+        ]
+    else:
+        messages = [(chunk, []) for chunk in split_message(content)]
+    parent = channel_id if target_channel != channel_id else None
+    spool.enqueue(bot_token, target_channel, messages, parent_channel_id=parent, cleanup=cleanup)
 
 
 def send_message(bot_token: str, channel_id: str, content: str) -> None:
-    """2000 文字を超える場合は分割して送信する。"""
-    for chunk in _split_message(content):
+    """2000 文字を超える場合はコードブロックを保ったまま分割して送信する。"""
+    for chunk in split_message(content):
         post_message(bot_token, channel_id, chunk)
 
 
+def deliver_reply(config: dict, bot_token: str, channel_id: str, session_id: str, message: str) -> None:
+    """応答を整形（添付抽出・テーブル変換・offload・フッター）して送信する。
+
+    送信先はアクティブなスレッド（404 なら親チャンネル）。delivery: "spool" ならキューに書き込む。
+    """
+    target_channel = resolve_target_channel(channel_id)
+    _dbg(f"channel_id: {channel_id} target: {target_channel}")
+
+    # 途中経過のライブメッセージ（progressMode: edit）を確定させる
+    try:
+        progress.finalize(session_id or "unknown", bot_token)
+    except (OSError, sqlite3.Error) as e:
+        _dbg(f"progress finalize failed: {e}")
+    trace.mark("progress")
+
+    clean_message, attach_paths = extract_attachments(message)
+    display_text = convert_tables_in_text(clean_message)
+
+    # 上限を大きく超える応答は分割送信せず、全文を添付して本文には先頭部分のみ載せる
+    offload_threshold = get_server_option(config, bot_token, "offloadThreshold", None)
+    offload = bool(offload_threshold) and len(display_text) > offload_threshold
+    if offload:
+        display_text = (
+            f"{truncate(display_text, OFFLOAD_EXCERPT_CHARS)}\n\n"
+            f"📎 Full reply attached ({len(display_text):,} chars)"
+        )
+
+    # Append context + rate limit footer if cache exists
+    cache_path = CACHE_PATH_TEMPLATE.format(session_id=session_id)
+    cache_data = read_full_cache(cache_path)
+    if cache_data is not None:
+        footer = format_footer(
+            int(cache_data["used_percentage"]),
+            cache_data.get("rate_limits"),
+            cache_data.get("model"),
+        )
+        display_text += f"\n\n{footer}"
+    trace.mark("format")
+
+    compress = bool(get_server_option(config, bot_token, "offloadGzip", False))
+    if get_server_option(config, bot_token, "delivery", "sync") == "spool":
+        # 送信キューに書き込んで即座に終了し、送信はバックグラウンドのドレイナーに任せる
+        try:
+            enqueue_reply(
+                bot_token, target_channel, channel_id, display_text, attach_paths,
+                offload_text=clean_message if offload else None, compress=compress,
+            )
+        except (sqlite3.Error, OSError) as e:
+            print(f"[stop.py] Spool unavailable, sending synchronously: {e}", file=sys.stderr)
+        else:
+            if not spool.spawn_drainer():
+                spool.drain()
+            trace.mark("enqueue")
+            _dbg("queued")
+            return
+
+    with ExitStack() as stack:
+        if offload:
+            attach_paths = attach_paths + [stack.enter_context(offload_reply(clean_message, compress))]
+            trace.mark("offload")
+
+        _dbg(f"sending: text={display_text[:40]!r} attach={len(attach_paths)}")
+        try:
+            if attach_paths:
+                post_message_with_files(bot_token, target_channel, display_text, attach_paths)
+            else:
+                send_message(bot_token, target_channel, display_text)
+            _dbg("sent OK")
+        except urllib.error.HTTPError as e:
+            if e.code == 404 and target_channel != channel_id:
+                _dbg(f"thread 404, falling back to parent channel {channel_id}")
+                clear_thread_tracking(channel_id, target_channel)
+                try:
+                    if attach_paths:
+                        post_message_with_files(bot_token, channel_id, display_text, attach_paths)
+                    else:
+                        send_message(bot_token, channel_id, display_text)
+                    _dbg("fallback sent OK")
+                except urllib.error.URLError as e2:
+                    print(f"[stop.py] Fallback API request failed: {e2}", file=sys.stderr)
+                    sys.exit(1)
+            else:
+                print(f"[stop.py] API request failed: {e}", file=sys.stderr)
+                sys.exit(1)
+        except urllib.error.URLError as e:
+            print(f"[stop.py] API request failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        trace.mark("send")
+
+
+def deliver_detached(config: dict, bot_token: str, channel_id: str, session_id: str, message: str) -> None:
+    """整理券を取り、deliver_reply を hook から切り離したワーカーで実行する。
+
+    同じチャンネルのワーカーは整理券の順に送信するため、連続した応答の順序は入れ替わらない。
+    整理券を取れない・fork できない場合はこのプロセスで送信する。
+    """
+    try:
+        ticket = ordering.take_ticket(channel_id)
+    except OSError as e:
+        print(f"[stop.py] Cannot take delivery ticket, sending synchronously: {e}", file=sys.stderr)
+        deliver_reply(config, bot_token, channel_id, session_id, message)
+        return
+
+    @trace.traced("stop.worker")
+    def worker() -> None:
+        trace.tag(channel_id=channel_id, session_id=session_id)
+        with ordering.turn(channel_id, ticket):
+            trace.mark("wait_turn")
+            deliver_reply(config, bot_token, channel_id, session_id, message)
+
+    if run_detached(worker):
+        trace.mark("detach")
+        _dbg(f"detached delivery (ticket {ticket})")
+        return
+    worker()
+
+
+@trace.traced("stop")
 def main() -> None:
     try:
         hook_input = json.load(sys.stdin)
     except json.JSONDecodeError as e:
         print(f"[stop.py] Failed to parse stdin: {e}", file=sys.stderr)
         sys.exit(1)
+    trace.mark("input")
 
     transcript_path = hook_input.get("transcript_path", "")
     cwd = hook_input.get("cwd", "")
@@ -219,35 +386,37 @@ def main() -> None:
     # last_assistant_message が空の場合は transcript フォールバック（v2.1.47 未満の互換）
     if not message and transcript_path:
         _dbg("last_assistant_message empty, falling back to transcript")
-        for attempt in range(6):
-            msgs = get_assistant_messages(transcript_path)
-            if msgs:
-                message = msgs[-1]
-                break
-            if attempt < 5:
-                time.sleep(1)
+        msgs = wait_until(
+            transcript_path,
+            lambda: get_assistant_messages(transcript_path, session_id=session_id),
+            TRANSCRIPT_FALLBACK_TIMEOUT,
+        )
+        if msgs:
+            message = msgs[-1]
+        trace.mark("transcript")
 
     if not message:
         _dbg("skipped: no assistant message")
         sys.exit(0)
 
     # transcript の mtime で重複判定（Interrupted時のStop再発火対策）
-    # セッション単位でファイルを分離することで並行セッションの競合を防ぐ
+    # 状態ストアのセッション単位の行を1トランザクションで比較・更新するため、
+    # 2つの Stop hook が同時に発火しても送信するのは片方だけになる
     if not session_id:
         _dbg("skipped dedup: no session_id")
-    last_sent_file = Path(f"/tmp/discord-bridge-last-sent-{session_id or 'unknown'}.txt")
     try:
         transcript_mtime = f"{Path(transcript_path).stat().st_mtime:.3f}" if transcript_path else "0"
     except OSError:
         transcript_mtime = "0"
     sent_key = f"{session_id}:{transcript_mtime}"
     try:
-        if last_sent_file.read_text() == sent_key:
+        if not state.claim(LAST_SENT_SCOPE, session_id or "unknown", sent_key):
             _dbg(f"skipped: duplicate (mtime={transcript_mtime})")
             sys.exit(0)
-    except OSError:
-        pass
-    last_sent_file.write_text(sent_key)
+        state.prune()
+    except sqlite3.Error as e:
+        _dbg(f"dedup state unavailable: {e}")
+    trace.mark("dedup")
 
     try:
         config = load_config()
@@ -260,50 +429,15 @@ def main() -> None:
     except ValueError:
         _dbg(f"skipped: no project matches cwd={cwd!r}")
         sys.exit(0)
+    trace.mark("config")
+    trace.tag(channel_id=channel_id, session_id=session_id)
 
-    target_channel = resolve_target_channel(channel_id)
-    _dbg(f"cwd: {cwd!r} -> channel_id: {channel_id} target: {target_channel} project: {project_name!r}")
-
-    clean_message, attach_paths = extract_attachments(message)
-    display_text = convert_tables_in_text(clean_message)
-
-    # Append context + rate limit footer if cache exists
-    cache_path = CACHE_PATH_TEMPLATE.format(session_id=session_id)
-    cache_data = read_full_cache(cache_path)
-    if cache_data is not None:
-        footer = format_footer(
-            int(cache_data["used_percentage"]),
-            cache_data.get("rate_limits"),
-            cache_data.get("model"),
-        )
-        display_text += f"\n\n{footer}"
+    _dbg(f"cwd: {cwd!r} -> channel_id: {channel_id} project: {project_name!r}")
 
-    _dbg(f"sending: text={display_text[:40]!r} attach={len(attach_paths)}")
-    try:
-        if attach_paths:
-            post_message_with_files(bot_token, target_channel, display_text, attach_paths)
-        else:
-            send_message(bot_token, target_channel, display_text)
-        _dbg("sent OK")
-    except urllib.error.HTTPError as e:
-        if e.code == 404 and target_channel != channel_id:
-            _dbg(f"thread 404, falling back to parent channel {channel_id}")
-            clear_thread_tracking(channel_id)
-            try:
-                if attach_paths:
-                    post_message_with_files(bot_token, channel_id, display_text, attach_paths)
-                else:
-                    send_message(bot_token, channel_id, display_text)
-                _dbg("fallback sent OK")
-            except urllib.error.URLError as e2:
-                print(f"[stop.py] Fallback API request failed: {e2}", file=sys.stderr)
-                sys.exit(1)
-        else:
-            print(f"[stop.py] API request failed: {e}", file=sys.stderr)
-            sys.exit(1)
-    except urllib.error.URLError as e:
-        print(f"[stop.py] API request failed: {e}", file=sys.stderr)
-        sys.exit(1)
+    if get_server_option(config, bot_token, "delivery", "sync") == "detached":
+        deliver_detached(config, bot_token, channel_id, session_id, message)
+    else:
+        deliver_reply(config, bot_token, channel_id, session_id, message)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""hook トレース（lib/trace の JSONL）の集計: hook・区間・チャンネルごとの p50 / p95 / p99、
+Discord へのリクエスト数・送信バイト数・429 の回数を表示する。
+
+    python3 hooks/trace_stats.py [FILE ...] [--since 24h] [--hook stop] [--json]
+                                 [--prom /var/lib/node_exporter/textfile/discord_bridge.prom]
+
+FILE を省略した場合は lib/trace の出力先（DISCORD_BRIDGE_TRACE_FILE または
+~/.discord-bridge/trace.jsonl）を読む。ファイルは1行ずつ読み、壊れた行は読み飛ばす。
+--prom を指定すると node_exporter の textfile collector 用の Prometheus テキスト形式を
+書き出す（一時ファイルからの rename で置き換えるため、収集中に途中の内容が読まれない）。
+cron などで --since と組み合わせて定期的に実行する想定。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+sys.path.insert(0, str(Path(__file__).parent))
+from lib.trace import trace_path
+
+QUANTILES = (0.5, 0.95, 0.99)
+COUNTERS = ("requests", "bytes_out", "http_429")
+PROM_PREFIX = "discord_bridge"
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class Samples:
+    """1系列分の所要時間（ms）。パーセンタイルはソートして nearest-rank で求める。"""
+
+    __slots__ = ("values",)
+
+    def __init__(self) -> None:
+        self.values: list[float] = []
+
+    def add(self, ms: float) -> None:
+        self.values.append(ms)
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    @property
+    def total(self) -> float:
+        return sum(self.values)
+
+    def quantiles(self, qs: Iterable[float] = QUANTILES) -> dict[float, float]:
+        ordered = sorted(self.values)
+        if not ordered:
+            return {}
+        return {q: ordered[max(math.ceil(q * len(ordered)), 1) - 1] for q in qs}
+
+
+class HookStats:
+    __slots__ = ("total", "startup", "phases", "channels", "counters", "errors")
+
+    def __init__(self) -> None:
+        self.total = Samples()
+        self.startup = Samples()
+        self.phases: dict[str, Samples] = {}
+        self.channels: dict[str, Samples] = {}
+        self.counters: dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.errors = 0
+
+
+class Summary:
+    def __init__(self) -> None:
+        self.hooks: dict[str, HookStats] = {}
+        self.skipped = 0  # JSON として読めない行・必須フィールドのない行
+
+    def add(self, record: dict) -> None:
+        hook = record.get("hook")
+        total_ms = record.get("total_ms")
+        if not isinstance(hook, str) or not isinstance(total_ms, (int, float)):
+            self.skipped += 1
+            return
+        stats = self.hooks.setdefault(hook, HookStats())
+        stats.total.add(float(total_ms))
+        startup_ms = record.get("startup_ms")
+        if isinstance(startup_ms, (int, float)):
+            stats.startup.add(float(startup_ms))
+        for phase, ms in (record.get("phases") or {}).items():
+            if isinstance(ms, (int, float)):
+                stats.phases.setdefault(phase, Samples()).add(float(ms))
+        channel_id = record.get("channel_id")
+        if channel_id:
+            stats.channels.setdefault(str(channel_id), Samples()).add(float(total_ms))
+        for name, value in (record.get("counters") or {}).items():
+            if isinstance(value, int):
+                stats.counters[name] = stats.counters.get(name, 0) + value
+        if record.get("exit", 0) != 0:
+            stats.errors += 1
+
+
+def parse_duration(text: str) -> float:
+    """'90s' / '30m' / '24h' / '7d' を秒に変換する。"""
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", text.strip())
+    if not m:
+        raise argparse.ArgumentTypeError(f"invalid duration: {text!r} (e.g. 30m, 24h, 7d)")
+    return float(m.group(1)) * _DURATION_UNITS[m.group(2)]
+
+
+def read_records(paths: Iterable[str], summary: Summary) -> Iterator[dict]:
+    """JSONL を1行ずつ読み、レコードを返す（存在しないファイルは読み飛ばす）。"""
+    for path in paths:
+        try:
+            f = open(path, encoding="utf-8", errors="replace")
+        except OSError as e:
+            print(f"[trace_stats] Skipping {path}: {e}", file=sys.stderr)
+            continue
+        with f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    summary.skipped += 1
+                    continue
+                if isinstance(record, dict):
+                    yield record
+                else:
+                    summary.skipped += 1
+
+
+def summarize(
+    paths: Iterable[str],
+    since: float | None = None,
+    hook: str | None = None,
+) -> Summary:
+    """トレースファイルを集計する。since は UNIX 時刻（それより前のレコードは除外）。"""
+    summary = Summary()
+    for record in read_records(paths, summary):
+        if since is not None and not (isinstance(record.get("ts"), (int, float)) and record["ts"] >= since):
+            continue
+        if hook is not None and record.get("hook") != hook:
+            continue
+        summary.add(record)
+    return summary
+
+
+def _fmt_quantiles(samples: Samples) -> str:
+    qs = samples.quantiles()
+    return "  ".join(f"{qs[q]:>9.1f}" for q in QUANTILES)
+
+
+def format_text(summary: Summary) -> str:
+    if not summary.hooks:
+        return "No trace records."
+    header = f"{'':<28}{'count':>7}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}"
+    lines: list[str] = []
+    for name in sorted(summary.hooks):
+        stats = summary.hooks[name]
+        c = stats.counters
+        lines.append(
+            f"{name}: {stats.total.count} invocations, {stats.errors} errors, "
+            f"{c.get('requests', 0)} requests, {c.get('bytes_out', 0)} bytes out, "
+            f"{c.get('http_429', 0)} x 429"
+        )
+        lines.append(header)
+        rows: list[tuple[str, Samples]] = [("total", stats.total)]
+        if stats.startup.count:
+            rows.append(("startup", stats.startup))
+        rows += [(f"  {phase}", s) for phase, s in sorted(stats.phases.items())]
+        rows += [(f"  #{channel}", s) for channel, s in sorted(stats.channels.items())]
+        for label, samples in rows:
+            lines.append(f"{label:<28}{samples.count:>7}  {_fmt_quantiles(samples)}")
+        lines.append("")
+    if summary.skipped:
+        lines.append(f"({summary.skipped} malformed line(s) skipped)")
+    return "\n".join(lines).rstrip()
+
+
+def _samples_json(samples: Samples) -> dict:
+    return {
+        "count": samples.count,
+        **{f"p{round(q * 100)}": round(v, 1) for q, v in samples.quantiles().items()},
+    }
+
+
+def to_json(summary: Summary) -> dict:
+    return {
+        "hooks": {
+            name: {
+                "invocations": stats.total.count,
+                "errors": stats.errors,
+                "counters": stats.counters,
+                "total_ms": _samples_json(stats.total),
+                "startup_ms": _samples_json(stats.startup),
+                "phases": {p: _samples_json(s) for p, s in sorted(stats.phases.items())},
+                "channels": {c: _samples_json(s) for c, s in sorted(stats.channels.items())},
+            }
+            for name, stats in sorted(summary.hooks.items())
+        },
+        "skipped": summary.skipped,
+    }
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items())
+
+
+def _prom_summary(lines: list[str], name: str, help_text: str, series: list[tuple[dict[str, str], Samples]]) -> None:
+    if not series:
+        return
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} summary")
+    for labels, samples in series:
+        for q, ms in samples.quantiles().items():
+            lines.append(f"{name}{{{_labels(**labels, quantile=str(q))}}} {ms / 1000:.6f}")
+        lines.append(f"{name}_sum{{{_labels(**labels)}}} {samples.total / 1000:.6f}")
+        lines.append(f"{name}_count{{{_labels(**labels)}}} {samples.count}")
+
+
+def to_prometheus(summary: Summary) -> str:
+    """Prometheus テキスト形式（所要時間は秒。値は集計対象の期間内の合計）。"""
+    hooks = sorted(summary.hooks.items())
+    lines: list[str] = []
+    _prom_summary(
+        lines, f"{PROM_PREFIX}_hook_duration_seconds", "Hook invocation wall time.",
+        [({"hook": name}, stats.total) for name, stats in hooks],
+    )
+    _prom_summary(
+        lines, f"{PROM_PREFIX}_hook_startup_seconds", "Process age when the hook main() started.",
+        [({"hook": name}, stats.startup) for name, stats in hooks if stats.startup.count],
+    )
+    _prom_summary(
+        lines, f"{PROM_PREFIX}_hook_phase_duration_seconds", "Time spent in each hook phase.",
+        [({"hook": name, "phase": p}, s) for name, stats in hooks for p, s in sorted(stats.phases.items())],
+    )
+    _prom_summary(
+        lines, f"{PROM_PREFIX}_channel_duration_seconds", "Hook invocation wall time per Discord channel.",
+        [({"hook": name, "channel_id": c}, s) for name, stats in hooks for c, s in sorted(stats.channels.items())],
+    )
+    gauges = [
+        ("errors", "Hook invocations that exited non-zero.", lambda s: s.errors),
+        ("discord_requests", "Discord API requests sent (including retries).", lambda s: s.counters.get("requests", 0)),
+        ("upload_bytes", "Request body bytes sent to Discord.", lambda s: s.counters.get("bytes_out", 0)),
+        ("http_429", "Discord 429 responses received.", lambda s: s.counters.get("http_429", 0)),
+    ]
+    for metric, help_text, value in gauges:
+        if not hooks:
+            break
+        name = f"{PROM_PREFIX}_hook_{metric}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for hook, stats in hooks:
+            lines.append(f"{name}{{{_labels(hook=hook)}}} {value(stats)}")
+    lines.append(f"# HELP {PROM_PREFIX}_trace_skipped_lines Malformed trace lines skipped.")
+    lines.append(f"# TYPE {PROM_PREFIX}_trace_skipped_lines gauge")
+    lines.append(f"{PROM_PREFIX}_trace_skipped_lines {summary.skipped}")
+    return "\n".join(lines) + "\n"
+
+
+def write_atomic(path: str, text: str) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Summarize discord-bridge hook traces")
+    parser.add_argument("files", nargs="*", help=f"trace JSONL files (default: {trace_path()})")
+    parser.add_argument("--since", type=parse_duration, help="only records newer than this (e.g. 30m, 24h, 7d)")
+    parser.add_argument("--hook", help="only this hook (e.g. stop, pre_tool_use)")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.add_argument("--prom", metavar="PATH", help="write a Prometheus textfile (node_exporter)")
+    args = parser.parse_args(argv)
+
+    since = time.time() - args.since if args.since is not None else None
+    summary = summarize(args.files or [trace_path()], since=since, hook=args.hook)
+    if args.prom:
+        write_atomic(args.prom, to_prometheus(summary))
+    if args.json:
+        print(json.dumps(to_json(summary), ensure_ascii=False, indent=2))
+    elif not args.prom:
+        print(format_text(summary))
+
+
+if __name__ == "__main__":
+    main()
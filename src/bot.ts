@@ -10,12 +10,14 @@ import {
 } from 'discord.js';
 import { execFileSync } from 'node:child_process';
 import { mkdir, writeFile, readdir, stat, unlink } from 'node:fs/promises';
-import { writeFileSync, readFileSync, unlinkSync, existsSync } from 'node:fs';
+import { writeFileSync, readFileSync, unlinkSync, existsSync, renameSync } from 'node:fs';
 import { basename, join } from 'node:path';
 import { homedir } from 'node:os';
+import { createConnection } from 'node:net';
 import { type Config, type Server, type Project, resolveThreadConfig } from './config.js';
 import { TmuxSender, escapeTmuxShellArg } from './tmux-sender.js';
 import { ThreadStateManager, type ThreadPaneInfo } from './thread-state.js';
+import { startTmpSweeper } from './tmp-sweeper.js';
 
 const UPLOAD_DIR = '/tmp/discord-uploads';
 const DOWNLOAD_TIMEOUT_MS = 30_000;
@@ -23,10 +25,17 @@ const DOWNLOAD_MAX_BYTES = 50 * 1024 * 1024; // 50 MB
 const THREAD_TRACKING_DIR = '/tmp';
 const DEFAULT_CONFIG_PATH = join(homedir(), '.discord-bridge', 'config.json');
 
+// hooks が書き込み途中のファイルを読まないよう、一時ファイルに書いてから rename する
+function writeFileAtomic(filePath: string, data: string): void {
+  const tmpPath = `${filePath}.${process.pid}.tmp`;
+  writeFileSync(tmpPath, data);
+  renameSync(tmpPath, filePath);
+}
+
 export function writeThreadTracking(parentChannelId: string, threadId: string | null): void {
   const filePath = join(THREAD_TRACKING_DIR, `discord-bridge-thread-${parentChannelId}.json`);
   if (threadId) {
-    writeFileSync(filePath, JSON.stringify({ threadId }));
+    writeFileAtomic(filePath, JSON.stringify({ threadId }));
   } else {
     try {
       unlinkSync(filePath);
@@ -79,6 +88,14 @@ export function appendThreadToConfig(
   }
 }
 
+// 応答ファイル書き込み後、待機中の PreToolUse hook を通知ソケット経由で即時起床させる。
+// hook がソケットを開いていない場合はエラーを無視する（hook 側のポーリングで拾われる）
+export function notifyPermissionWaiter(channelId: string): void {
+  const sock = createConnection(join(THREAD_TRACKING_DIR, `discord-bridge-perm-${channelId}.sock`));
+  sock.on('connect', () => sock.end());
+  sock.on('error', () => { /* ignore: no waiter */ });
+}
+
 export function buildPermissionFlag(permission?: string): string {
   if (permission === 'bypassPermissions') return ' --dangerously-skip-permissions';
   return '';
@@ -494,7 +511,8 @@ export async function handleInteractionCreate(
 
     if (action === 'other') {
       try {
-        writeFileSync(respPath, JSON.stringify({ decision: 'block' }));
+        writeFileAtomic(respPath, JSON.stringify({ decision: 'block' }));
+        notifyPermissionWaiter(resolvedChannelId);
       } catch (err) {
         console.error('[discord-bridge] Failed to write permission response:', err);
       }
@@ -506,7 +524,8 @@ export async function handleInteractionCreate(
 
     const decision = action === 'allow' ? 'allow' : 'deny';
     try {
-      writeFileSync(respPath, JSON.stringify({ decision }));
+      writeFileAtomic(respPath, JSON.stringify({ decision }));
+      notifyPermissionWaiter(resolvedChannelId);
     } catch (err) {
       console.error('[discord-bridge] Failed to write permission response:', err);
     }
@@ -532,7 +551,7 @@ export async function handleInteractionCreate(
     // approve: 事前承認フラグを書き込み（次回の ExitPlanMode フック用）
     if (decision === 'approve') {
       try {
-        writeFileSync(`/tmp/discord-bridge-plan-approved-${resolvedChannelId}`, '');
+        writeFileAtomic(`/tmp/discord-bridge-plan-approved-${resolvedChannelId}`, '');
       } catch (err) {
         console.error('[discord-bridge] Failed to write plan approval flag:', err);
       }
@@ -600,6 +619,7 @@ async function cleanUploadDir(): Promise<void> {
 
 export function createServerBot(server: Server): Client {
   void cleanUploadDir();
+  startTmpSweeper(server.projects.map(p => p.channelId));
 
   const client = new Client({
     intents: [
@@ -43,6 +43,11 @@ const ServerSchema = z.object({
   projects: z.array(ProjectSchema).min(1),
   permissionTools: z.array(z.string()).optional().default([]),
   generalChannelId: z.string().optional(),
+  progressMode: z.enum(["post", "edit"]).optional(),
+  progressEditInterval: z.number().positive().optional(),
+  offloadThreshold: z.number().int().positive().optional(),
+  offloadGzip: z.boolean().optional(),
+  delivery: z.enum(["sync", "spool", "detached"]).optional(),
 });
 
 const ConfigSchema = z.object({
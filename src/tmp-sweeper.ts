@@ -0,0 +1,129 @@
+import { readdir, lstat, unlink } from 'node:fs/promises';
+import { join } from 'node:path';
+
+const TMP_DIR = '/tmp';
+const HOUR_MS = 60 * 60 * 1000;
+const DAY_MS = 24 * HOUR_MS;
+export const SWEEP_INTERVAL_MS = HOUR_MS;
+export const SWEEP_INITIAL_DELAY_MS = 60_000; // 全サーバーの Bot がチャンネルを登録し終えてから初回を実行
+
+export type SweepRule = {
+  // 1番目のキャプチャが sessionId / channelId
+  pattern: RegExp;
+  // 'session': 同じセッションの全ファイルが maxAgeMs 以上更新されていなければまとめて削除
+  // 'channel': ファイルごとに判定し、稼働中の Bot のチャンネルは残す
+  // 'file': ファイルごとに判定
+  scope: 'session' | 'channel' | 'file';
+  maxAgeMs: number;
+};
+
+export const SWEEP_RULES: SweepRule[] = [
+  { pattern: /^discord-bridge-context-(.+)\.json$/, scope: 'session', maxAgeMs: DAY_MS },
+  { pattern: /^discord-bridge-transcript-(.+)\.json$/, scope: 'session', maxAgeMs: DAY_MS },
+  // 状態ストア（discord-bridge-state.db）移行前のファイル
+  { pattern: /^discord-bridge-last-sent-(.+)\.txt$/, scope: 'session', maxAgeMs: DAY_MS },
+  { pattern: /^discord-bridge-progress-(.+)\.(?:json|txt)$/, scope: 'session', maxAgeMs: DAY_MS },
+  { pattern: /^discord-bridge-thread-(.+)\.json$/, scope: 'channel', maxAgeMs: 7 * DAY_MS },
+  { pattern: /^discord-bridge-order-(.+)\.json$/, scope: 'file', maxAgeMs: DAY_MS },
+  // DISCORD_BRIDGE_API_BASE（負荷試験用のスタンドイン）ごとのレート制限状態
+  { pattern: /^discord-bridge-ratelimit-([0-9a-f]+)\.json$/, scope: 'file', maxAgeMs: DAY_MS },
+  { pattern: /^discord-bridge-perm-(.+)\.(?:json|sock)$/, scope: 'file', maxAgeMs: HOUR_MS },
+  { pattern: /^discord-bridge-plan-approved-(.+)$/, scope: 'file', maxAgeMs: DAY_MS },
+  // 書き込み途中で終了した一時ファイル（writeFileAtomic）
+  { pattern: /^(discord-bridge-.+)\.\d+\.tmp$/, scope: 'file', maxAgeMs: HOUR_MS },
+];
+
+export type SweepResult = { files: number; bytes: number };
+
+type Candidate = { path: string; key: string; rule: SweepRule; mtimeMs: number; size: number };
+
+export type SweepOptions = {
+  dir?: string;
+  now?: number;
+  rules?: SweepRule[];
+  keepChannelIds?: ReadonlySet<string>;
+};
+
+/**
+ * /tmp に残った hooks / Bot の IPC ファイルのうち期限切れのものを削除し、削除した件数とバイト数を返す。
+ * 他のユーザーが所有するファイルには触れない。
+ */
+export async function sweepTmpFiles(options: SweepOptions = {}): Promise<SweepResult> {
+  const dir = options.dir ?? TMP_DIR;
+  const now = options.now ?? Date.now();
+  const rules = options.rules ?? SWEEP_RULES;
+  const keep = options.keepChannelIds ?? new Set<string>();
+  const uid = process.getuid?.();
+
+  let names: string[];
+  try {
+    names = await readdir(dir);
+  } catch {
+    return { files: 0, bytes: 0 };
+  }
+
+  const candidates: Candidate[] = [];
+  await Promise.all(names.filter(name => name.startsWith('discord-bridge-')).map(async (name) => {
+    const rule = rules.find(r => r.pattern.test(name));
+    if (!rule) return;
+    const path = join(dir, name);
+    try {
+      const st = await lstat(path);
+      if (!(st.isFile() || st.isSocket())) return;
+      if (uid !== undefined && st.uid !== uid) return;
+      const key = name.match(rule.pattern)![1];
+      candidates.push({ path, key, rule, mtimeMs: st.mtimeMs, size: st.size });
+    } catch { /* 削除済み */ }
+  }));
+
+  // セッション単位のファイルは、そのセッションの最終更新時刻で判定する
+  const sessionLastSeen = new Map<string, number>();
+  for (const c of candidates) {
+    if (c.rule.scope !== 'session') continue;
+    sessionLastSeen.set(c.key, Math.max(sessionLastSeen.get(c.key) ?? 0, c.mtimeMs));
+  }
+
+  const expired = candidates.filter((c) => {
+    if (c.rule.scope === 'channel' && keep.has(c.key)) return false;
+    const lastSeen = c.rule.scope === 'session' ? sessionLastSeen.get(c.key)! : c.mtimeMs;
+    return now - lastSeen > c.rule.maxAgeMs;
+  });
+
+  const result: SweepResult = { files: 0, bytes: 0 };
+  await Promise.all(expired.map(async (c) => {
+    try {
+      await unlink(c.path);
+      result.files += 1;
+      result.bytes += c.size;
+    } catch { /* 他プロセスが削除済み */ }
+  }));
+  return result;
+}
+
+export function formatSweepResult(result: SweepResult): string {
+  const kb = (result.bytes / 1024).toFixed(1);
+  return `[discord-bridge] Swept ${result.files} stale /tmp file(s), reclaimed ${kb} KB`;
+}
+
+// 同じプロセスで複数サーバーの Bot を起動しても sweeper は1つだけ動かす
+const liveChannelIds = new Set<string>();
+let sweeperStarted = false;
+
+/**
+ * 定期的に sweepTmpFiles を実行する。channelIds は稼働中の Bot のプロジェクトチャンネル
+ * （スレッド追跡ファイルを削除しない）。2回目以降の呼び出しはチャンネルの登録のみ行う。
+ */
+export function startTmpSweeper(channelIds: Iterable<string>): void {
+  for (const id of channelIds) liveChannelIds.add(id);
+  if (sweeperStarted) return;
+  sweeperStarted = true;
+
+  const run = async () => {
+    const result = await sweepTmpFiles({ keepChannelIds: liveChannelIds });
+    if (result.files > 0) console.log(formatSweepResult(result));
+  };
+  setTimeout(() => {
+    void run();
+    setInterval(() => void run(), SWEEP_INTERVAL_MS);
+  }, SWEEP_INITIAL_DELAY_MS);
+}
@@ -1,7 +1,8 @@
 import { describe, test, expect, vi, beforeEach } from 'vitest';
-import { handleButtonInteraction, handleInteractionCreate } from '../src/bot.js';
+import { handleButtonInteraction, handleInteractionCreate, notifyPermissionWaiter } from '../src/bot.js';
 import { TmuxSender } from '../src/tmux-sender.js';
 import { existsSync, readFileSync, unlinkSync } from 'node:fs';
+import { createServer } from 'node:net';
 
 vi.mock('node:child_process', () => ({
   execFileSync: vi.fn(),
@@ -162,3 +163,27 @@ describe('handleInteractionCreate', () => {
     try { unlinkSync(respPath); } catch { /* ignore */ }
   });
 });
+
+describe('notifyPermissionWaiter', () => {
+  test('待機中の hook の通知ソケットに接続する', async () => {
+    const sockPath = '/tmp/discord-bridge-perm-333444555666777.sock';
+    try { unlinkSync(sockPath); } catch { /* ignore */ }
+    const connected = new Promise<void>((resolve) => {
+      const server = createServer((conn) => {
+        conn.destroy();
+        server.close();
+        resolve();
+      });
+      server.listen(sockPath);
+    });
+    await new Promise((r) => setTimeout(r, 20));
+
+    notifyPermissionWaiter('333444555666777');
+
+    await expect(connected).resolves.toBeUndefined();
+  });
+
+  test('通知ソケットがなくても例外を出さない', () => {
+    expect(() => notifyPermissionWaiter('000111222333444')).not.toThrow();
+  });
+});
@@ -17,6 +17,7 @@ vi.mock('node:fs', () => ({
   writeFileSync: vi.fn(),
   readFileSync: vi.fn(),
   unlinkSync: vi.fn(),
+  renameSync: vi.fn(),
 }));
 
 import { execFileSync } from 'node:child_process';
@@ -134,6 +134,60 @@ describe('loadConfig', () => {
     expect(() => loadConfig(CONFIG_PATH)).toThrow();
   });
 
+  test('server.progressMode: "edit" と progressEditInterval を受け付ける', () => {
+    const cfg = {
+      ...validConfig,
+      servers: [{ ...validConfig.servers[0], progressMode: 'edit', progressEditInterval: 3 }],
+    };
+    writeFileSync(CONFIG_PATH, JSON.stringify(cfg));
+    const config = loadConfig(CONFIG_PATH);
+    expect(config.servers[0].progressMode).toBe('edit');
+    expect(config.servers[0].progressEditInterval).toBe(3);
+  });
+
+  test('server.offloadThreshold と offloadGzip を受け付ける', () => {
+    const cfg = {
+      ...validConfig,
+      servers: [{ ...validConfig.servers[0], offloadThreshold: 8000, offloadGzip: true }],
+    };
+    writeFileSync(CONFIG_PATH, JSON.stringify(cfg));
+    const config = loadConfig(CONFIG_PATH);
+    expect(config.servers[0].offloadThreshold).toBe(8000);
+    expect(config.servers[0].offloadGzip).toBe(true);
+  });
+
+  test('server.delivery: "spool" / "detached" を受け付け、不正な値は reject される', () => {
+    const ok = { ...validConfig, servers: [{ ...validConfig.servers[0], delivery: 'spool' }] };
+    writeFileSync(CONFIG_PATH, JSON.stringify(ok));
+    expect(loadConfig(CONFIG_PATH).servers[0].delivery).toBe('spool');
+
+    const detached = { ...validConfig, servers: [{ ...validConfig.servers[0], delivery: 'detached' }] };
+    writeFileSync(CONFIG_PATH, JSON.stringify(detached));
+    expect(loadConfig(CONFIG_PATH).servers[0].delivery).toBe('detached');
+
+    const bad = { ...validConfig, servers: [{ ...validConfig.servers[0], delivery: 'queue' }] };
+    writeFileSync(CONFIG_PATH, JSON.stringify(bad));
+    expect(() => loadConfig(CONFIG_PATH)).toThrow();
+  });
+
+  test('server.offloadThreshold: 0 以下は reject される', () => {
+    const cfg = {
+      ...validConfig,
+      servers: [{ ...validConfig.servers[0], offloadThreshold: 0 }],
+    };
+    writeFileSync(CONFIG_PATH, JSON.stringify(cfg));
+    expect(() => loadConfig(CONFIG_PATH)).toThrow();
+  });
+
+  test('server.progressMode: 不正な値は reject される', () => {
+    const cfg = {
+      ...validConfig,
+      servers: [{ ...validConfig.servers[0], progressMode: 'replace' }],
+    };
+    writeFileSync(CONFIG_PATH, JSON.stringify(cfg));
+    expect(() => loadConfig(CONFIG_PATH)).toThrow();
+  });
+
   test('server.projects が空配列は reject される', () => {
     const cfg = {
       schemaVersion: 2,
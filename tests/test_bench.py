@@ -0,0 +1,80 @@
+"""tests/test_bench.py — ベンチマーク（bench/）の transcript 生成と実行のテスト"""
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "bench"))
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+import bench_hooks  # noqa: E402
+import transcript_gen  # noqa: E402
+from lib.config import resolve_channel  # noqa: E402
+from lib.transcript import get_assistant_messages  # noqa: E402
+
+
+class TestTranscriptGen:
+    def test_parse_size(self):
+        assert transcript_gen.parse_size("1MB") == 1024 ** 2
+        assert transcript_gen.parse_size("512kb") == 512 * 1024
+        assert transcript_gen.parse_size("100") == 100
+
+    def test_generates_valid_chained_transcript(self, tmp_path):
+        path = tmp_path / "t.jsonl"
+        written = transcript_gen.generate(str(path), 1024 ** 2, seed=1)
+        assert written == path.stat().st_size
+        assert 1024 ** 2 <= written < 1024 ** 2 + 64 * 1024
+
+        entries = [json.loads(line) for line in path.read_text().splitlines()]
+        types = {e["type"] for e in entries}
+        assert types == {"user", "assistant", "summary"}
+        parent = None
+        for e in entries:
+            if e["type"] == "summary":
+                continue
+            assert e["parentUuid"] == parent
+            parent = e["uuid"]
+
+    def test_last_turn_has_content_in_both_modes(self, tmp_path):
+        path = tmp_path / "t.jsonl"
+        transcript_gen.generate(str(path), 64 * 1024)
+        by_user = get_assistant_messages(str(path), max_chars=100_000)
+        by_tool_result = get_assistant_messages(str(path), max_chars=100_000, tool_result_as_boundary=True)
+        assert len(by_user) == 3
+        assert by_tool_result == by_user[1:]
+        assert "|" in by_tool_result[-1] and "```python" in by_tool_result[-1]
+
+    def test_deterministic(self, tmp_path):
+        a, b = tmp_path / "a.jsonl", tmp_path / "b.jsonl"
+        transcript_gen.generate(str(a), 32 * 1024, seed=7)
+        transcript_gen.generate(str(b), 32 * 1024, seed=7)
+        assert a.read_bytes() == b.read_bytes()
+
+
+class TestBenchHooks:
+    def test_run_benchmarks_json(self, tmp_path):
+        results = bench_hooks.run_benchmarks([64 * 1024], repeat=1, workdir=str(tmp_path), name_filter="transcript.")
+        names = {(r["name"], r["params"]["mode"]) for r in results["results"]}
+        assert names == {
+            (name, mode)
+            for name in ("transcript.scan", "transcript.index_cold", "transcript.index_append")
+            for mode in ("user", "tool_result")
+        }
+        for r in results["results"]:
+            assert r["runs"] == 1
+            assert 0 <= r["min_ms"] <= r["median_ms"] <= r["max_ms"]
+        # 生成した transcript は再利用のため残し、追記用のコピーとインデックスは削除する
+        assert sorted(p.name for p in tmp_path.iterdir()) == [f"transcript-{64 * 1024}.jsonl"]
+        json.dumps(results)
+
+    def test_make_config_resolves_deep_path(self):
+        config = bench_hooks.make_config(100)
+        last = config["servers"][-1]["projects"][-1]
+        channel_id, bot_token, name, _ = resolve_channel(config, last["projectPath"] + "/src")
+        assert (channel_id, bot_token, name) == (last["channelId"], "token-9", last["name"])
+
+    def test_compare(self):
+        result = {"name": "x", "params": {"size": 1}, "runs": 1, "min_ms": 2, "median_ms": 2.0, "p95_ms": 2, "max_ms": 2}
+        baseline = {"results": [dict(result, median_ms=1.0)]}
+        assert bench_hooks.compare(baseline, {"results": [result]}) == ['x {"size": 1}: 1.000ms -> 2.000ms (x2.00)']
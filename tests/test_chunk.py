@@ -0,0 +1,128 @@
+"""tests/test_chunk.py — メッセージ分割・切り詰めのテスト"""
+from __future__ import annotations
+
+import random
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+from lib.chunk import split_message, truncate  # noqa: E402
+from lib.table import convert_tables_in_text  # noqa: E402
+
+
+def _fence_balanced(chunk: str) -> bool:
+    """``` 行が開閉で対になっていること。"""
+    return sum(1 for line in chunk.split("\n") if line.strip().startswith("```")) % 2 == 0
+
+
+class TestSplitMessage:
+    """split_message のテスト"""
+
+    def test_short_text_unchanged(self):
+        assert split_message("hello") == ["hello"]
+
+    def test_splits_at_line_boundaries(self):
+        lines = [f"line {i:03d} " + "x" * 40 for i in range(100)]
+        chunks = split_message("\n".join(lines), max_len=500)
+        assert all(len(c) <= 500 for c in chunks)
+        assert "\n".join(chunks).split("\n") == lines
+
+    def test_code_fence_closed_and_reopened(self):
+        text = "intro\n```python\n" + "print('hello world')\n" * 200 + "```\noutro"
+        chunks = split_message(text, max_len=500)
+        assert len(chunks) > 2
+        assert all(len(c) <= 500 for c in chunks)
+        assert all(_fence_balanced(c) for c in chunks)
+        for chunk in chunks[1:-1]:
+            assert chunk.startswith("```python\n")
+            assert chunk.endswith("\n```")
+        assert chunks[-1].endswith("outro")
+
+    def test_tilde_fence_reopened_with_same_marker(self):
+        text = "~~~\n" + "code line\n" * 100 + "~~~"
+        chunks = split_message(text, max_len=200)
+        assert all(c.startswith("~~~\n") and c.endswith("\n~~~") for c in chunks)
+
+    def test_unclosed_fence_not_reopened(self):
+        text = "```\n" + "plain line\n" * 100
+        chunks = split_message(text, max_len=200)
+        assert chunks[0].startswith("```\n")
+        assert not any(c.startswith("```") for c in chunks[1:])
+
+    def test_rendered_table_rows_not_split(self):
+        rows = "".join(f"| item{i} | {i * 7} | note {i} |\n" for i in range(300))
+        text = convert_tables_in_text("| Name | Qty | Note |\n| --- | --- | --- |\n" + rows)
+        row_lines = {line for line in text.split("\n") if line.startswith("item")}
+        chunks = split_message(text, max_len=400)
+        assert all(len(c) <= 400 for c in chunks)
+        assert all(_fence_balanced(c) for c in chunks)
+        seen = {line for c in chunks for line in c.split("\n") if line.startswith("item")}
+        assert seen == row_lines
+
+    def test_overlong_line_hard_split(self):
+        text = "a" * 5000
+        chunks = split_message(text, max_len=2000)
+        assert [len(c) for c in chunks] == [2000, 2000, 1000]
+
+    def test_long_paragraph_fills_chunk(self):
+        """短い行の後ろの長い段落は空白位置で分割して現在のチャンクを埋める"""
+        text = "Summary:\n" + " ".join(["word"] * 1000)
+        chunks = split_message(text, max_len=2000)
+        assert len(chunks[0]) > 1900
+        assert chunks[0].startswith("Summary:\nword")
+        assert all(not c.startswith(" ") for c in chunks)
+
+    def test_no_blank_chunks(self):
+        text = "a" * 1990 + "\n\n\n\n\n" + "b" * 100
+        chunks = split_message(text, max_len=2000)
+        assert chunks == ["a" * 1990, "b" * 100]
+
+    def test_random_documents_respect_limit(self):
+        rng = random.Random(0)
+        words = ["alpha", "```python", "```", "~~~", "| a | b |", "x" * 300, "", "  code", "日本語"]
+        for _ in range(500):
+            text = "\n".join(
+                " ".join(rng.choice(words) for _ in range(rng.randint(1, 6)))
+                for _ in range(rng.randint(1, 150))
+            )
+            for max_len in (150, 2000):
+                chunks = split_message(text, max_len=max_len)
+                assert all(len(c) <= max_len for c in chunks)
+                assert all(c.strip() for c in chunks) or chunks == [text]
+
+    def test_large_input_linear_time(self):
+        text = ("para " * 100 + "\n") * 20000 + "```\n" + "print(1)\n" * 50000 + "```\n"
+        start = time.monotonic()
+        chunks = split_message(text)
+        assert time.monotonic() - start < 5
+        assert all(len(c) <= 2000 for c in chunks)
+
+    def test_invalid_max_len(self):
+        with pytest.raises(ValueError):
+            split_message("text", max_len=0)
+
+
+class TestTruncate:
+    """truncate のテスト"""
+
+    def test_short_text_unchanged(self):
+        assert truncate("hello", 10) == "hello"
+
+    def test_truncated_with_suffix(self):
+        result = truncate("line one\nline two\n" + "x" * 100, 30)
+        assert result == "line one\nline two…"
+
+    def test_suffix_inside_reopened_fence(self):
+        text = "intro\n```py\n" + "x = 1\n" * 600 + "```\n"
+        result = truncate(text, 200)
+        assert len(result) <= 200
+        assert result.startswith("intro\n```py\nx = 1")
+        assert result.endswith("x = 1…\n```")
+
+    def test_tiny_budget_falls_back_to_slicing(self):
+        assert truncate("abcdefghij", 5) == "abcd…"
+        assert truncate("abcdefghij", 1) == "a"
@@ -0,0 +1,239 @@
+"""tests/test_discord.py — Discord REST クライアント（keep-alive 接続プール）のテスト"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+import unittest.mock as mock
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+from lib import discord, ratelimit, trace  # noqa: E402
+from lib.multipart import MultipartBody  # noqa: E402
+
+
+class _FakeClock:
+    """sleep() で時刻が進む time モジュールの代替（レート制限待機の検証用）。"""
+
+    def __init__(self) -> None:
+        self.now = time.time()
+        self.sleeps: list[float] = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    fake = _FakeClock()
+    with mock.patch.object(ratelimit, "time", fake):
+        yield fake
+
+
+@pytest.fixture(autouse=True)
+def isolated_ratelimit_state(tmp_path):
+    with mock.patch.object(ratelimit, "STATE_PATH", str(tmp_path / "ratelimit.json")):
+        yield
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.connections += 1  # type: ignore[attr-defined]
+
+    def do_POST(self) -> None:  # noqa: N802
+        length = int(self.headers.get("Content-Length", "0"))
+        body = self.rfile.read(length)
+        self.server.requests.append((self.path, dict(self.headers), body))  # type: ignore[attr-defined]
+        status, headers, payload = self.server.responses.pop(0)  # type: ignore[attr-defined]
+        data = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if headers.get("X-Test-Close"):
+            # Connection: close を付けずにサーバー側から切断する（アイドル切断の再現）
+            self.close_connection = True
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.connections = 0  # type: ignore[attr-defined]
+    srv.requests = []  # type: ignore[attr-defined]
+    srv.responses = []  # type: ignore[attr-defined]
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{srv.server_address[1]}/api/v10"
+    with mock.patch.object(discord, "API_BASE", base):
+        yield srv
+    discord.close_all()
+    srv.shutdown()
+    srv.server_close()
+
+
+class TestPostMessage:
+    def test_connection_reused_across_requests(self, server):
+        """連続した送信で同じ TCP 接続を使い回す。"""
+        server.responses = [(200, {}, {"id": "1"}), (200, {}, {"id": "2"}), (200, {}, {"id": "3"})]
+        for i in range(3):
+            discord.post_message("tok", "123", f"chunk {i}")
+        assert server.connections == 1
+        assert [r[0] for r in server.requests] == ["/api/v10/channels/123/messages"] * 3
+
+    def test_payload_and_headers(self, server):
+        """content / components と認証ヘッダーが送信され、レスポンス JSON が返る。"""
+        server.responses = [(200, {}, {"id": "m-1"})]
+        components = [{"type": 1, "components": []}]
+        result = discord.post_message("tok", "123", "hello", components=components)
+        assert result == {"id": "m-1"}
+        _, headers, body = server.requests[0]
+        assert json.loads(body) == {"content": "hello", "components": components}
+        assert headers["Authorization"] == "Bot tok"
+        assert headers["Content-Type"] == "application/json"
+
+    def test_rate_limit_retry(self, server, clock):
+        """429 の場合は Retry-After 待機後に再送する。"""
+        server.responses = [
+            (429, {"Retry-After": "5", "X-RateLimit-Bucket": "b1"}, {"retry_after": 5}),
+            (200, {}, {"id": "1"}),
+        ]
+        discord.post_message("tok", "123", "hello")
+        assert clock.sleeps == [5.0]
+        assert len(server.requests) == 2
+
+    def test_trace_counters(self, server, clock):
+        """計測中はリクエスト数・送信バイト数・429 の回数を trace に加算する。"""
+        server.responses = [
+            (429, {"Retry-After": "1", "X-RateLimit-Bucket": "b1"}, {"retry_after": 1}),
+            (200, {}, {"id": "1"}),
+        ]
+        trace.begin("test")
+        try:
+            discord.post_message("tok", "123", "hello")
+            counters = dict(trace._current.counters)
+        finally:
+            trace._current = None
+        body_size = len(server.requests[0][2])
+        assert counters == {"requests": 2, "bytes_out": 2 * body_size, "http_429": 1}
+
+    def test_bucket_exhaustion_delays_next_request(self, server, clock):
+        """Remaining=0 を受け取った後の送信はリセットまで待機してから行う。"""
+        server.responses = [
+            (200, {"X-RateLimit-Bucket": "b1", "X-RateLimit-Remaining": "0",
+                   "X-RateLimit-Reset-After": "2"}, None),
+            (200, {}, None),
+        ]
+        discord.post_message("tok", "123", "first")
+        assert clock.sleeps == []
+        discord.post_message("tok", "123", "second")
+        assert clock.sleeps == [2.0]
+
+    def test_rate_limit_exhausted(self, server, clock):
+        """リトライ上限に達したら URLError。"""
+        server.responses = [(429, {"Retry-After": "0"}, None)] * 2
+        with pytest.raises(urllib.error.URLError):
+            discord.post_message("tok", "123", "hello", max_retries=2)
+
+    def test_http_error_raised_with_code(self, server):
+        """4xx は HTTPError として送出され、code で判定できる。"""
+        server.responses = [(404, {}, {"message": "Unknown Channel"})]
+        with pytest.raises(urllib.error.HTTPError) as exc_info:
+            discord.post_message("tok", "123", "hello")
+        assert exc_info.value.code == 404
+
+    def test_stale_connection_retried(self, server):
+        """サーバー側で閉じられた keep-alive 接続は新しい接続で再送する。"""
+        server.responses = [(200, {"X-Test-Close": "1"}, None), (200, {}, None)]
+        discord.post_message("tok", "123", "first")
+        time.sleep(0.05)
+        discord.post_message("tok", "123", "second")
+        assert len(server.requests) == 2
+        assert server.connections == 2
+
+    def test_one_shot_body_uses_new_connection(self, server):
+        """一度しか読めない本文は再送できないため、古い可能性のあるアイドル接続を使わない。"""
+        server.responses = [(200, {}, None), (200, {}, None)]
+        discord.post_message("tok", "123", "first")
+        discord.request("POST", "/channels/123/messages", "tok", body=iter([b"{}"]), content_length=2)
+        assert server.requests[1][2] == b"{}"
+        assert server.connections == 2
+
+    def test_connection_refused_is_url_error(self):
+        """接続できない場合は URLError。"""
+        with mock.patch.object(discord, "API_BASE", "http://127.0.0.1:9/api/v10"):
+            with pytest.raises(urllib.error.URLError):
+                discord.post_message("tok", "123", "hello")
+
+    def test_api_base_from_env(self, server, tmp_path):
+        """DISCORD_BRIDGE_API_BASE が設定されていればそちらに送信する（末尾の / は無視）。"""
+        server.responses = [(200, {}, {"id": "1"})]
+        env = {discord.ENV_API_BASE: discord.API_BASE + "/"}
+        with mock.patch.object(discord, "API_BASE", "http://127.0.0.1:9/api/v10"), \
+                mock.patch.object(ratelimit, "_STATE_PATH_FOR_BASE", str(tmp_path / "rl-{digest}.json")), \
+                mock.patch.dict(os.environ, env):
+            assert discord.post_message("tok", "123", "hello") == {"id": "1"}
+        assert server.requests[0][0] == "/api/v10/channels/123/messages"
+
+
+class TestMultipartUpload:
+    def test_body_streamed_with_content_length(self, server, tmp_path):
+        """添付ファイルはディスクから送信され、Content-Length がボディ長と一致する。"""
+        data = bytes(range(256)) * 1000
+        path = tmp_path / "out.bin"
+        path.write_bytes(data)
+        body = MultipartBody("bnd", "hello", [("out.bin", str(path))])
+        server.responses = [(200, {}, {"id": "1"})]
+        discord.post_multipart("tok", "123", body.boundary, body, content_length=body.content_length)
+
+        _, headers, sent = server.requests[0]
+        assert int(headers["Content-Length"]) == len(sent) == body.content_length
+        assert headers["Content-Type"] == "multipart/form-data; boundary=bnd"
+        assert sent.startswith(b'--bnd\r\nContent-Disposition: form-data; name="payload_json"')
+        assert b'{"content": "hello"}' in sent
+        assert b'name="files[0]"; filename="out.bin"\r\n' in sent
+        assert data in sent
+        assert sent.endswith(b"\r\n--bnd--\r\n")
+
+    def test_body_reiterable_for_retry(self, server, tmp_path, clock):
+        """429 リトライ時も同じボディを再送できる。"""
+        path = tmp_path / "a.txt"
+        path.write_bytes(b"abc")
+        body = MultipartBody("bnd", "", [("a.txt", str(path))])
+        server.responses = [(429, {"Retry-After": "0"}, None), (200, {}, None)]
+        discord.post_multipart("tok", "123", body.boundary, body, content_length=body.content_length)
+        assert server.requests[0][2] == server.requests[1][2] == b"".join(body)
+
+    def test_peak_memory_independent_of_file_size(self, tmp_path):
+        """ボディのイテレート中にファイル全体をメモリに載せない。"""
+        import tracemalloc
+
+        path = tmp_path / "big.bin"
+        with open(path, "wb") as f:
+            f.truncate(16 * 1024 * 1024)
+        body = MultipartBody("bnd", "x", [("big.bin", str(path))])
+        tracemalloc.start()
+        total = sum(len(chunk) for chunk in body)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert total == body.content_length
+        assert peak < 1024 * 1024
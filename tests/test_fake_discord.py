@@ -0,0 +1,121 @@
+"""tests/test_fake_discord.py — 負荷試験用の Discord スタンドイン（bench/fake_discord）のテスト
+
+hooks の Discord クライアント（lib/discord）を DISCORD_BRIDGE_API_BASE でスタンドインに向けて送信する。
+"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+import unittest.mock as mock
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "bench"))
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+import fake_discord  # noqa: E402
+from lib import discord, ratelimit  # noqa: E402
+from lib.multipart import MultipartBody  # noqa: E402
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    """スタンドインを起動し、DISCORD_BRIDGE_API_BASE をその URL に設定する関数を返す。"""
+    servers: list[fake_discord.FakeDiscord] = []
+
+    def start(**options) -> fake_discord.FakeDiscord:
+        server = fake_discord.FakeDiscord(seed=0, **options).start()
+        servers.append(server)
+        os.environ[discord.ENV_API_BASE] = server.url
+        return server
+
+    state_template = str(tmp_path / "ratelimit-{digest}.json")
+    with mock.patch.dict(os.environ), mock.patch.object(ratelimit, "_STATE_PATH_FOR_BASE", state_template):
+        yield start
+    discord.close_all()
+    for server in servers:
+        server.stop()
+
+
+class TestMessages:
+    def test_post_and_edit(self, start_server):
+        server = start_server()
+        message = discord.post_message("tok", "111", "hello")
+        assert message["channel_id"] == "111"
+        edited = discord.edit_message("tok", "111", message["id"], "edited")
+        assert edited["content"] == "edited"
+        assert [(r["method"], r["status"]) for r in server.requests] == [("POST", 200), ("PATCH", 200)]
+
+    def test_multipart(self, start_server, tmp_path):
+        server = start_server()
+        attachment = tmp_path / "reply.md"
+        attachment.write_text("x" * 5000)
+        body = MultipartBody("b0undary", "本文", [("reply.md", str(attachment))])
+        message = discord.post_multipart("tok", "111", body.boundary, body, content_length=body.content_length)
+        assert message["content"] == "本文"
+        assert message["attachments"][0]["size"] == 5000
+        assert server.requests[0]["files"] == [{"name": "files[0]", "filename": "reply.md", "size": 5000}]
+
+    def test_buttons_validated(self, start_server):
+        server = start_server()
+        row = {"type": 1, "components": [{"type": 2, "style": 1, "label": "OK", "custom_id": "perm_allow:1"}]}
+        discord.post_message("tok", "111", "ask", components=[row])
+        assert server.requests[0]["buttons"] == ["perm_allow:1"]
+        too_many = {"type": 1, "components": [row["components"][0]] * 6}
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            discord.post_message("tok", "111", "ask", components=[too_many])
+        assert excinfo.value.code == 400
+
+    def test_content_too_long(self, start_server):
+        start_server()
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            discord.post_message("tok", "111", "x" * 2001)
+        assert excinfo.value.code == 400
+
+    def test_archived_thread_404(self, start_server):
+        start_server(archived={"999"})
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            discord.post_message("tok", "999", "hello")
+        assert excinfo.value.code == 404
+
+
+class TestRateLimits:
+    def test_headers(self, start_server):
+        server = start_server(rate_limit=3, rate_window=60)
+        discord.post_message("tok", "111", "a")
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/_fake/requests") as resp:
+            assert len(json.load(resp)) == 1
+        state = json.loads(Path(ratelimit.state_path()).read_text())
+        assert state["bots"][ratelimit._bot_key("tok")]["buckets"]["fake-create-message:111"]["remaining"] == 2
+
+    def test_bucket_exhaustion_waits_and_retries(self, start_server):
+        server = start_server(rate_limit=1, rate_window=0.3)
+        discord.post_message("tok", "111", "a")
+        # 共有状態の残数 0 を見て、リセットまで待ってから送信する（429 にならない）
+        discord.post_message("tok", "111", "b")
+        assert [r["status"] for r in server.requests] == [200, 200]
+
+    def test_injected_429_is_retried(self, start_server):
+        server = start_server(inject_429=1.0, retry_after=0.05)
+        with pytest.raises(urllib.error.URLError):
+            discord.post_message("tok", "111", "a", max_retries=2)
+        assert [(r["status"], r["rate_limited"]) for r in server.requests] == [(429, "injected")] * 2
+        assert server.stats()["by_status"] == {"429": 2}
+
+
+class TestRecording:
+    def test_record_file_and_reset(self, start_server, tmp_path):
+        record = tmp_path / "requests.jsonl"
+        server = start_server(record_path=str(record))
+        discord.post_message("tok", "111", "a")
+        discord.post_message("tok", "222", "b")
+        lines = [json.loads(line) for line in record.read_text().splitlines()]
+        assert [r["channel_id"] for r in lines] == ["111", "222"]
+        assert server.stats()["delivered_by_channel"] == {"111": 1, "222": 1}
+        req = urllib.request.Request(f"http://127.0.0.1:{server.server_address[1]}/_fake/reset", method="POST", data=b"")
+        urllib.request.urlopen(req).close()
+        assert server.requests == []
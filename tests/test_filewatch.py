@@ -0,0 +1,90 @@
+"""tests/test_filewatch.py — ファイルの追記待ち（lib/filewatch）のテスト"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+import unittest.mock as mock
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+from lib import filewatch  # noqa: E402
+
+
+@pytest.fixture(params=["inotify", "poll"])
+def backend(request):
+    """inotify とポーリングの両方で実行する（inotify が使えない環境では inotify 側をスキップ）。"""
+    if request.param == "inotify":
+        if filewatch._inotify_libc() is None:
+            pytest.skip("inotify is not available")
+        yield request.param
+    else:
+        with mock.patch.object(filewatch, "_inotify_libc", return_value=None):
+            yield request.param
+
+
+def _append_later(path: Path, text: str, delay: float) -> threading.Thread:
+    def append() -> None:
+        time.sleep(delay)
+        with open(path, "a") as f:
+            f.write(text)
+
+    thread = threading.Thread(target=append)
+    thread.start()
+    return thread
+
+
+def test_returns_immediately_when_ready(tmp_path, backend):
+    path = tmp_path / "t.jsonl"
+    path.write_text("ready")
+    started = time.monotonic()
+    assert filewatch.wait_until(str(path), path.read_text, timeout=5) == "ready"
+    assert time.monotonic() - started < 0.5
+
+
+def test_wakes_on_append(tmp_path, backend):
+    path = tmp_path / "t.jsonl"
+    path.write_text("")
+    thread = _append_later(path, "line\n", delay=0.1)
+    started = time.monotonic()
+    assert filewatch.wait_until(str(path), path.read_text, timeout=5) == "line\n"
+    thread.join()
+    # 上限（5秒）ではなく追記の直後に戻る
+    assert time.monotonic() - started < 1.0
+
+
+def test_rechecks_until_check_passes(tmp_path, backend):
+    """追記されても check() が偽のあいだは待ち続ける（書きかけの行など）。"""
+    path = tmp_path / "t.jsonl"
+    path.write_text("")
+    thread = _append_later(path, "partial", delay=0.05)
+    later = _append_later(path, " done\n", delay=0.2)
+    result = filewatch.wait_until(str(path), lambda: path.read_text().endswith("\n"), timeout=5)
+    thread.join()
+    later.join()
+    assert result is True
+
+
+def test_timeout_returns_last_result(tmp_path, backend):
+    path = tmp_path / "t.jsonl"
+    path.write_text("")
+    calls = []
+
+    def check() -> list:
+        calls.append(1)
+        return []
+
+    started = time.monotonic()
+    assert filewatch.wait_until(str(path), check, timeout=0.2) == []
+    assert 0.2 <= time.monotonic() - started < 1.0
+    assert len(calls) >= 2  # 期限切れ後にもう1回確認する
+
+
+def test_missing_file_falls_back_to_polling(tmp_path):
+    path = tmp_path / "missing.jsonl"
+    thread = _append_later(path, "created", delay=0.1)
+    assert filewatch.wait_until(str(path), lambda: path.exists() and path.read_text(), timeout=5) == "created"
+    thread.join()
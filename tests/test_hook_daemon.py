@@ -0,0 +1,221 @@
+"""tests/test_hook_daemon.py — 常駐 hook デーモンと転送クライアントのテスト"""
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+sys.path.insert(0, str(Path(__file__).parent.parent / "bench"))
+
+import fake_discord  # noqa: E402
+import hook_daemon  # noqa: E402
+from lib import daemon_client, discord, http_relay  # noqa: E402
+
+
+def _fake_hook() -> types.ModuleType:
+    module = types.ModuleType("fake_hook")
+    module.DEBUG = False
+
+    def main() -> None:
+        hook_input = json.load(sys.stdin)
+        print(json.dumps({
+            "echo": hook_input,
+            "thread": os.environ.get("DISCORD_BRIDGE_THREAD_ID"),
+            "debug": module.DEBUG,
+        }))
+        print("warn", file=sys.stderr)
+        sys.exit(hook_input.get("exit", 0))
+
+    module.main = main
+    return module
+
+
+def _posting_hook() -> types.ModuleType:
+    """stdin の内容を Discord に送信する hook。"""
+    module = types.ModuleType("posting_hook")
+
+    def main() -> None:
+        discord.post_message("tok", "111", sys.stdin.read())
+
+    module.main = main
+    return module
+
+
+@pytest.fixture
+def sock_dir():
+    # AF_UNIX のパス長制限を避けるため短いディレクトリを使う
+    path = tempfile.mkdtemp(prefix="dbh-")
+    yield path
+    for name in os.listdir(path):
+        os.unlink(os.path.join(path, name))
+    os.rmdir(path)
+
+
+@pytest.fixture
+def daemon(sock_dir):
+    path = os.path.join(sock_dir, "hooks.sock")
+    server = hook_daemon.HookDaemon(path, {"fake": _fake_hook(), "post": _posting_hook()})
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    try:
+        yield path
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class TestForward:
+    def test_round_trip(self, daemon, monkeypatch):
+        """stdin・環境変数が転送され、stdout / stderr / exit code が返る。"""
+        monkeypatch.setenv("DISCORD_BRIDGE_THREAD_ID", "thread-123")
+        monkeypatch.setenv("DISCORD_BRIDGE_DEBUG", "1")
+        payload = json.dumps({"message": "日本語", "exit": 2}).encode()
+        result = daemon_client.forward("fake", payload, path=daemon)
+        assert result is not None
+        exit_code, out, err = result
+        assert exit_code == 2
+        assert json.loads(out) == {
+            "echo": {"message": "日本語", "exit": 2},
+            "thread": "thread-123",
+            "debug": True,
+        }
+        assert err == "warn\n"
+
+    def test_unknown_hook_is_error(self, daemon):
+        """未登録の hook 名はエラー終了として返る。"""
+        result = daemon_client.forward("missing", b"{}", path=daemon)
+        assert result is not None
+        assert result[0] == 1
+        assert "Bad request" in result[2]
+
+    def test_daemon_down_returns_none(self, tmp_path):
+        """デーモンが稼働していなければ None（プロセス内処理へフォールバック）。"""
+        assert daemon_client.forward("fake", b"{}", path=str(tmp_path / "none.sock")) is None
+
+    def test_disabled_by_env(self, daemon, monkeypatch):
+        """DISCORD_BRIDGE_NO_DAEMON=1 の場合は転送しない。"""
+        monkeypatch.setenv("DISCORD_BRIDGE_NO_DAEMON", "1")
+        assert daemon_client.forward("fake", b"{}", path=daemon) is None
+
+
+class TestRunHook:
+    def test_uncaught_exception_is_exit_1(self):
+        """hook 内の例外は traceback を stderr に出して exit 1 になる。"""
+        module = types.ModuleType("boom")
+
+        def main() -> None:
+            raise RuntimeError("boom")
+
+        module.main = main
+        exit_code, out, err = hook_daemon.run_hook(module, "")
+        assert exit_code == 1
+        assert out == ""
+        assert "RuntimeError: boom" in err
+
+
+class TestRelay:
+    @pytest.fixture
+    def fake(self, monkeypatch):
+        server = fake_discord.FakeDiscord(seed=0).start()
+        monkeypatch.setenv(discord.ENV_API_BASE, server.url)
+        yield server
+        server.stop()
+
+    def _post_n(self, daemon: str, n: int) -> None:
+        for i in range(n):
+            exit_code, _, err = daemon_client.forward("post", f"message {i}".encode(), path=daemon)
+            assert exit_code == 0, err
+
+    def test_connection_reused_across_hook_calls(self, daemon, sock_dir, fake):
+        """リレー経由では N 回の hook 呼び出しで Discord への接続は1つだけ。"""
+        path = http_relay.relay_path(os.path.join(sock_dir, "hooks.sock"))
+        pid = hook_daemon.start_relay(path)
+        discord.use_relay(path)
+        try:
+            self._post_n(daemon, 5)
+        finally:
+            discord.use_relay(None)
+            hook_daemon.stop_relay(pid, path)
+        assert [m["content"] for m in fake.messages.values()] == [f"message {i}" for i in range(5)]
+        assert fake.stats()["connections"] == 1
+
+    def test_without_relay_each_call_connects(self, daemon, fake):
+        """リレーがなければ hook の呼び出しごとに新しい接続になる（fork した子プロセスの接続は残らない）。"""
+        self._post_n(daemon, 3)
+        assert fake.stats()["connections"] == 3
+
+    @pytest.fixture
+    def relay(self, sock_dir):
+        """send_once を記録用の関数に差し替えたリレーをこのプロセスのスレッドで動かす。"""
+        received: list = []
+
+        def send_once(method, url, headers, body, timeout):
+            if isinstance(body, bytes):
+                received.append(("bytes", len(body)))
+            else:
+                try:
+                    received.append(("stream", sum(len(chunk) for chunk in body)))
+                except ConnectionError:
+                    received.append(("aborted", 0))
+                    raise
+            return 200, "OK", http.client.HTTPMessage(), b""
+
+        path = os.path.join(sock_dir, "relay.sock")
+        server = http_relay.RelayServer(path, send_once)
+        thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        thread.start()
+        yield path, received
+        server.shutdown()
+        server.server_close()
+
+    def test_large_body_streamed_without_buffering(self, relay):
+        """大きな本文（添付の multipart）はリレーで読み切らずに中継する。"""
+        import tracemalloc
+
+        path, received = relay
+        size = 16 * 1024 * 1024
+        chunks = (b"x" * http_relay.CHUNK_SIZE for _ in range(size // http_relay.CHUNK_SIZE))
+        tracemalloc.start()
+        http_relay.forward(path, "POST", "http://x/", {"Content-Length": str(size)}, chunks, 10)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert received == [("stream", size)]
+        assert peak < 2 * 1024 * 1024
+
+    def test_small_body_read_whole(self, relay):
+        path, received = relay
+        http_relay.forward(path, "POST", "http://x/", {}, b'{"content": "hi"}', 10)
+        assert received == [("bytes", 17)]
+
+    def test_sender_failing_mid_body_aborts_send(self, relay):
+        """送信元が本文の途中で失敗した場合は Content-Length に満たない本文を送らずに中断する。"""
+        path, received = relay
+        size = 4 * http_relay.CHUNK_SIZE
+
+        def chunks():
+            yield b"x" * http_relay.CHUNK_SIZE
+            raise OSError("attachment shrank during upload")
+
+        with pytest.raises(OSError):
+            http_relay.forward(path, "POST", "http://x/", {"Content-Length": str(size)}, chunks(), 10)
+        deadline = time.monotonic() + 5
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert received == [("aborted", 0)]
+
+    def test_relay_down_falls_back_to_direct(self, daemon, sock_dir, fake):
+        discord.use_relay(os.path.join(sock_dir, "missing.sock"))
+        try:
+            self._post_n(daemon, 2)
+        finally:
+            discord.use_relay(None)
+        assert fake.stats()["requests"] == 2
@@ -3,12 +3,15 @@
 import io
 import json
 import os
+import sqlite3
 import sys
 import tempfile
 import time
 import unittest.mock as mock
 import urllib.error
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
 
 import pytest
@@ -18,11 +21,24 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
 
 import stop  # noqa: E402  (パス追加後のインポートのため)
 import pre_tool_use  # noqa: E402
+import pre_tool_progress  # noqa: E402
+import pre_tool  # noqa: E402
+from lib import progress, state  # noqa: E402
 from lib.config import resolve_channel  # noqa: E402
 from lib.thread import get_thread_id, resolve_target_channel, clear_thread_tracking  # noqa: E402
 from lib.transcript import get_assistant_messages  # noqa: E402
 
 
+@pytest.fixture
+def isolated_state(tmp_path_factory):
+    """状態ストア（lib/state）を tmp_path の DB に切り替える。"""
+    state_dir = tmp_path_factory.mktemp("state")
+    state.close()
+    with mock.patch.object(state, "DB_PATH", str(state_dir / "state.db")):
+        yield state_dir
+        state.close()
+
+
 # ---------------------------------------------------------------------------
 # extract_attachments
 # ---------------------------------------------------------------------------
@@ -68,6 +84,63 @@ class TestExtractAttachments:
         assert paths == []
 
 
+# ---------------------------------------------------------------------------
+# pack_attachments / post_message_with_files
+# ---------------------------------------------------------------------------
+
+class TestPackAttachments:
+    def test_respects_file_count_limit(self):
+        """1メッセージあたり最大 10 ファイル。"""
+        files = [(f"f{i}", f"/p/f{i}", 1) for i in range(23)]
+        groups = stop.pack_attachments(files)
+        assert [len(g) for g in groups] == [10, 10, 3]
+        assert sorted(f for g in groups for f in g) == sorted(files)
+
+    def test_respects_byte_limit_with_fewest_groups(self):
+        """合計サイズ上限内で大きい順に詰め、メッセージ数を最小にする。"""
+        files = [("a", "/a", 6), ("b", "/b", 5), ("c", "/c", 4), ("d", "/d", 3), ("e", "/e", 2)]
+        groups = stop.pack_attachments(files, max_bytes=10)
+        assert len(groups) == 2
+        assert all(sum(f[2] for f in g) <= 10 for g in groups)
+
+    def test_group_keeps_original_order(self):
+        files = [("small", "/s", 1), ("big", "/b", 9), ("mid", "/m", 5)]
+        assert stop.pack_attachments(files) == [files]
+
+
+class TestPostMessageWithFiles:
+    @pytest.fixture
+    def outputs(self, tmp_path):
+        with mock.patch.object(stop, "ATTACH_ALLOWED_DIR", str(tmp_path)):
+            yield tmp_path
+
+    def test_many_files_split_into_batches(self, outputs):
+        """上限を超える添付は複数メッセージに分割し、テキストは先頭メッセージのみに付く。"""
+        names = [f"img{i:02d}.png" for i in range(12)]
+        for name in names:
+            (outputs / name).write_bytes(b"x" * 10)
+        with mock.patch("stop.post_multipart") as mock_post:
+            stop.post_message_with_files("tok", "chan", "本文", names)
+        assert mock_post.call_count == 2
+        bodies = [c[0][3] for c in mock_post.call_args_list]
+        first = b"".join(bodies[0])
+        assert b'{"content": "\\u672c\\u6587"}' in first
+        assert b'"content"' not in b"".join(bodies[1])
+        sent = sorted(n for b in bodies for n in names if f'filename="{n}"'.encode() in b"".join(b))
+        assert sent == names
+
+    def test_additional_batch_failure_raises_url_error(self, outputs):
+        """2通目以降の失敗は HTTPError ではなく URLError（親チャンネルへの再送を避ける）。"""
+        names = [f"f{i:02d}.txt" for i in range(11)]
+        for name in names:
+            (outputs / name).write_bytes(b"x")
+        error = urllib.error.HTTPError("url", 500, "err", {}, None)
+        with mock.patch("stop.post_multipart", side_effect=[None, error]):
+            with pytest.raises(urllib.error.URLError) as exc_info:
+                stop.post_message_with_files("tok", "chan", "text", names)
+        assert not isinstance(exc_info.value, urllib.error.HTTPError)
+
+
 # ---------------------------------------------------------------------------
 # get_assistant_messages (lib.transcript)
 # ---------------------------------------------------------------------------
@@ -88,6 +161,29 @@ class TestGetAssistantMessages:
         result = get_assistant_messages(path)
         assert result == ["お手伝いします"]
 
+    def test_wait_for_content_returns_on_append(self, tmp_path):
+        """wait_for_content は transcript への追記を待ち、追記された時点で返す。"""
+        path = self._write_jsonl(tmp_path, [{"type": "user", "message": {"content": "質問"}}])
+
+        def append() -> None:
+            time.sleep(0.1)
+            with open(path, "a") as f:
+                f.write(json.dumps({"type": "assistant", "message": {"content": "回答"}}) + "\n")
+
+        with ThreadPoolExecutor(1) as pool:
+            started = time.monotonic()
+            pool.submit(append)
+            result = get_assistant_messages(path, wait_for_content=True)
+            elapsed = time.monotonic() - started
+        assert result == ["回答"]
+        assert elapsed < 0.5
+
+    def test_wait_for_content_gives_up_after_timeout(self, tmp_path):
+        """内容が追記されなければ WAIT_FOR_CONTENT_TIMEOUT 秒で空リストを返す。"""
+        path = self._write_jsonl(tmp_path, [{"type": "user", "message": {"content": "質問"}}])
+        with mock.patch("lib.transcript.WAIT_FOR_CONTENT_TIMEOUT", 0.1):
+            assert get_assistant_messages(path, wait_for_content=True) == []
+
     def test_nonexistent_file_returns_empty(self):
         """存在しないファイルは空リストを返す（例外を出さない）。"""
         result = get_assistant_messages("/nonexistent/path/transcript.jsonl")
@@ -189,6 +285,128 @@ class TestGetAssistantMessages:
         result = get_assistant_messages(path)
         assert result == ["新しい回答"]
 
+    def test_small_blocks_reassemble_lines(self, tmp_path):
+        """ブロック境界をまたぐ行（マルチバイト文字含む）も正しく復元される。"""
+        entries = [
+            {"type": "assistant", "message": {"content": "古い回答"}},
+            {"type": "user", "message": {"content": "質問"}},
+            {"type": "assistant", "message": {"content": "日本語の回答1"}},
+            {"type": "assistant", "message": {"content": "日本語の回答2"}},
+        ]
+        jsonl = tmp_path / "transcript.jsonl"
+        jsonl.write_text(
+            "\n".join(json.dumps(e, ensure_ascii=False) for e in entries) + "\n",
+            encoding="utf-8",
+        )
+        with mock.patch("lib.transcript._REVERSE_BLOCK_SIZE", 5):
+            result = get_assistant_messages(str(jsonl))
+        assert result == ["日本語の回答1", "日本語の回答2"]
+
+    def test_last_line_without_newline(self, tmp_path):
+        """末尾に改行がない最終行も読み取れる。"""
+        entries = [
+            {"type": "user", "message": {"content": "質問"}},
+            {"type": "assistant", "message": {"content": "回答"}},
+        ]
+        jsonl = tmp_path / "transcript.jsonl"
+        jsonl.write_text("\n".join(json.dumps(e) for e in entries))
+        assert get_assistant_messages(str(jsonl)) == ["回答"]
+
+    def test_stops_reading_at_boundary(self, tmp_path):
+        """境界より前の行はデコードしない（不正な行があっても影響しない）。"""
+        jsonl = tmp_path / "transcript.jsonl"
+        jsonl.write_text(
+            "{not json\n" * 1000
+            + json.dumps({"type": "user", "message": {"content": "質問"}}) + "\n"
+            + json.dumps({"type": "assistant", "message": {"content": "回答"}}) + "\n"
+        )
+        with mock.patch("lib.transcript.json.loads", wraps=json.loads) as mock_loads:
+            result = get_assistant_messages(str(jsonl))
+        assert result == ["回答"]
+        assert mock_loads.call_count == 2
+
+
+# ---------------------------------------------------------------------------
+# get_assistant_messages（セッション単位オフセットインデックス）
+# ---------------------------------------------------------------------------
+
+class TestTranscriptIndex:
+    @pytest.fixture(autouse=True)
+    def _index_dir(self, tmp_path):
+        template = str(tmp_path / "index-{session_id}.json")
+        with mock.patch("lib.transcript.INDEX_PATH_TEMPLATE", template):
+            yield
+
+    def _append(self, path: Path, *entries: dict) -> None:
+        with open(path, "a") as f:
+            for e in entries:
+                f.write(json.dumps(e) + "\n")
+
+    def test_index_written_with_offset(self, tmp_path):
+        """初回呼び出しでインデックスにオフセットと inode が記録される。"""
+        path = tmp_path / "t.jsonl"
+        self._append(path, {"type": "user", "message": {"content": "質問"}},
+                     {"type": "assistant", "message": {"content": "回答"}})
+        assert get_assistant_messages(str(path), session_id="s1") == ["回答"]
+        index = json.loads((tmp_path / "index-s1.json").read_text())
+        assert index["offset"] == path.stat().st_size
+        assert index["ino"] == path.stat().st_ino
+
+    def test_only_appended_lines_parsed(self, tmp_path):
+        """2回目以降は追記された行のみデコードする。"""
+        path = tmp_path / "t.jsonl"
+        self._append(path, {"type": "user", "message": {"content": "質問"}},
+                     {"type": "assistant", "message": {"content": "回答1"}})
+        get_assistant_messages(str(path), session_id="s1")
+        self._append(path, {"type": "assistant", "message": {"content": "回答2"}})
+        import lib.transcript as transcript
+        with mock.patch.object(
+            transcript, "_decode_entry", wraps=transcript._decode_entry,
+        ) as mock_decode:
+            result = get_assistant_messages(str(path), session_id="s1")
+        assert result == ["回答1", "回答2"]
+        # 追記された1行 + 末尾の空フラグメント
+        assert mock_decode.call_count == 2
+
+    def test_modes_share_index(self, tmp_path):
+        """Stop / PreToolUse の両境界モードを同じインデックスで扱える。"""
+        path = tmp_path / "t.jsonl"
+        self._append(
+            path,
+            {"type": "user", "message": {"content": "質問"}},
+            {"type": "assistant", "message": {"content": "説明1"}},
+            {"type": "user", "message": {"content": [{"type": "tool_result", "tool_use_id": "x"}]}},
+            {"type": "assistant", "message": {"content": "説明2"}},
+        )
+        assert get_assistant_messages(str(path), session_id="s1") == ["説明1", "説明2"]
+        assert get_assistant_messages(
+            str(path), tool_result_as_boundary=True, session_id="s1",
+        ) == ["説明2"]
+
+    def test_truncated_file_rebuilds(self, tmp_path):
+        """ファイルが切り詰められた場合はフルスキャンで再構築する。"""
+        path = tmp_path / "t.jsonl"
+        self._append(path, {"type": "user", "message": {"content": "質問"}},
+                     {"type": "assistant", "message": {"content": "古い回答" * 20}})
+        get_assistant_messages(str(path), session_id="s1")
+        path.write_text("")
+        self._append(path, {"type": "assistant", "message": {"content": "新しい回答"}})
+        assert get_assistant_messages(str(path), session_id="s1") == ["新しい回答"]
+
+    def test_partial_last_line_not_committed(self, tmp_path):
+        """改行で終わっていない末尾行はインデックスのオフセットに含めない。"""
+        path = tmp_path / "t.jsonl"
+        self._append(path, {"type": "user", "message": {"content": "質問"}})
+        committed = path.stat().st_size
+        with open(path, "a") as f:
+            f.write(json.dumps({"type": "assistant", "message": {"content": "回答"}}))
+        assert get_assistant_messages(str(path), session_id="s1") == ["回答"]
+        index = json.loads((tmp_path / "index-s1.json").read_text())
+        assert index["offset"] == committed
+        with open(path, "a") as f:
+            f.write("\n")
+        assert get_assistant_messages(str(path), session_id="s1") == ["回答"]
+
 
 # ---------------------------------------------------------------------------
 # _dbg
@@ -238,6 +456,7 @@ class TestDbg:
 # stop.main (last_assistant_message 方式)
 # ---------------------------------------------------------------------------
 
+@pytest.mark.usefixtures("isolated_state")
 class TestStopMain:
     def test_empty_message_exits_without_sending(self):
         """last_assistant_message が空の場合、送信せずに exit(0) する。"""
@@ -254,6 +473,33 @@ class TestStopMain:
         assert exc_info.value.code == 0
         mock_post.assert_not_called()
 
+    def test_empty_message_waits_for_transcript(self, tmp_path):
+        """last_assistant_message が空の場合、transcript への追記を待って送信する。"""
+        transcript = tmp_path / "transcript.jsonl"
+        transcript.write_text(json.dumps({"type": "user", "message": {"content": "質問"}}) + "\n")
+        hook_input = {
+            "session_id": "",
+            "transcript_path": str(transcript),
+            "cwd": "/tmp/test-project",
+            "last_assistant_message": "",
+        }
+
+        def append() -> None:
+            time.sleep(0.1)
+            with open(transcript, "a") as f:
+                f.write(json.dumps({"type": "assistant", "message": {"content": "遅れて書かれた応答"}}) + "\n")
+
+        with mock.patch("sys.stdin", io.StringIO(json.dumps(hook_input))), \
+             mock.patch("stop.load_config", return_value={"schemaVersion": 2, "servers": []}), \
+             mock.patch("stop.resolve_channel", return_value=("chan-001", "token-xxx", "test-project", [])), \
+             mock.patch("stop.post_message") as mock_post, \
+             ThreadPoolExecutor(1) as pool:
+            started = time.monotonic()
+            pool.submit(append)
+            stop.main()
+        assert time.monotonic() - started < stop.TRANSCRIPT_FALLBACK_TIMEOUT
+        assert "遅れて書かれた応答" in mock_post.call_args[0][2]
+
     def test_message_sent(self):
         """有効な last_assistant_message は Discord に送信される。"""
         hook_input = {
@@ -283,14 +529,12 @@ class TestStopMain:
             "last_assistant_message": "完了しました。",
         }
         mock_config = {"schemaVersion": 2, "servers": []}
-        sentinel = tmp_path / f"discord-bridge-last-sent-{session_id}.txt"
         mock_post = mock.MagicMock()
 
         def run_main():
             with mock.patch("sys.stdin", io.StringIO(json.dumps(hook_input))), \
                  mock.patch("stop.load_config", return_value=mock_config), \
                  mock.patch("stop.resolve_channel", return_value=("chan-001", "token-xxx", "test-project", [])), \
-                 mock.patch("stop.Path", side_effect=lambda p: sentinel if "last-sent" in str(p) else Path(p)), \
                  mock.patch("stop.post_message", mock_post):
                 stop.main()
 
@@ -303,6 +547,172 @@ class TestStopMain:
             run_main()
         assert exc_info.value.code == 0
         assert mock_post.call_count == 1  # 追加呼び出しなし
+        assert state.get(stop.LAST_SENT_SCOPE, session_id)[0] == f"{session_id}:0"
+
+    def _run_offload(self, tmp_path, message: str, server_options: dict) -> list[tuple[str, bytes]]:
+        """offloadThreshold 付きの設定で main() を実行し、multipart 送信された (content, body) を返す。"""
+        hook_input = {
+            "session_id": str(uuid.uuid4()),
+            "transcript_path": "",
+            "cwd": "/tmp/test-project",
+            "last_assistant_message": message,
+        }
+        mock_config = {
+            "schemaVersion": 2,
+            "servers": [{"discord": {"botToken": "token-xxx"}, **server_options}],
+        }
+        sent: list[tuple[str, bytes]] = []
+
+        def fake_multipart(bot_token, channel_id, boundary, body, content_length=None):
+            payload = b"".join(body)
+            sent.append((payload.split(b"\r\n\r\n", 1)[1].split(b"\r\n", 1)[0].decode(), payload))
+
+        with mock.patch("sys.stdin", io.StringIO(json.dumps(hook_input))), \
+             mock.patch.object(stop, "ATTACH_ALLOWED_DIR", str(tmp_path)), \
+             mock.patch("stop.load_config", return_value=mock_config), \
+             mock.patch("stop.resolve_channel", return_value=("chan-001", "token-xxx", "test-project", [])), \
+             mock.patch("stop.post_multipart", side_effect=fake_multipart), \
+             mock.patch("stop.post_message") as mock_post:
+            stop.main()
+        mock_post.assert_not_called()
+        return sent
+
+    def test_long_reply_offloaded_as_attachment(self, tmp_path):
+        """offloadThreshold を超える応答は全文を reply.md として1件で送信し、本文は先頭部分のみ。"""
+        message = "\n".join(f"line {i}: " + "x" * 80 for i in range(200))
+        sent = self._run_offload(tmp_path, message, {"offloadThreshold": 4000})
+        assert len(sent) == 1
+        content, payload = sent[0]
+        text = json.loads(content)["content"]
+        assert len(text) <= 2000
+        assert text.startswith("line 0: ")
+        assert f"Full reply attached ({len(message):,} chars)" in text
+        assert b'filename="reply.md"' in payload
+        assert message.encode() in payload
+        # 一時ファイルは送信後に削除される
+        assert list(tmp_path.iterdir()) == []
+
+    def test_offload_gzip(self, tmp_path):
+        """offloadGzip: true の場合は reply.md.gz として圧縮して添付する。"""
+        import gzip
+
+        message = "log line\n" * 1000
+        sent = self._run_offload(tmp_path, message, {"offloadThreshold": 4000, "offloadGzip": True})
+        _, payload = sent[0]
+        assert b'filename="reply.md.gz"' in payload
+        data = payload.split(b"application/octet-stream\r\n\r\n", 1)[1]
+        assert gzip.decompress(data.rsplit(b"\r\n--", 1)[0]).decode() == message.strip()
+
+    def _run_spool(self, message: str, tmp_path, enqueue_error: Exception | None = None):
+        hook_input = {
+            "session_id": str(uuid.uuid4()),
+            "transcript_path": "",
+            "cwd": "/tmp/test-project",
+            "last_assistant_message": message,
+        }
+        mock_config = {
+            "schemaVersion": 2,
+            "servers": [{"discord": {"botToken": "token-xxx"}, "delivery": "spool"}],
+        }
+        enqueue = mock.patch("stop.spool.enqueue", side_effect=enqueue_error) if enqueue_error else nullcontext()
+        with mock.patch("sys.stdin", io.StringIO(json.dumps(hook_input))), \
+             mock.patch("stop.load_config", return_value=mock_config), \
+             mock.patch("stop.resolve_channel", return_value=("chan-001", "token-xxx", "test-project", [])), \
+             mock.patch("stop.resolve_target_channel", return_value="thread-001"), \
+             mock.patch("stop.spool.spawn_drainer", return_value=True) as spawn, \
+             mock.patch("stop.post_message") as mock_post, \
+             enqueue:
+            stop.main()
+        return spawn, mock_post
+
+    def test_spool_delivery_enqueues_and_returns(self, tmp_path):
+        """delivery: "spool" の場合は分割済みのメッセージをキューに追加し、送信はドレイナーに任せる。"""
+        message = "\n".join(f"line {i} " + "x" * 50 for i in range(100))
+        with mock.patch.object(stop.spool, "_spool_dir", return_value=tmp_path):
+            spawn, mock_post = self._run_spool(message, tmp_path)
+            conn = stop.spool._connect()
+            rows = conn.execute("SELECT channel_id, parent_channel_id, content FROM outbox ORDER BY id").fetchall()
+            conn.close()
+        mock_post.assert_not_called()
+        spawn.assert_called_once()
+        assert [r[2] for r in rows] == stop.split_message(message)
+        assert {(r[0], r[1]) for r in rows} == {("thread-001", "chan-001")}
+
+    def test_spool_failure_falls_back_to_sync(self, tmp_path):
+        """キューに書き込めない場合は同期送信する。"""
+        import sqlite3
+
+        spawn, mock_post = self._run_spool("hello", tmp_path, sqlite3.OperationalError("disk I/O error"))
+        spawn.assert_not_called()
+        assert mock_post.call_args[0][1:] == ("thread-001", "hello")
+
+    def _run_detached(self, detached_ok: bool):
+        hook_input = {
+            "session_id": str(uuid.uuid4()),
+            "transcript_path": "",
+            "cwd": "/tmp/test-project",
+            "last_assistant_message": "hello",
+        }
+        mock_config = {
+            "schemaVersion": 2,
+            "servers": [{"discord": {"botToken": "token-xxx"}, "delivery": "detached"}],
+        }
+        workers = []
+
+        def fake_run_detached(target):
+            workers.append(target)
+            return detached_ok
+
+        with mock.patch("sys.stdin", io.StringIO(json.dumps(hook_input))), \
+             mock.patch("stop.load_config", return_value=mock_config), \
+             mock.patch("stop.resolve_channel", return_value=("chan-001", "token-xxx", "test-project", [])), \
+             mock.patch("stop.resolve_target_channel", return_value="thread-001"), \
+             mock.patch("stop.ordering.take_ticket", return_value=7) as take_ticket, \
+             mock.patch("stop.ordering.turn", return_value=nullcontext()) as turn, \
+             mock.patch("stop.run_detached", side_effect=fake_run_detached), \
+             mock.patch("stop.post_message") as mock_post:
+            stop.main()
+            posted_in_hook = mock_post.call_count
+            if detached_ok:
+                for worker in workers:
+                    worker()
+        take_ticket.assert_called_once_with("chan-001")
+        turn.assert_called_once_with("chan-001", 7)
+        return workers, posted_in_hook, mock_post
+
+    def test_detached_delivery_sends_from_worker(self):
+        """delivery: "detached" の場合、hook 本体は送信せず、切り離したワーカーが整理券の順番で送信する。"""
+        workers, posted_in_hook, mock_post = self._run_detached(True)
+        assert len(workers) == 1
+        assert posted_in_hook == 0
+        assert mock_post.call_args[0][1:] == ("thread-001", "hello")
+
+    def test_detached_fork_failure_sends_synchronously(self):
+        """ワーカーを切り離せない場合は hook 内で（整理券の順番を守って）送信する。"""
+        workers, posted_in_hook, mock_post = self._run_detached(False)
+        assert posted_in_hook == 1
+        assert mock_post.call_args[0][1:] == ("thread-001", "hello")
+
+    def test_reply_below_threshold_not_offloaded(self):
+        """offloadThreshold 以下の応答は従来通りテキストのみで送信する。"""
+        hook_input = {
+            "session_id": str(uuid.uuid4()),
+            "transcript_path": "",
+            "cwd": "/tmp/test-project",
+            "last_assistant_message": "short reply",
+        }
+        mock_config = {
+            "schemaVersion": 2,
+            "servers": [{"discord": {"botToken": "token-xxx"}, "offloadThreshold": 4000}],
+        }
+        with mock.patch("sys.stdin", io.StringIO(json.dumps(hook_input))), \
+             mock.patch("stop.load_config", return_value=mock_config), \
+             mock.patch("stop.resolve_channel", return_value=("chan-001", "token-xxx", "test-project", [])), \
+             mock.patch("stop.post_multipart") as mock_multipart, \
+             mock.patch("stop.post_message") as mock_post:
+            stop.main()
+        mock_multipart.assert_not_called()
+        assert mock_post.call_args[0][2] == "short reply"
 
 
 # ---------------------------------------------------------------------------
@@ -326,6 +736,37 @@ class TestResolveChannel:
     def _make_project(self, name: str, channel: str, path: str) -> dict:
         return {"name": name, "channelId": channel, "projectPath": path, "model": "m"}
 
+    @pytest.mark.parametrize("cwd", [
+        "/home/user/proj-a", "/home/user/proj-a/", "/home/user/proj-a/src", "/home/user/proj-ab",
+        "/home/user/proj-a/sub", "/home/user/proj-a/sub/x", "/home/user", "/other", "",
+    ])
+    def test_linear_scan_matches_trie(self, cwd):
+        """キャッシュのない config の線形走査は、トライと同じ結果になる（最長一致・同じ長さは先勝ち）。"""
+        from lib import config as config_lib
+        config = self._make_config([
+            self._make_server("s1", "token-1", "s1", [
+                self._make_project("a", "ch-a", "/home/user/proj-a/"),
+                self._make_project("dup", "ch-dup", "/home/user/proj-a"),
+            ]),
+            self._make_server("s2", "", "s2", [
+                self._make_project("sub", "ch-sub", "/home/user/proj-a/sub"),
+            ]),
+            self._make_server("s3", "token-3", "s3", [
+                self._make_project("ab", "ch-ab", "/home/user/proj-ab"),
+            ]),
+        ])
+        expected = config_lib._match_trie(config_lib._build_trie(config), cwd)
+        assert config_lib._match_linear(config, cwd) == expected
+
+    def test_uncached_config_does_not_build_trie(self):
+        """load_config() 以外の config ではトライを構築しない（1回の検索には線形走査の方が速い）。"""
+        config = self._make_config([
+            self._make_server("s", "token", "s", [self._make_project("a", "ch-a", "/home/user/proj-a")]),
+        ])
+        with mock.patch("lib.config._build_trie") as build:
+            assert resolve_channel(config, "/home/user/proj-a/src")[0] == "ch-a"
+        build.assert_not_called()
+
     def test_exact_match_returns_correct_server(self):
         """cwd が projectPath と完全一致する場合、正しいサーバーの情報を返す"""
         config = self._make_config([
@@ -417,6 +858,80 @@ class TestResolveChannel:
         _, _, _, permission_tools = resolve_channel(config, "/home/user/proj-a")
         assert permission_tools == []
 
+    def test_prefix_must_end_at_path_boundary(self):
+        """/home/user/proj はパス要素の境界でのみ一致する（/home/user/project には一致しない）"""
+        config = self._make_config([
+            self._make_server("personal", "token-personal", "personal", [
+                self._make_project("proj", "ch-proj", "/home/user/proj/"),
+            ]),
+        ])
+        assert resolve_channel(config, "/home/user/proj")[0] == "ch-proj"
+        with pytest.raises(ValueError):
+            resolve_channel(config, "/home/user/project")
+
+    def test_same_path_first_project_wins(self):
+        """同じ projectPath が複数ある場合は先に定義された project を返す"""
+        config = self._make_config([
+            self._make_server("personal", "token-personal", "personal", [
+                self._make_project("first", "ch-first", "/home/user/proj"),
+            ]),
+            self._make_server("work", "token-work", "work", [
+                self._make_project("second", "ch-second", "/home/user/proj"),
+            ]),
+        ])
+        assert resolve_channel(config, "/home/user/proj/src")[0] == "ch-first"
+
+
+# ---------------------------------------------------------------------------
+# load_config（コンパイル済みスナップショット）
+# ---------------------------------------------------------------------------
+
+class TestLoadConfigSnapshot:
+    @pytest.fixture
+    def config_path(self, tmp_path):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps({"schemaVersion": 2, "servers": [{
+            "name": "personal",
+            "discord": {"botToken": "token-personal"},
+            "projects": [{"name": "proj-a", "channelId": "ch-a", "projectPath": "/home/user/proj-a"}],
+        }]}))
+        with mock.patch("lib.config._config_path", return_value=path):
+            yield path
+
+    def test_snapshot_reused_while_unchanged(self, config_path):
+        """config が変わらなければ 2 回目以降は JSON をパースしない"""
+        from lib import config as config_mod
+
+        first = config_mod.load_config()
+        snapshot = config_path.with_name(".config.compiled")
+        assert snapshot.exists()
+        assert snapshot.stat().st_mode & 0o777 == 0o600
+        with mock.patch("lib.config.json.load") as mock_json_load:
+            second = config_mod.load_config()
+        mock_json_load.assert_not_called()
+        assert second == first
+        assert resolve_channel(second, "/home/user/proj-a/src")[0] == "ch-a"
+
+    def test_snapshot_rebuilt_on_change(self, config_path):
+        """config を書き換えるとスナップショットを作り直す"""
+        from lib import config as config_mod
+
+        config_mod.load_config()
+        data = json.loads(config_path.read_text())
+        data["servers"][0]["projects"][0]["channelId"] = "ch-changed"
+        config_path.write_text(json.dumps(data, indent=2))
+        config = config_mod.load_config()
+        assert resolve_channel(config, "/home/user/proj-a")[0] == "ch-changed"
+
+    def test_corrupt_snapshot_falls_back_to_json(self, config_path):
+        """壊れたスナップショットは無視して JSON から読み込む"""
+        from lib import config as config_mod
+
+        config_mod.load_config()
+        config_path.with_name(".config.compiled").write_bytes(b"\x00garbage")
+        config = config_mod.load_config()
+        assert resolve_channel(config, "/home/user/proj-a")[0] == "ch-a"
+
 
 
 
@@ -520,6 +1035,49 @@ class TestWaitForPermission:
 
         assert result == {"decision": "deny"}
 
+    def test_wake_socket_resumes_immediately(self):
+        """通知ソケットへの接続でポーリング間隔を待たずに起床する。"""
+        import socket
+        import threading
+
+        channel_id = "test-wake-321"
+        resp_file = Path(f"/tmp/discord-bridge-perm-{channel_id}.json")
+        sock_path = f"/tmp/discord-bridge-perm-{channel_id}.sock"
+        resp_file.unlink(missing_ok=True)
+
+        def click():
+            time.sleep(0.2)
+            resp_file.write_text(json.dumps({"decision": "allow"}))
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            s.connect(sock_path)
+            s.close()
+
+        with mock.patch.object(pre_tool_use, "PERM_POLL_INTERVAL", 30), \
+             mock.patch.object(pre_tool_use, "PERM_TIMEOUT", 60):
+            t = threading.Thread(target=click)
+            t.start()
+            start = time.monotonic()
+            result = pre_tool_use.wait_for_permission(channel_id)
+            elapsed = time.monotonic() - start
+            t.join()
+
+        assert result == {"decision": "allow"}
+        assert elapsed < 2
+        assert not Path(sock_path).exists()
+
+
+class TestPlanPreApproved:
+    def test_flag_consumed_once(self, tmp_path):
+        """事前承認フラグは1回だけ使われる。"""
+        with mock.patch.object(pre_tool_use, "PLAN_APPROVED_DIR", str(tmp_path)):
+            (tmp_path / "discord-bridge-plan-approved-chan-1").write_text("")
+            assert pre_tool_use.check_plan_pre_approved("chan-1") is True
+            assert pre_tool_use.check_plan_pre_approved("chan-1") is False
+
+    def test_no_flag(self, tmp_path):
+        with mock.patch.object(pre_tool_use, "PLAN_APPROVED_DIR", str(tmp_path)):
+            assert pre_tool_use.check_plan_pre_approved("chan-1") is False
+
 
 # ---------------------------------------------------------------------------
 # pre_tool_use.main (permission tools)
@@ -549,6 +1107,41 @@ class TestPreToolUsePermission:
         output = json.loads(mock_stdout.getvalue())
         assert output["hookSpecificOutput"]["permissionDecision"] == "allow"
 
+    def test_click_during_button_post_is_not_lost(self, tmp_path):
+        """ボタン送信の直後（待機開始前）のクリックも取りこぼさず、すぐに応答を返す。"""
+        import socket
+
+        hook_input = {
+            "tool_name": "Bash",
+            "tool_input": {"command": "rm -rf /tmp/test"},
+            "cwd": "/tmp/test-project",
+            "transcript_path": "",
+        }
+
+        def post_and_click(bot_token, channel_id, content):
+            # bot と同じく応答ファイルを書き込んでから通知ソケットへ接続する
+            (tmp_path / "discord-bridge-perm-chan-001.json").write_text(json.dumps({"decision": "deny"}))
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            s.connect(str(tmp_path / "discord-bridge-perm-chan-001.sock"))
+            s.close()
+
+        with mock.patch("sys.stdin", io.StringIO(json.dumps(hook_input))), \
+             mock.patch("pre_tool_use.load_config", return_value=self._mock_config()), \
+             mock.patch("pre_tool_use.resolve_channel", return_value=("chan-001", "token-xxx", None, ["Bash"])), \
+             mock.patch("pre_tool_use.post_permission_buttons", side_effect=post_and_click), \
+             mock.patch.object(pre_tool_use, "PERM_RESPONSE_DIR", str(tmp_path)), \
+             mock.patch.object(pre_tool_use, "PERM_POLL_INTERVAL", 30), \
+             mock.patch.object(pre_tool_use, "PERM_TIMEOUT", 5), \
+             mock.patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            started = time.monotonic()
+            pre_tool_use.main()
+            elapsed = time.monotonic() - started
+
+        output = json.loads(mock_stdout.getvalue())
+        assert output["hookSpecificOutput"]["permissionDecision"] == "deny"
+        assert elapsed < 1
+        assert list(tmp_path.iterdir()) == []
+
     def test_permission_tool_deny(self):
         """permissionTools で拒否が返された場合、deny を出力する。"""
         hook_input = {
@@ -701,11 +1294,25 @@ class TestThreadTracking:
         finally:
             tracking_file.unlink(missing_ok=True)
 
+    def test_clear_keeps_newer_thread(self):
+        """404 になったスレッドを指定した削除は、Bot が書き込んだ別のスレッドを消さない。"""
+        channel_id = "test-clear-newer"
+        tracking_file = Path(f"/tmp/discord-bridge-thread-{channel_id}.json")
+        tracking_file.write_text(json.dumps({"threadId": "thread-new"}))
+        try:
+            clear_thread_tracking(channel_id, "thread-old")
+            assert get_thread_id(channel_id) == "thread-new"
+            clear_thread_tracking(channel_id, "thread-new")
+            assert not tracking_file.exists()
+        finally:
+            tracking_file.unlink(missing_ok=True)
+
 
 # ---------------------------------------------------------------------------
 # stop.main with thread (スレッド対応)
 # ---------------------------------------------------------------------------
 
+@pytest.mark.usefixtures("isolated_state")
 class TestStopMainWithThread:
     def _make_hook_input(self, message: str) -> dict:
         return {
@@ -861,3 +1468,192 @@ class TestStopContextProgressBar:
         content = mock_post.call_args[0][2]
         assert "█" not in content
         assert "░" not in content
+
+
+# ---------------------------------------------------------------------------
+# pre_tool_progress.main
+# ---------------------------------------------------------------------------
+
+@pytest.mark.usefixtures("isolated_state")
+class TestPreToolProgress:
+    def _config(self, **server_options) -> dict:
+        return {"schemaVersion": 2, "servers": [{
+            "discord": {"botToken": "token-xxx"},
+            "projects": [{"name": "p", "channelId": "chan-001", "projectPath": "/tmp/test-project"}],
+            **server_options,
+        }]}
+
+    def _run(self, text: str, config: dict, send_return: dict | None = None,
+             edit_side_effect: Exception | None = None) -> tuple[mock.Mock, mock.Mock]:
+        hook_input = {
+            "session_id": "sess-1",
+            "transcript_path": "/tmp/transcript.jsonl",
+            "cwd": "/tmp/test-project",
+            "tool_name": "Bash",
+        }
+        with mock.patch("sys.stdin", io.StringIO(json.dumps(hook_input))), \
+             mock.patch("pre_tool_progress.get_assistant_messages", return_value=[text]), \
+             mock.patch("pre_tool_progress.load_config", return_value=config), \
+             mock.patch("pre_tool_progress.resolve_target_channel", side_effect=lambda c: c), \
+             mock.patch("pre_tool_progress._send_message", return_value=send_return) as mock_send, \
+             mock.patch("pre_tool_progress._edit_message", side_effect=edit_side_effect) as mock_edit:
+            try:
+                pre_tool_progress.main()
+            except SystemExit:
+                pass
+        return mock_send, mock_edit
+
+    def test_post_mode_sends_each_new_text(self):
+        """デフォルト（post）では新しいテキストごとに新規メッセージを送信し、重複は送らない。"""
+        config = self._config()
+        assert self._run("first", config)[0].call_count == 1
+        assert self._run("first", config)[0].call_count == 0
+        mock_send, mock_edit = self._run("second", config)
+        assert mock_send.call_args[0][2] == "🔄 second"
+        mock_edit.assert_not_called()
+
+    def test_edit_mode_edits_live_message(self):
+        """edit モードでは2回目以降ライブメッセージを編集する。"""
+        config = self._config(progressMode="edit", progressEditInterval=0)
+        mock_send, _ = self._run("first", config, send_return={"id": "msg-1"})
+        assert mock_send.call_count == 1
+        mock_send, mock_edit = self._run("second", config)
+        mock_send.assert_not_called()
+        assert mock_edit.call_args[0][1:] == ("chan-001", "msg-1", "🔄 second")
+
+    def test_edit_mode_debounces_and_stop_flushes(self):
+        """編集間隔内の更新は保留され、Stop hook の finalize で反映される。"""
+        config = self._config(progressMode="edit", progressEditInterval=60)
+        self._run("first", config, send_return={"id": "msg-1"})
+        mock_send, mock_edit = self._run("second", config)
+        mock_send.assert_not_called()
+        mock_edit.assert_not_called()
+        assert progress.read_state("sess-1")["pending"] == "🔄 second"
+
+        with mock.patch("lib.progress.edit_message") as mock_finalize_edit:
+            progress.finalize("sess-1", "token-xxx")
+        mock_finalize_edit.assert_called_once_with("token-xxx", "chan-001", "msg-1", "🔄 second")
+        assert "message_id" not in progress.read_state("sess-1")
+
+        # 次のターンは新しいメッセージになる
+        mock_send, _ = self._run("third", config, send_return={"id": "msg-2"})
+        assert mock_send.call_count == 1
+
+    def test_edit_mode_reposts_when_live_message_deleted(self):
+        """ライブメッセージが削除されていた（404）場合は新規送信する。"""
+        config = self._config(progressMode="edit", progressEditInterval=0)
+        self._run("first", config, send_return={"id": "msg-1"})
+        error = urllib.error.HTTPError("url", 404, "Not Found", {}, None)
+        mock_send, mock_edit = self._run("second", config, send_return={"id": "msg-2"},
+                                         edit_side_effect=error)
+        assert mock_edit.call_count == 1
+        assert mock_send.call_count == 1
+        assert progress.read_state("sess-1")["message_id"] == "msg-2"
+
+    def test_unopenable_state_store_sends_without_dedup(self, tmp_path):
+        """状態ストアの DB を開けない場合も例外で終了せず、重複判定なしで送信する。"""
+        state.close()
+        with mock.patch.object(state, "DB_PATH", str(tmp_path)):  # ディレクトリは DB として開けない
+            mock_send, _ = self._run("first", self._config())
+        assert mock_send.call_count == 1
+
+    def test_locked_state_store_sends_once(self):
+        """lease の取得がロック待ちのタイムアウトで失敗しても送信する。"""
+        with mock.patch("lib.state.lease", side_effect=sqlite3.OperationalError("database is locked")):
+            mock_send, _ = self._run("first", self._config())
+        assert mock_send.call_count == 1
+
+    def test_state_write_error_after_send_does_not_resend(self):
+        """送信後の書き戻しに失敗しても再送しない。"""
+        @contextmanager
+        def failing_write(session_id):
+            yield {}
+            raise sqlite3.OperationalError("database is locked")
+
+        with mock.patch("lib.progress.locked_state", failing_write):
+            mock_send, _ = self._run("first", self._config())
+        assert mock_send.call_count == 1
+
+
+# ---------------------------------------------------------------------------
+# pre_tool.main（統合 PreToolUse hook）
+# ---------------------------------------------------------------------------
+
+@pytest.mark.usefixtures("isolated_state")
+class TestPreToolCombined:
+    def _run(self, tool_name: str, tool_input: dict | None = None,
+             permission_tools: list[str] | None = None, pre_approved: bool = False) -> dict:
+        hook_input = {
+            "session_id": "sess-1",
+            "transcript_path": "/tmp/transcript.jsonl",
+            "cwd": "/tmp/test-project",
+            "tool_name": tool_name,
+            "tool_input": tool_input or {},
+        }
+        config = {"schemaVersion": 2, "servers": []}
+        resolved = ("chan-001", "token-xxx", None, permission_tools or [])
+        mocks: dict = {}
+        with mock.patch("sys.stdin", io.StringIO(json.dumps(hook_input))), \
+             mock.patch("sys.stdout", new_callable=io.StringIO) as mock_stdout, \
+             mock.patch("pre_tool.load_config", return_value=config) as mocks["load_config"], \
+             mock.patch("pre_tool.resolve_channel", return_value=resolved), \
+             mock.patch("pre_tool.run_detached", return_value=False), \
+             mock.patch("pre_tool_use.get_assistant_messages", return_value=["plan"]) as mocks["use_read"], \
+             mock.patch("pre_tool_progress.get_assistant_messages", return_value=["text"]) as mocks["progress_read"], \
+             mock.patch("pre_tool_progress.resolve_target_channel", side_effect=lambda c: c), \
+             mock.patch("pre_tool_use.resolve_target_channel", side_effect=lambda c: c), \
+             mock.patch("pre_tool_progress._send_message") as mocks["progress_send"], \
+             mock.patch("pre_tool_use.check_plan_pre_approved", return_value=pre_approved), \
+             mock.patch("pre_tool_use.post_plan_buttons") as mocks["plan_buttons"], \
+             mock.patch("pre_tool_use.post_buttons") as mocks["question_buttons"], \
+             mock.patch("pre_tool_use.post_permission_buttons") as mocks["perm_buttons"], \
+             mock.patch("pre_tool_use.wait_for_permission", return_value={"decision": "allow"}):
+            try:
+                pre_tool.main()
+            except SystemExit as e:
+                mocks["exit_code"] = e.code
+        mocks["stdout"] = mock_stdout.getvalue()
+        return mocks
+
+    def test_plain_tool_sends_progress_only(self):
+        """ボタン対象外のツールは途中経過だけを送信し、何も出力しない。"""
+        mocks = self._run("Read")
+        mocks["load_config"].assert_called_once()
+        assert mocks["progress_send"].call_args[0][2] == "🔄 text"
+        mocks["perm_buttons"].assert_not_called()
+        assert mocks["stdout"] == ""
+
+    def test_exit_plan_mode_reads_transcript_once(self):
+        """ExitPlanMode は transcript を1回だけ読み、プラン概要と途中経過で共有する。"""
+        mocks = self._run("ExitPlanMode")
+        mocks["use_read"].assert_called_once()
+        mocks["progress_read"].assert_not_called()
+        assert mocks["progress_send"].call_args[0][2] == "🔄 plan"
+        assert mocks["plan_buttons"].call_args[0][2].startswith("plan\n\n")
+        assert json.loads(mocks["stdout"])["hookSpecificOutput"]["permissionDecision"] == "deny"
+
+    def test_pre_approved_plan_skips_transcript_wait(self):
+        """事前承認済みの ExitPlanMode は transcript を待たずに許可し、途中経過はワーカーが読む。"""
+        mocks = self._run("ExitPlanMode", pre_approved=True)
+        assert mocks["exit_code"] == 0
+        mocks["use_read"].assert_not_called()
+        mocks["plan_buttons"].assert_not_called()
+        mocks["progress_read"].assert_called_once()
+        assert json.loads(mocks["stdout"])["hookSpecificOutput"]["permissionDecision"] == "allow"
+
+    def test_permission_tool_sends_progress_and_buttons(self):
+        """permissionTools のツールは途中経過を送ってからボタンで許可を待つ。"""
+        mocks = self._run("Bash", {"command": "rm -rf /tmp/x"}, permission_tools=["Bash"])
+        mocks["progress_send"].assert_called_once()
+        mocks["perm_buttons"].assert_called_once()
+        mocks["use_read"].assert_not_called()
+        assert json.loads(mocks["stdout"])["hookSpecificOutput"]["permissionDecision"] == "allow"
+
+    def test_ask_user_question_skips_progress(self):
+        """AskUserQuestion は途中経過を送らず、直前テキストを質問ボタンに含める。"""
+        questions = [{"question": "Which?", "options": [{"label": "A"}, {"label": "B"}]}]
+        mocks = self._run("AskUserQuestion", {"questions": questions})
+        mocks["progress_read"].assert_not_called()
+        mocks["progress_send"].assert_not_called()
+        mocks["use_read"].assert_called_once()
+        mocks["question_buttons"].assert_called_once()
@@ -0,0 +1,130 @@
+"""tests/test_ordering.py — チャンネル単位の送信順序（lib/ordering）のテスト"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+import unittest.mock as mock
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+from lib import detach, ordering  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path):
+    template = str(tmp_path / "order-{channel_id}.json")
+    with mock.patch.object(ordering, "STATE_PATH_TEMPLATE", template):
+        yield tmp_path
+
+
+def _state(channel_id: str = "chan") -> dict:
+    return json.loads(Path(ordering.state_path(channel_id)).read_text())
+
+
+def _no_sleep(seconds: float) -> None:
+    raise AssertionError("should not wait")
+
+
+class TestTickets:
+    def test_tickets_are_sequential_per_channel(self):
+        assert [ordering.take_ticket("a") for _ in range(3)] == [0, 1, 2]
+        assert ordering.take_ticket("b") == 0
+
+    def test_first_ticket_runs_immediately_and_advances(self):
+        ticket = ordering.take_ticket("chan")
+        with ordering.turn("chan", ticket, sleep=_no_sleep):
+            assert _state()["holders"][str(ticket)][0] == os.getpid()
+        state = _state()
+        assert state["serving"] == 1
+        assert state["holders"] == {}
+
+    def test_released_on_exception(self):
+        ticket = ordering.take_ticket("chan")
+        with pytest.raises(RuntimeError):
+            with ordering.turn("chan", ticket, sleep=_no_sleep):
+                raise RuntimeError("send failed")
+        assert _state()["serving"] == 1
+
+    def test_corrupt_state_is_reset(self):
+        Path(ordering.state_path("chan")).write_text("{not json")
+        assert ordering.take_ticket("chan") == 0
+
+
+class TestWaiting:
+    def test_waits_for_earlier_ticket(self):
+        first = ordering.take_ticket("chan")
+        second = ordering.take_ticket("chan")
+        # 先行の整理券のワーカーが生存中（自プロセスの pid）として登録
+        ordering._update("chan", lambda s: s["holders"][str(first)].__setitem__(0, os.getpid()))
+        waits: list[float] = []
+
+        def fake_sleep(seconds: float) -> None:
+            waits.append(seconds)
+            if len(waits) == 3:
+                ordering._update("chan", lambda s: (s["holders"].pop(str(first)), s.__setitem__("serving", 1)))
+
+        with ordering.turn("chan", second, sleep=fake_sleep):
+            pass
+        assert len(waits) == 3
+        assert _state()["serving"] == 2
+
+    def test_skips_ticket_of_dead_worker(self):
+        first = ordering.take_ticket("chan")
+        second = ordering.take_ticket("chan")
+        ordering._update("chan", lambda s: s["holders"][str(first)].__setitem__(0, 2 ** 22 + 12345))
+        with mock.patch.object(ordering, "_alive", return_value=False):
+            with ordering.turn("chan", second, sleep=_no_sleep):
+                pass
+        assert _state()["serving"] == 2
+
+    def test_skips_ticket_never_started_after_grace(self):
+        first = ordering.take_ticket("chan")
+        second = ordering.take_ticket("chan")
+        issued = _state()["holders"][str(first)][1]
+        with mock.patch.object(ordering.time, "time", return_value=issued + ordering.START_GRACE + 1):
+            with ordering.turn("chan", second, sleep=_no_sleep):
+                pass
+        assert _state()["serving"] == 2
+
+    def test_unstarted_ticket_within_grace_is_waited_for(self):
+        ordering.take_ticket("chan")
+        second = ordering.take_ticket("chan")
+        waits: list[float] = []
+
+        def fake_sleep(seconds: float) -> None:
+            waits.append(seconds)
+            ordering._update("chan", lambda s: s.__setitem__("serving", 1))
+
+        with ordering.turn("chan", second, sleep=fake_sleep):
+            pass
+        assert waits == [ordering.POLL_INTERVAL]
+
+
+class TestDetachedOrdering:
+    def test_detached_workers_finish_in_ticket_order(self, tmp_path):
+        """後から起動したワーカーが先に準備できても、整理券の順に処理する。"""
+        log = tmp_path / "log"
+        tickets = [ordering.take_ticket("chan") for _ in range(3)]
+
+        def make_worker(ticket: int, delay: float):
+            def worker() -> None:
+                with ordering.turn("chan", ticket):
+                    time.sleep(delay)
+                    with open(log, "a") as f:
+                        f.write(f"{ticket}\n")
+            return worker
+
+        for ticket, delay in zip(tickets, (0.3, 0.0, 0.1)):
+            assert detach.run_detached(make_worker(ticket, delay)) is True
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if log.exists() and len(log.read_text().split()) == 3:
+                break
+            time.sleep(0.02)
+        assert log.read_text().split() == ["0", "1", "2"]
@@ -0,0 +1,130 @@
+"""tests/test_ratelimit.py — プロセス間共有レート制限トラッカーのテスト"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+import unittest.mock as mock
+from email.message import Message
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+from lib import ratelimit  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def state_path(tmp_path):
+    path = tmp_path / "ratelimit.json"
+    with mock.patch.object(ratelimit, "STATE_PATH", str(path)):
+        yield path
+
+
+TOKEN = "token-a"
+
+
+def _headers(**values: str) -> Message:
+    msg = Message()
+    for k, v in values.items():
+        msg[k.replace("_", "-")] = v
+    return msg
+
+
+class TestStatePath:
+    def test_default(self, state_path):
+        with mock.patch.dict(os.environ):
+            os.environ.pop("DISCORD_BRIDGE_API_BASE", None)
+            assert ratelimit.state_path() == str(state_path)
+
+    def test_separate_state_per_api_base(self, state_path):
+        """送信先を変更している場合は Discord 本体の状態ファイルを使わない。"""
+        with mock.patch.dict(os.environ, {"DISCORD_BRIDGE_API_BASE": "http://127.0.0.1:8787/api/v10/"}):
+            fake = ratelimit.state_path()
+        with mock.patch.dict(os.environ, {"DISCORD_BRIDGE_API_BASE": "http://127.0.0.1:8787/api/v10"}):
+            assert ratelimit.state_path() == fake
+        with mock.patch.dict(os.environ, {"DISCORD_BRIDGE_API_BASE": "http://127.0.0.1:9999/api/v10"}):
+            assert ratelimit.state_path() not in (fake, str(state_path))
+        assert fake != str(state_path)
+
+
+class TestRouteKey:
+    def test_major_param_and_template(self):
+        """ID はテンプレート化され、channel ID が major パラメータになる。"""
+        assert ratelimit.route_key("POST", "/channels/123456789/messages") == (
+            "POST /channels/{id}/messages", "123456789",
+        )
+        assert ratelimit.route_key("PATCH", "/channels/111111/messages/222222")[0] == (
+            "PATCH /channels/{id}/messages/{id}"
+        )
+
+
+class TestAcquire:
+    def test_unknown_route_does_not_wait(self):
+        sleep = mock.Mock()
+        assert ratelimit.acquire("POST", "/channels/123456/messages", TOKEN, sleep=sleep) == 0
+        sleep.assert_not_called()
+
+    def test_remaining_is_reserved_across_callers(self):
+        """残数 1 のバケットは1回目の予約で使い切られ、2回目は待機する。"""
+        ratelimit.update("POST", "/channels/123456/messages", TOKEN, 200, _headers(
+            X_RateLimit_Bucket="b1", X_RateLimit_Remaining="1", X_RateLimit_Reset_After="3",
+        ))
+        assert ratelimit._reserve("POST", "/channels/123456/messages", TOKEN) == 0
+        assert 2.5 < ratelimit._reserve("POST", "/channels/123456/messages", TOKEN) <= 3
+
+    def test_buckets_are_per_major_param(self):
+        """同じバケットでも別チャンネルは独立して扱う。"""
+        ratelimit.update("POST", "/channels/123456/messages", TOKEN, 200, _headers(
+            X_RateLimit_Bucket="b1", X_RateLimit_Remaining="0", X_RateLimit_Reset_After="3",
+        ))
+        assert ratelimit._reserve("POST", "/channels/123456/messages", TOKEN) > 0
+        assert ratelimit._reserve("POST", "/channels/654321/messages", TOKEN) == 0
+
+    def test_global_limit_applies_to_all_routes(self):
+        ratelimit.update("POST", "/channels/123456/messages", TOKEN, 429, _headers(
+            Retry_After="2", X_RateLimit_Global="true",
+        ))
+        assert ratelimit._reserve("PATCH", "/channels/999999/messages/1", TOKEN) > 1.5
+
+    def test_429_without_bucket_header_blocks_route(self):
+        ratelimit.update("POST", "/channels/123456/messages", TOKEN, 429, _headers(Retry_After="2"))
+        assert ratelimit._reserve("POST", "/channels/123456/messages", TOKEN) > 1.5
+
+    def test_expired_bucket_does_not_wait(self, state_path):
+        ratelimit.update("POST", "/channels/123456/messages", TOKEN, 200, _headers(
+            X_RateLimit_Bucket="b1", X_RateLimit_Remaining="0", X_RateLimit_Reset_After="0",
+        ))
+        assert ratelimit._reserve("POST", "/channels/123456/messages", TOKEN) == 0
+
+    def test_wait_is_capped(self):
+        ratelimit.update("POST", "/channels/123456/messages", TOKEN, 429, _headers(Retry_After="600"))
+        sleep = mock.Mock()
+        assert ratelimit.acquire("POST", "/channels/123456/messages", TOKEN, sleep=sleep) == ratelimit.MAX_WAIT
+
+    def test_global_limit_is_per_bot(self):
+        """グローバル制限は Bot ごと。他の Bot の送信は待たせない。"""
+        ratelimit.update("POST", "/channels/123456/messages", TOKEN, 429, _headers(
+            Retry_After="30", X_RateLimit_Global="true",
+        ))
+        sleep = mock.Mock()
+        assert ratelimit.acquire("POST", "/channels/123456/messages", "token-b", sleep=sleep) == 0
+        sleep.assert_not_called()
+        assert ratelimit._reserve("POST", "/channels/123456/messages", TOKEN) > 25
+
+    def test_buckets_are_per_bot(self):
+        ratelimit.update("POST", "/channels/123456/messages", TOKEN, 200, _headers(
+            X_RateLimit_Bucket="b1", X_RateLimit_Remaining="0", X_RateLimit_Reset_After="3",
+        ))
+        assert ratelimit._reserve("POST", "/channels/123456/messages", "token-b") == 0
+        assert ratelimit._reserve("POST", "/channels/123456/messages", TOKEN) > 0
+
+    def test_token_not_stored(self, state_path):
+        ratelimit.update("POST", "/channels/123456/messages", TOKEN, 429, _headers(Retry_After="2"))
+        assert TOKEN not in state_path.read_text()
+
+    def test_corrupt_state_is_reset(self, state_path):
+        state_path.write_text("not json")
+        assert ratelimit._reserve("POST", "/channels/123456/messages", TOKEN) == 0
+        assert json.loads(state_path.read_text()) == {"bots": {}}
@@ -0,0 +1,52 @@
+"""tests/test_session_driver.py — 負荷試験ドライバー（bench/session_driver）のテスト
+
+実際の hook スクリプトをローカルの Discord スタンドインに向けて起動する（小さな規模で1回だけ実行する）。
+"""
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "bench"))
+
+import session_driver  # noqa: E402
+
+
+def test_threads_layout_end_to_end(tmp_path):
+    output = tmp_path / "report.json"
+    session_driver.main([
+        "--sessions", "2", "--tool-calls", "2", "--think-ms", "0", "--tool-ms", "0",
+        "--text-ratio", "1", "--ask-every", "2", "--latency-ms", "0", "--jitter-ms", "0",
+        "--archive-threads", "1", "--output", str(output),
+    ])
+    report = json.loads(output.read_text())
+
+    assert {hook: stats["count"] for hook, stats in report["hooks"].items()} == {
+        "pre_tool_progress": 4, "pre_tool_use": 4, "stop": 2,
+    }
+    assert all(stats["exit_codes"] == {"0": stats["count"]} for stats in report["hooks"].values())
+    delivered = report["delivered"]
+    assert delivered["stop_sessions"] == delivered["stop_expected"] == 2
+    assert delivered["buttons"] == 2
+    # アーカイブ済みスレッドの送信は 404 になり、親チャンネルにフォールバックする
+    assert report["discord"]["by_status"]["404"] >= 1
+    assert set(report["discord"]["delivered_by_channel"]) == {
+        str(session_driver.CHANNEL_BASE), str(session_driver.THREAD_BASE + 1),
+    }
+    assert set(report["trace"]) == {"pre_tool_progress", "pre_tool_use", "stop"}
+
+
+def test_combined_pre_tool(tmp_path):
+    output = tmp_path / "report.json"
+    session_driver.main([
+        "--sessions", "1", "--tool-calls", "2", "--think-ms", "0", "--tool-ms", "0",
+        "--text-ratio", "1", "--latency-ms", "0", "--jitter-ms", "0", "--combined-pre-tool",
+        "--output", str(output),
+    ])
+    report = json.loads(output.read_text())
+
+    assert {hook: stats["count"] for hook, stats in report["hooks"].items()} == {"pre_tool": 2, "stop": 1}
+    # 途中経過は切り離したワーカーが送信するため、tool_result の追記が先になった呼び出しは送信されない
+    assert report["delivered"]["progress"] >= 1
+    assert set(report["trace"]) >= {"pre_tool", "pre_tool.progress", "stop"}
@@ -0,0 +1,181 @@
+"""tests/test_spool.py — 送信キュー（lib/spool）と切り離し実行（lib/detach）のテスト"""
+from __future__ import annotations
+
+import fcntl
+import os
+import stat
+import sys
+import time
+import unittest.mock as mock
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+from lib import detach, spool  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path):
+    with mock.patch.object(spool, "_spool_dir", return_value=tmp_path):
+        yield tmp_path
+
+
+@pytest.fixture
+def sent():
+    """送信を記録する（失敗させたい content は failures に例外を登録する）。"""
+    calls: list[tuple[str, str, str]] = []
+    failures: dict[str, list[Exception]] = {}
+
+    def fake_post(bot_token, channel_id, content):
+        errors = failures.get(content)
+        if errors:
+            raise errors.pop(0)
+        calls.append((bot_token, channel_id, content))
+
+    with mock.patch.object(spool, "post_message", side_effect=fake_post), \
+         mock.patch.object(spool, "clear_thread_tracking") as clear:
+        calls_obj = mock.Mock(calls=calls, failures=failures, clear=clear)
+        yield calls_obj
+
+
+def _http_error(code: int) -> urllib.error.HTTPError:
+    return urllib.error.HTTPError("url", code, "err", {}, None)
+
+
+def _rows(spool_dir: Path) -> list[tuple]:
+    conn = spool._connect()
+    try:
+        return [tuple(r) for r in conn.execute("SELECT channel_id, content, state, attempts FROM outbox ORDER BY id")]
+    finally:
+        conn.close()
+
+
+class TestEnqueueDrain:
+    def test_delivers_in_order_and_empties_queue(self, sent, spool_dir):
+        spool.enqueue("tok", "ch-a", [("one", []), ("two", [])])
+        spool.enqueue("tok", "ch-b", [("three", [])])
+        assert spool.drain(max_wait=0) == 3
+        assert sent.calls == [("tok", "ch-a", "one"), ("tok", "ch-a", "two"), ("tok", "ch-b", "three")]
+        assert _rows(spool_dir) == []
+
+    def test_database_is_private(self, sent, spool_dir):
+        spool.enqueue("tok", "ch-a", [("one", [])])
+        assert stat.S_IMODE(os.stat(spool_dir / spool.DB_NAME).st_mode) == 0o600
+
+    def test_server_error_blocks_only_that_channel(self, sent, spool_dir):
+        """先頭が再試行待ちのチャンネルは後続を送らず、他チャンネルは送信を続ける。"""
+        sent.failures["one"] = [_http_error(503)]
+        spool.enqueue("tok", "ch-a", [("one", []), ("two", [])])
+        spool.enqueue("tok", "ch-b", [("three", [])])
+        assert spool.drain(max_wait=0) == 1
+        assert sent.calls == [("tok", "ch-b", "three")]
+        assert _rows(spool_dir) == [("ch-a", "one", "pending", 1), ("ch-a", "two", "pending", 0)]
+
+    def test_retry_after_backoff_keeps_order(self, sent, spool_dir):
+        sent.failures["one"] = [urllib.error.URLError("timeout")]
+        spool.enqueue("tok", "ch-a", [("one", []), ("two", [])])
+        with mock.patch.object(spool.time, "sleep") as sleep, \
+             mock.patch.object(spool, "BACKOFF_BASE", 0.0):
+            assert spool.drain() == 2
+        assert [c[2] for c in sent.calls] == ["one", "two"]
+        assert sleep.call_count <= 1
+
+    def test_thread_404_moves_queue_to_parent(self, sent, spool_dir):
+        sent.failures["one"] = [_http_error(404)]
+        spool.enqueue("tok", "thread-1", [("one", []), ("two", [])], parent_channel_id="parent-1")
+        assert spool.drain(max_wait=0) == 2
+        assert sent.calls == [("tok", "parent-1", "one"), ("tok", "parent-1", "two")]
+        sent.clear.assert_called_once_with("parent-1", "thread-1")
+
+    def test_client_error_is_dead_and_does_not_block(self, sent, spool_dir):
+        sent.failures["one"] = [_http_error(400)]
+        spool.enqueue("tok", "ch-a", [("one", []), ("two", [])])
+        assert spool.drain(max_wait=0) == 1
+        assert sent.calls == [("tok", "ch-a", "two")]
+        assert _rows(spool_dir) == [("ch-a", "one", "dead", 0)]
+
+    def test_gives_up_after_max_attempts(self, sent, spool_dir):
+        sent.failures["one"] = [_http_error(500)] * spool.MAX_ATTEMPTS
+        spool.enqueue("tok", "ch-a", [("one", [])])
+        with mock.patch.object(spool.time, "sleep"), mock.patch.object(spool, "BACKOFF_BASE", 0.0):
+            assert spool.drain() == 0
+        assert _rows(spool_dir) == [("ch-a", "one", "dead", spool.MAX_ATTEMPTS - 1)]
+
+    def test_attachments_sent_as_multipart_and_cleaned_up(self, sent, spool_dir):
+        cleanup = Path(spool.files_dir()) / "reply-x"
+        cleanup.mkdir()
+        (cleanup / "reply.md").write_text("full text")
+        spool.enqueue("tok", "ch-a", [("excerpt", [("reply.md", str(cleanup / "reply.md"))])], cleanup=str(cleanup))
+        bodies = []
+        with mock.patch.object(spool, "post_multipart", side_effect=lambda *a, **kw: bodies.append(b"".join(a[3]))):
+            assert spool.drain(max_wait=0) == 1
+        assert b'filename="reply.md"' in bodies[0] and b"full text" in bodies[0]
+        assert not cleanup.exists()
+
+    def test_missing_attachment_is_dead(self, sent, spool_dir):
+        spool.enqueue("tok", "ch-a", [("text", [("gone.png", str(spool_dir / "gone.png"))])])
+        assert spool.drain(max_wait=0) == 0
+        assert _rows(spool_dir)[0][2] == "dead"
+
+    def test_attachment_vanishing_mid_send_is_dead(self, sent, spool_dir):
+        """送信中に添付が消えた場合（URLError に包まれる）も再試行せずに dead にする。"""
+        attachment = spool_dir / "reply.md"
+        attachment.write_text("full text")
+        spool.enqueue("tok", "ch-a", [("text", [("reply.md", str(attachment))])])
+
+        def vanish(*args, **kwargs):
+            attachment.unlink()
+            raise urllib.error.URLError(FileNotFoundError(2, "No such file or directory"))
+
+        with mock.patch.object(spool, "post_multipart", side_effect=vanish):
+            assert spool.drain(max_wait=0) == 0
+        assert _rows(spool_dir) == [("ch-a", "text", "dead", 0)]
+
+    def test_backoff_does_not_block_other_channels(self, sent, spool_dir):
+        """再試行待ちのドレイナーがロックを持っている間も、他チャンネルに追加された行はすぐに送信する。"""
+        sent.failures["one"] = [_http_error(503)]
+        spool.enqueue("tok", "ch-a", [("one", [])])
+        with ThreadPoolExecutor(1) as pool:
+            first = pool.submit(spool.drain)
+            deadline = time.monotonic() + 5
+            while _rows(spool_dir)[0][3] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            spool.enqueue("tok", "ch-b", [("fresh", [])])
+            started = time.monotonic()
+            assert spool.drain() == 0  # ロックは最初のドレイナーが持っている
+            while ("tok", "ch-b", "fresh") not in sent.calls and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert time.monotonic() - started < spool.WAIT_STEP * 2
+            assert first.result() == 2
+        assert [c[2] for c in sent.calls] == ["fresh", "one"]
+
+    def test_second_drainer_returns_immediately(self, sent, spool_dir):
+        spool.enqueue("tok", "ch-a", [("one", [])])
+        with open(spool_dir / spool.LOCK_NAME, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            assert spool.drain(max_wait=0) == 0
+        assert sent.calls == []
+        assert spool.drain(max_wait=0) == 1
+
+
+class TestRunDetached:
+    def test_target_runs_in_detached_process(self, tmp_path):
+        marker = tmp_path / "done"
+
+        def target():
+            time.sleep(0.2)
+            marker.write_text(f"{os.getpid()} {os.getsid(0)}")
+
+        start = time.monotonic()
+        assert detach.run_detached(target) is True
+        assert time.monotonic() - start < 0.2  # 孫プロセスの終了は待たない
+        deadline = time.monotonic() + 5
+        while not marker.exists() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        pid, sid = (int(x) for x in marker.read_text().split())
+        assert pid != os.getpid()
+        assert sid != os.getsid(0)  # 呼び出し元のセッションから切り離されている
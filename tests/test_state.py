@@ -0,0 +1,177 @@
+"""tests/test_state.py — hooks 共有の状態ストア（lib/state）のテスト"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import stat
+import sys
+import time
+import unittest.mock as mock
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+from lib import state  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def db_path(tmp_path):
+    state.close()
+    path = tmp_path / "state.db"
+    with mock.patch.object(state, "DB_PATH", str(path)):
+        yield path
+        state.close()
+
+
+def _claim_in_child(db_path: str, results) -> None:
+    state.DB_PATH = db_path
+    results.put(state.claim("last-sent", "sess", "sess:1.000"))
+
+
+class TestGetAndCompareAndSet:
+    def test_missing_key(self):
+        assert state.get("progress", "none") == (None, 0)
+
+    def test_db_created_private(self, db_path):
+        state.get("progress", "none")
+        assert stat.S_IMODE(db_path.stat().st_mode) == 0o600
+
+    def test_cas_succeeds_only_with_current_version(self):
+        assert state.compare_and_set("s", "k", 0, {"a": 1}) is True
+        value, version = state.get("s", "k")
+        assert value == {"a": 1}
+        assert state.compare_and_set("s", "k", 0, {"a": 2}) is False
+        assert state.compare_and_set("s", "k", version, {"a": 2}) is True
+        assert state.get("s", "k") == ({"a": 2}, version + 1)
+
+    def test_cas_none_deletes(self):
+        state.compare_and_set("s", "k", 0, "v")
+        _, version = state.get("s", "k")
+        assert state.compare_and_set("s", "k", version, None) is True
+        assert state.get("s", "k") == (None, 0)
+
+    def test_scopes_are_separate(self):
+        state.compare_and_set("a", "k", 0, 1)
+        assert state.get("b", "k") == (None, 0)
+
+
+class TestUpdate:
+    def test_in_place_mutation_is_written(self):
+        state.compare_and_set("s", "k", 0, {"n": 1})
+
+        def bump(value):
+            value["n"] += 1
+            return value, value["n"]
+
+        assert state.update("s", "k", bump) == 2
+        assert state.get("s", "k")[0] == {"n": 2}
+
+    def test_unchanged_value_keeps_version(self):
+        state.compare_and_set("s", "k", 0, {"n": 1})
+        _, version = state.get("s", "k")
+        state.update("s", "k", lambda value: (value, None))
+        assert state.get("s", "k")[1] == version
+
+    def test_exception_rolls_back(self):
+        state.compare_and_set("s", "k", 0, {"n": 1})
+
+        def broken(value):
+            value["n"] = 99
+            raise RuntimeError
+
+        with pytest.raises(RuntimeError):
+            state.update("s", "k", broken)
+        assert state.get("s", "k")[0] == {"n": 1}
+
+
+class TestClaim:
+    def test_second_claim_with_same_value_fails(self):
+        assert state.claim("last-sent", "sess", "sess:1.000") is True
+        assert state.claim("last-sent", "sess", "sess:1.000") is False
+        assert state.claim("last-sent", "sess", "sess:2.000") is True
+
+    def test_concurrent_claims_only_one_wins(self, db_path):
+        """同時に発火した複数プロセスのうち、1つだけが claim に成功する。"""
+        ctx = multiprocessing.get_context("fork")
+        results = ctx.Queue()
+        procs = [ctx.Process(target=_claim_in_child, args=(str(db_path), results)) for _ in range(6)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(10)
+        assert sorted(results.get(timeout=5) for _ in procs) == [False] * 5 + [True]
+
+
+class TestLease:
+    def test_waits_until_released(self):
+        state.update("lease:progress", "sess", lambda _: ({"owner": "other", "expires_at": time.time() + 60}, None))
+        waits: list[float] = []
+
+        def fake_sleep(seconds: float) -> None:
+            waits.append(seconds)
+            if len(waits) == 2:
+                state.compare_and_set("lease:progress", "sess", state.get("lease:progress", "sess")[1], None)
+
+        with state.lease("progress", "sess", sleep=fake_sleep):
+            assert state.get("lease:progress", "sess")[0]["pid"] == os.getpid()
+        assert len(waits) == 2
+        assert state.get("lease:progress", "sess") == (None, 0)
+
+    def test_expired_lease_is_taken_over(self):
+        state.update("lease:progress", "sess", lambda _: ({"owner": "dead", "expires_at": time.time() - 1}, None))
+
+        def no_sleep(seconds: float) -> None:
+            raise AssertionError("should not wait")
+
+        with state.lease("progress", "sess", sleep=no_sleep):
+            assert state.get("lease:progress", "sess")[0]["owner"] != "dead"
+
+    def test_released_on_exception(self):
+        with pytest.raises(RuntimeError):
+            with state.lease("progress", "sess"):
+                raise RuntimeError
+        assert state.get("lease:progress", "sess") == (None, 0)
+
+    def test_renewed_while_held_beyond_ttl(self):
+        """占有中は期限が延長され、ttl を超えて保持しても期限切れにならない。"""
+        with state.lease("progress", "sess", ttl=0.3, renew_interval=0.05):
+            time.sleep(0.6)
+            assert state.get("lease:progress", "sess")[0]["expires_at"] > time.time()
+
+    def test_write_only_while_held(self):
+        with state.lease("progress", "sess") as held:
+            assert held.write({"hash": "a"})
+            assert state.get("progress", "sess")[0] == {"hash": "a"}
+            # 期限切れで他のプロセスが占有した
+            state.update("lease:progress", "sess", lambda _: ({"owner": "other", "expires_at": time.time() + 60}, None))
+            assert not held.write({"hash": "b"})
+            assert not held.renew()
+        assert state.get("progress", "sess")[0] == {"hash": "a"}
+        # 他のプロセスの占有は解放しない
+        assert state.get("lease:progress", "sess")[0]["owner"] == "other"
+
+
+class TestPruneAndFork:
+    def test_prune_removes_stale_rows(self):
+        state.compare_and_set("s", "old", 0, 1)
+        state.compare_and_set("s", "new", 0, 1)
+        state._connect().execute("UPDATE state SET updated_at = 0 WHERE key = 'old'")
+        assert state.prune() == 1
+        assert state.get("s", "old") == (None, 0)
+        assert state.get("s", "new")[0] == 1
+
+    def test_forked_child_opens_own_connection(self, db_path):
+        parent_conn = state._connect()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = 0 if state._connect() is not parent_conn and state.claim("s", "child", 1) else 1
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert state._connect() is parent_conn
+        assert state.get("s", "child")[0] == 1
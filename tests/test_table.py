@@ -1,14 +1,17 @@
 """tests/test_table.py — Markdown テーブル変換のテスト"""
 from __future__ import annotations
 
+import random
+import re
 import sys
+import time
 from pathlib import Path
 
 import pytest
 
 sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
 
-from lib.table import parse_markdown_table, convert_tables_in_text  # noqa: E402
+from lib.table import parse_markdown_table, convert_tables_in_text, render_simple_table  # noqa: E402
 
 
 class TestParseMarkdownTable:
@@ -231,3 +234,127 @@ class TestConvertTablesInText:
         assert "```" in result
         assert "田中" in result
         assert "| --- |" not in result
+
+    def test_unclosed_fence_does_not_suppress_conversion(self):
+        """閉じマーカーのない ``` の後ろのテーブルは変換する"""
+        text = (
+            "```python\n"
+            "print(1)\n"
+            "| A | B |\n"
+            "| --- | --- |\n"
+            "| 1 | 2 |\n"
+        )
+        result = convert_tables_in_text(text)
+        assert result.startswith("```python\nprint(1)\n```\n")
+        assert "| A | B |" not in result
+
+    def test_fence_marker_must_match(self):
+        """``` で始まったコードブロックは ~~~ では閉じない"""
+        text = (
+            "```\n"
+            "~~~\n"
+            "| A | B |\n"
+            "| --- | --- |\n"
+            "| 1 | 2 |\n"
+            "```\n"
+        )
+        assert convert_tables_in_text(text) == text
+
+    def test_many_unclosed_fences_linear_time(self):
+        """未閉じの開始行が大量にあっても入力長に比例した時間で変換できる"""
+        table = "| A | B |\n| --- | --- |\n| 1 | 2 |\n"
+        text = (table + "```x\n" * 50000) * 2
+        start = time.monotonic()
+        result = convert_tables_in_text(text)
+        assert time.monotonic() - start < 5
+        assert "| A | B |" not in result
+        assert result.count("```x\n") == 100000
+
+
+class TestRenderSimpleTable:
+    """render_simple_table のテスト（tabulate "simple" 互換）"""
+
+    def test_numeric_column_right_aligned(self):
+        result = render_simple_table(["Name", "Score"], [["Alice", "100"], ["Bob", "85"]])
+        assert result == (
+            "Name      Score\n"
+            "------  -------\n"
+            "Alice       100\n"
+            "Bob          85"
+        )
+
+    def test_decimal_alignment(self):
+        """小数点位置で揃え、float は %g 形式に正規化される"""
+        result = render_simple_table(["v"], [["1.5"], ["10"], ["2.25"], ["1,000.0"]])
+        assert result.splitlines()[2:] == ["   1.5", "  10", "   2.25", "1000"]
+
+    def test_east_asian_width(self):
+        """全角文字は幅 2 として列幅を計算する"""
+        result = render_simple_table(["名前", "役職"], [["田中", "Manager"]])
+        assert result == (
+            "名前    役職\n"
+            "------  -------\n"
+            "田中    Manager"
+        )
+
+
+# 単一パス化以前の正規表現による実装（出力互換性の検証用）
+_REF_TABLE_RE = re.compile(
+    r"(?m)"
+    r"^(\|.+\|)[ \t]*\n"
+    r"^(\|[ \t]*:?-{3,}:?[ \t]*(?:\|[ \t]*:?-{3,}:?[ \t]*)*\|)[ \t]*\n"
+    r"((?:^\|.+\|[ \t]*\n?)+)",
+)
+_REF_FENCE_RE = re.compile(r"(?m)^[ \t]*(```|~~~)[^\n]*\n[\s\S]*?^[ \t]*\1[ \t]*$")
+
+
+def _reference_convert(text: str) -> str:
+    fenced = [(m.start(), m.end()) for m in _REF_FENCE_RE.finditer(text)]
+
+    def _replace(m: re.Match) -> str:
+        if any(fs <= m.start() and m.end() <= fe for fs, fe in fenced):
+            return m.group(0)
+        parsed = parse_markdown_table(m.group(0))
+        if parsed is None:
+            return m.group(0)
+        return f"```\n{render_simple_table(*parsed)}\n```"
+
+    return _REF_TABLE_RE.sub(_replace, text)
+
+
+class TestScannerParity:
+    """行単位の走査が正規表現による実装と同じ出力を返すこと"""
+
+    _LINES = [
+        "| a | b |", "|---|---|", "| :---: | ---: |", "| 1 | 2 |", "| 1 | 2 | tail", "|x|", "||",
+        "|||", "```", "```py", "~~~", " ```", "  ~~~ ", "````", "| 3.5 | foo |", "text", "",
+        "| a |\r", "|---|", "\t```", "| a | b |  ", "| --- |", " | a |", "| 田中 | 1 |", "|-|",
+    ]
+
+    def test_random_documents_match_reference(self):
+        rng = random.Random(0)
+        for _ in range(20000):
+            text = "\n".join(rng.choice(self._LINES) for _ in range(rng.randint(0, 14)))
+            if rng.random() < 0.5:
+                text += "\n"
+            assert convert_tables_in_text(text) == _reference_convert(text), text
+
+
+class TestTabulateParity:
+    """tabulate がインストールされている環境では出力が完全一致すること"""
+
+    _POOL = [
+        "1", "-2", "3.5", "1,234", "1,234.56", "1e5", "0.000012345", "123456789", "True", "False",
+        "", "inf", "nan", "Infinity", "1_000", "１２", "abc", "名前", "スコア", "ｶﾀｶﾅ", "✔️",
+        "⚠️ 注意", "👍🏽", "👨‍👩‍👧", "é", "#️⃣", "x y", "-", ".5", "+7", "007", "2.50", "한국어", "①",
+    ]
+
+    def test_random_tables_match_tabulate(self):
+        tabulate = pytest.importorskip("tabulate").tabulate
+        rng = random.Random(0)
+        for _ in range(2000):
+            ncols, nrows = rng.randint(1, 4), rng.randint(1, 5)
+            headers = [rng.choice(self._POOL + ["Name", "値"]) for _ in range(ncols)]
+            rows = [[rng.choice(self._POOL) for _ in range(ncols)] for _ in range(nrows)]
+            expected = tabulate(rows, headers=headers, tablefmt="simple")
+            assert render_simple_table(headers, rows) == expected, (headers, rows)
@@ -0,0 +1,128 @@
+"""tests/test_trace.py — hook 実行の区間計測（lib/trace）のテスト"""
+from __future__ import annotations
+
+import io
+import json
+import os
+import sys
+import unittest.mock as mock
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+import notify  # noqa: E402
+from lib import trace  # noqa: E402
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    env = {trace.ENV_TRACE: "1", trace.ENV_TRACE_FILE: str(path)}
+    with mock.patch.dict(os.environ, env):
+        yield path
+    trace._current = None
+
+
+def _records(path: Path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+class TestTraced:
+    def test_disabled_writes_nothing(self, tmp_path):
+        path = tmp_path / "trace.jsonl"
+
+        @trace.traced("hook")
+        def main() -> int:
+            trace.mark("phase")
+            trace.add("requests")
+            return 42
+
+        with mock.patch.dict(os.environ, {trace.ENV_TRACE_FILE: str(path)}):
+            os.environ.pop(trace.ENV_TRACE, None)
+            assert main() == 42
+        assert not path.exists()
+        assert trace._current is None
+
+    def test_record_fields(self, trace_file):
+        @trace.traced("stop")
+        def main() -> None:
+            trace.mark("input")
+            trace.tag(channel_id="chan-1")
+            trace.add("bytes_out", 10)
+            trace.add("bytes_out", 5)
+            trace.mark("send")
+            trace.mark("send")
+
+        main()
+        (record,) = _records(trace_file)
+        assert record["hook"] == "stop"
+        assert record["exit"] == 0
+        assert record["pid"] == os.getpid()
+        assert record["channel_id"] == "chan-1"
+        assert record["counters"] == {"bytes_out": 15}
+        assert list(record["phases"]) == ["input", "send", "rest"]
+        assert record["total_ms"] >= sum(record["phases"].values()) - 0.5
+        if Path("/proc/self/stat").exists():
+            assert record["startup_ms"] > 0
+
+    def test_exit_code_and_exception(self, trace_file):
+        @trace.traced("a")
+        def exits() -> None:
+            sys.exit(2)
+
+        @trace.traced("b")
+        def raises() -> None:
+            raise KeyError("x")
+
+        with pytest.raises(SystemExit):
+            exits()
+        with pytest.raises(KeyError):
+            raises()
+        assert [(r["hook"], r["exit"]) for r in _records(trace_file)] == [("a", 2), ("b", "KeyError")]
+
+    def test_nested_invocation_restores_outer(self, trace_file):
+        @trace.traced("inner")
+        def inner() -> None:
+            trace.mark("work")
+
+        @trace.traced("outer")
+        def outer() -> None:
+            trace.mark("before")
+            inner()
+            trace.mark("after")
+
+        outer()
+        inner_rec, outer_rec = _records(trace_file)
+        assert inner_rec["hook"] == "inner"
+        assert outer_rec["hook"] == "outer"
+        assert list(outer_rec["phases"]) == ["before", "after", "rest"]
+
+    def test_unwritable_trace_file_is_ignored(self, tmp_path):
+        blocker = tmp_path / "file"
+        blocker.write_text("")
+
+        @trace.traced("hook")
+        def main() -> str:
+            return "ok"
+
+        env = {trace.ENV_TRACE: "1", trace.ENV_TRACE_FILE: str(blocker / "trace.jsonl")}
+        with mock.patch.dict(os.environ, env):
+            assert main() == "ok"
+
+
+class TestHookIntegration:
+    def test_notify_phases(self, trace_file):
+        hook_input = {"message": "hi", "notification_type": "permission_prompt", "cwd": "/tmp/p", "session_id": "s-1"}
+        with mock.patch("sys.stdin", io.StringIO(json.dumps(hook_input))), \
+             mock.patch("notify.load_config", return_value={"schemaVersion": 2, "servers": []}), \
+             mock.patch("notify.resolve_channel", return_value=("chan-001", "tok", "p", [])), \
+             mock.patch("notify.resolve_target_channel", return_value="chan-001"), \
+             mock.patch("notify.post_message"):
+            notify.main()
+        (record,) = _records(trace_file)
+        assert record["hook"] == "notify"
+        assert record["session_id"] == "s-1"
+        assert record["channel_id"] == "chan-001"
+        assert list(record["phases"]) == ["input", "config", "send", "rest"]
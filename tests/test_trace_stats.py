@@ -0,0 +1,112 @@
+"""tests/test_trace_stats.py — hook トレースの集計（trace_stats）のテスト"""
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "hooks"))
+
+import trace_stats  # noqa: E402
+
+
+def _record(hook: str = "stop", total_ms: float = 10.0, **extra) -> dict:
+    record = {
+        "ts": 1000.0, "hook": hook, "pid": 1, "exit": 0, "startup_ms": 40.0,
+        "total_ms": total_ms, "phases": {"send": total_ms - 1}, "counters": {},
+    }
+    record.update(extra)
+    return record
+
+
+def _write(path: Path, records: list, extra_lines: tuple[str, ...] = ()) -> str:
+    lines = [json.dumps(r) for r in records] + list(extra_lines)
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+class TestSamples:
+    def test_nearest_rank_quantiles(self):
+        samples = trace_stats.Samples()
+        for ms in range(100, 0, -1):
+            samples.add(float(ms))
+        assert samples.quantiles() == {0.5: 50.0, 0.95: 95.0, 0.99: 99.0}
+
+    def test_single_and_empty(self):
+        samples = trace_stats.Samples()
+        assert samples.quantiles() == {}
+        samples.add(7.0)
+        assert samples.quantiles() == {0.5: 7.0, 0.95: 7.0, 0.99: 7.0}
+
+
+class TestSummarize:
+    def test_groups_by_hook_phase_and_channel(self, tmp_path):
+        path = _write(tmp_path / "trace.jsonl", [
+            _record(total_ms=10, channel_id="c1", counters={"requests": 2, "bytes_out": 300, "http_429": 1}),
+            _record(total_ms=30, channel_id="c2", counters={"requests": 1, "bytes_out": 100}),
+            _record(total_ms=20, channel_id="c1", exit=1),
+            _record(hook="notify", total_ms=5),
+        ])
+        summary = trace_stats.summarize([path])
+        stop = summary.hooks["stop"]
+        assert stop.total.quantiles()[0.5] == 20
+        assert stop.errors == 1
+        assert stop.counters == {"requests": 3, "bytes_out": 400, "http_429": 1}
+        assert stop.phases["send"].count == 3
+        assert stop.channels["c1"].values == [10, 20]
+        assert summary.hooks["notify"].total.count == 1
+
+    def test_filters_and_malformed_lines(self, tmp_path):
+        path = _write(
+            tmp_path / "trace.jsonl",
+            [_record(ts=100.0), _record(ts=2000.0), _record(hook="notify", ts=2000.0), {"hook": "stop", "ts": 2000.0}],
+            extra_lines=("{broken", "[1, 2]", ""),
+        )
+        summary = trace_stats.summarize([path, str(tmp_path / "missing.jsonl")], since=1000.0, hook="stop")
+        assert list(summary.hooks) == ["stop"]
+        assert summary.hooks["stop"].total.count == 1
+        assert summary.skipped == 3
+
+    def test_parse_duration(self):
+        assert trace_stats.parse_duration("30m") == 1800
+        assert trace_stats.parse_duration("1.5h") == 5400
+        with pytest.raises(Exception):
+            trace_stats.parse_duration("3 weeks")
+
+
+class TestOutput:
+    def test_prometheus_format(self, tmp_path):
+        path = _write(tmp_path / "trace.jsonl", [
+            _record(total_ms=250, channel_id='a"b', counters={"http_429": 2, "bytes_out": 10}),
+        ])
+        text = trace_stats.to_prometheus(trace_stats.summarize([path]))
+        assert "# TYPE discord_bridge_hook_duration_seconds summary" in text
+        assert 'discord_bridge_hook_duration_seconds{hook="stop",quantile="0.99"} 0.250000' in text
+        assert 'discord_bridge_hook_duration_seconds_count{hook="stop"} 1' in text
+        assert 'discord_bridge_hook_phase_duration_seconds_sum{hook="stop",phase="send"} 0.249000' in text
+        assert 'discord_bridge_channel_duration_seconds_count{hook="stop",channel_id="a\\"b"} 1' in text
+        assert 'discord_bridge_hook_http_429{hook="stop"} 2' in text
+        assert 'discord_bridge_hook_upload_bytes{hook="stop"} 10' in text
+        assert text.endswith("discord_bridge_trace_skipped_lines 0\n")
+
+    def test_main_writes_prom_and_json(self, tmp_path, capsys):
+        path = _write(tmp_path / "trace.jsonl", [_record(), _record(hook="notify")])
+        prom = tmp_path / "discord_bridge.prom"
+        trace_stats.main([path, "--prom", str(prom), "--json"])
+        assert "discord_bridge_hook_duration_seconds" in prom.read_text()
+        assert list(tmp_path.glob("*.tmp")) == []
+        out = json.loads(capsys.readouterr().out)
+        assert out["hooks"]["stop"]["total_ms"] == {"count": 1, "p50": 10.0, "p95": 10.0, "p99": 10.0}
+
+    def test_main_text(self, tmp_path, capsys):
+        path = _write(tmp_path / "trace.jsonl", [_record(channel_id="c1", counters={"requests": 1})])
+        trace_stats.main([path])
+        out = capsys.readouterr().out
+        assert "stop: 1 invocations, 0 errors, 1 requests" in out
+        assert "#c1" in out
+
+    def test_main_empty(self, tmp_path, capsys):
+        trace_stats.main([str(tmp_path / "none.jsonl")])
+        assert "No trace records." in capsys.readouterr().out
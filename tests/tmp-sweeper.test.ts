@@ -0,0 +1,93 @@
+import { describe, test, expect, beforeEach, afterEach } from 'vitest';
+import { mkdirSync, rmSync, writeFileSync, utimesSync, existsSync } from 'node:fs';
+import { join } from 'node:path';
+import { tmpdir } from 'node:os';
+import { sweepTmpFiles, formatSweepResult } from '../src/tmp-sweeper.js';
+
+const TMP_DIR = join(tmpdir(), 'discord-bridge-sweeper-test');
+const NOW = Date.parse('2026-03-01T00:00:00Z');
+const HOUR = 60 * 60 * 1000;
+
+function touch(name: string, ageMs: number, data = 'x'): string {
+  const path = join(TMP_DIR, name);
+  writeFileSync(path, data);
+  const mtime = new Date(NOW - ageMs);
+  utimesSync(path, mtime, mtime);
+  return path;
+}
+
+beforeEach(() => {
+  mkdirSync(TMP_DIR, { recursive: true });
+});
+
+afterEach(() => {
+  rmSync(TMP_DIR, { recursive: true, force: true });
+});
+
+describe('sweepTmpFiles', () => {
+  test('期限切れのファイルを削除し、件数とバイト数を返す', async () => {
+    const old = touch('discord-bridge-order-111.json', 25 * HOUR, '0123456789');
+    const fresh = touch('discord-bridge-order-222.json', 1 * HOUR);
+
+    const result = await sweepTmpFiles({ dir: TMP_DIR, now: NOW });
+
+    expect(result).toEqual({ files: 1, bytes: 10 });
+    expect(existsSync(old)).toBe(false);
+    expect(existsSync(fresh)).toBe(true);
+  });
+
+  test('セッションのいずれかのファイルが新しければ、そのセッションのファイルは残す', async () => {
+    const oldTranscript = touch('discord-bridge-transcript-sess-a.json', 48 * HOUR);
+    const freshContext = touch('discord-bridge-context-sess-a.json', 1 * HOUR);
+    const deadSession = touch('discord-bridge-transcript-sess-b.json', 48 * HOUR);
+    const legacy = touch('discord-bridge-last-sent-sess-b.txt', 48 * HOUR);
+
+    const result = await sweepTmpFiles({ dir: TMP_DIR, now: NOW });
+
+    expect(result.files).toBe(2);
+    expect(existsSync(oldTranscript)).toBe(true);
+    expect(existsSync(freshContext)).toBe(true);
+    expect(existsSync(deadSession)).toBe(false);
+    expect(existsSync(legacy)).toBe(false);
+  });
+
+  test('稼働中の Bot のチャンネルのスレッド追跡ファイルは残す', async () => {
+    const live = touch('discord-bridge-thread-111.json', 30 * 24 * HOUR);
+    const gone = touch('discord-bridge-thread-999.json', 30 * 24 * HOUR);
+
+    await sweepTmpFiles({ dir: TMP_DIR, now: NOW, keepChannelIds: new Set(['111']) });
+
+    expect(existsSync(live)).toBe(true);
+    expect(existsSync(gone)).toBe(false);
+  });
+
+  test('対象外のファイルと一時ファイルの扱い', async () => {
+    const unrelated = touch('discord-bridge-debug.txt', 30 * 24 * HOUR);
+    const ratelimit = touch('discord-bridge-ratelimit.json', 30 * 24 * HOUR);
+    const fakeRatelimit = touch('discord-bridge-ratelimit-0123abcd4567.json', 30 * 24 * HOUR);
+    const other = touch('something-else.json', 30 * 24 * HOUR);
+    const tmp = touch('discord-bridge-thread-111.json.4242.tmp', 2 * HOUR);
+
+    const result = await sweepTmpFiles({ dir: TMP_DIR, now: NOW });
+
+    expect(result.files).toBe(2);
+    expect(existsSync(unrelated)).toBe(true);
+    expect(existsSync(ratelimit)).toBe(true);
+    expect(existsSync(fakeRatelimit)).toBe(false);
+    expect(existsSync(other)).toBe(true);
+    expect(existsSync(tmp)).toBe(false);
+  });
+
+  test('ディレクトリがなければ何もしない', async () => {
+    const result = await sweepTmpFiles({ dir: join(TMP_DIR, 'missing'), now: NOW });
+    expect(result).toEqual({ files: 0, bytes: 0 });
+  });
+});
+
+describe('formatSweepResult', () => {
+  test('件数と KB を表示する', () => {
+    expect(formatSweepResult({ files: 3, bytes: 2048 })).toBe(
+      '[discord-bridge] Swept 3 stale /tmp file(s), reclaimed 2.0 KB',
+    );
+  });
+});